@@ -1,19 +1,62 @@
 import os
 import uuid
 import traceback
-from flask import request, jsonify, render_template, current_app
+from flask import request, jsonify, render_template, current_app, Response
 from werkzeug.utils import secure_filename
 from app.api import bp
 from app.core.config import Config
+from app.core.metrics import REGISTRY, UPLOAD_BYTES_TOTAL, UPLOAD_SECONDS
 from app import socketio
 from app.services.queue_manager import queue_manager, VALID_MODELS
 from app.services.persistent_storage import persistent_storage
+from app.services.result_cache import result_cache
+from app.services.transcription import VALID_LANGUAGES, VALID_TASKS
+from app.services.engines import resolve_engine, model_key
+from app.services.audio import PCM_EXTENSION
+from app.services.uploads import (
+    save_stream, ingest_stream, hash_file, resolve_import_path, IngestError,
+    resumable_uploads, UploadError, UploadNotFound, UploadAlreadyFinalized, ChunkIntegrityError
+)
 
 @bp.route('/')
 def index():
-    queue_data = persistent_storage.get_queue()
-    results_data = persistent_storage.get_results()
-    return render_template('index.html', queue_data=queue_data, results_data=results_data)
+    # The queue and results are fetched page by page from /queue and /results once the page has loaded
+    return render_template('index.html')
+
+@bp.route('/healthz')
+def healthz():
+    """Liveness check for load balancers and the container healthcheck; never touches storage"""
+    workers_alive = sum(thread.is_alive() for thread in queue_manager.worker_threads)
+    healthy = not (queue_manager.is_running and queue_manager.run_workers) or workers_alive > 0
+    return jsonify({'status': 'ok' if healthy else 'degraded', 'workers': workers_alive}), 200 if healthy else 503
+
+@bp.route('/results')
+def list_results():
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+        before = request.args.get('before', type=int)
+        since = request.args.get('since', type=float)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    page = persistent_storage.list_results(request.args.get('session_id') or None, before, since, limit)
+    return jsonify(page)
+
+@bp.route('/queue')
+def list_queue():
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+        after = request.args.get('after', type=int)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    page = persistent_storage.list_queue(request.args.get('session_id') or None, after, limit)
+    return jsonify(page)
+
+@bp.route('/results/<queue_id>')
+def get_result(queue_id):
+    result = persistent_storage.get_result(queue_id)
+    if result is None:
+        return jsonify({'error': f'Unknown result: {queue_id}'}), 404
+    return jsonify({'queue_id': queue_id, 'text': result})
 
 @bp.route('/clear-queue', methods=['POST'])
 def clear_queue():
@@ -30,57 +73,128 @@ def clear_queue():
         current_app.logger.error(f"Traceback: {traceback.format_exc()}")
         return jsonify({'error': str(e)}), 500
 
+@bp.route('/queue/<queue_id>/cancel', methods=['POST'])
+def cancel_task(queue_id):
+    data = request.get_json(silent=True) or {}
+    session_id = request.form.get('session_id') or data.get('session_id')
+    if not session_id:
+        return jsonify({'error': 'No session ID provided'}), 400
+
+    status = queue_manager.cancel_task(queue_id, session_id)
+    if status is None:
+        return jsonify({'error': f'Unknown task: {queue_id}'}), 404
+    return jsonify({'status': status, 'queue_id': queue_id})
+
+@bp.route('/stats')
+def stats():
+    return jsonify(queue_manager.get_stats())
+
+@bp.route('/metrics')
+def metrics():
+    """Prometheus text exposition of this process's metrics"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+def _parse_upload_options(params, require_queue_id: bool = True):
+    """Read and validate the task options of an upload, returning (options, error response)"""
+    options = {
+        'session_id': params.get('session_id'),
+        'model_name': params.get('model', 'base'),
+        'queue_id': params.get('queue_id'),
+        'language': params.get('language', 'en'),
+        'whisper_task': params.get('task', 'transcribe'),
+        'engine': params.get('engine') or None
+    }
+
+    if not options['session_id']:
+        return options, (jsonify({'error': 'No session ID provided'}), 400)
+        
+    if require_queue_id and not options['queue_id']:
+        return options, (jsonify({'error': 'No queue ID provided'}), 400)
+        
+    if options['model_name'] not in VALID_MODELS:
+        return options, (jsonify({'error': f'Invalid model name. Must be one of: {", ".join(VALID_MODELS)}'}), 400)
+
+    if options['language'] not in VALID_LANGUAGES:
+        return options, (jsonify({'error': f'Invalid language: {options["language"]}'}), 400)
+
+    if options['whisper_task'] not in VALID_TASKS:
+        return options, (jsonify({'error': f'Invalid task. Must be one of: {", ".join(sorted(VALID_TASKS))}'}), 400)
+
+    try:
+        options['engine'] = resolve_engine(options['model_name'], options['engine'])
+    except ValueError as e:
+        return options, (jsonify({'error': str(e)}), 400)
+
+    return options, None
+
+def _cached_result(content_hash: str, options):
+    """Result cache lookup for an upload; transcripts are cached per model and engine"""
+    # Resumable uploads started before engines existed carry no engine option
+    engine = resolve_engine(options['model_name'], options.get('engine'))
+    return result_cache.get(
+        content_hash, model_key(options['model_name'], engine), options['language'], options['whisper_task']
+    )
+
+def _upload_path(filename: str, suffix: str = '') -> str:
+    """Unique path in the upload directory for a client-supplied filename"""
+    upload_dir = current_app.config['UPLOAD_FOLDER']
+    os.makedirs(upload_dir, exist_ok=True)
+    filename = secure_filename(filename)
+    return os.path.join(upload_dir, f"{uuid.uuid4()}_{filename.replace(' ', '_')}{suffix}")
+
+def _enqueue_upload(filepath: str, content_hash: str, options):
+    """Queue a stored upload, or answer straight from the result cache for identical content"""
+    session_id = options['session_id']
+    queue_id = options['queue_id']
+
+    cached = _cached_result(content_hash, options)
+    if cached is not None:
+        current_app.logger.info(f"Result cache hit for {queue_id}")
+        os.remove(filepath)
+        queue_manager.complete_cached(session_id, queue_id, cached, options['model_name'])
+        return jsonify({
+            'message': 'Identical file already transcribed, returning cached result',
+            'status': 'completed',
+            'cached': True,
+            'queue_id': queue_id,
+            'text': cached
+        })
+    
+    # Add to processing queue with selected model
+    queue_manager.add_task(
+        filepath, session_id, options['model_name'], queue_id,
+        language=options['language'], whisper_task=options['whisper_task'], content_hash=content_hash,
+        engine=options.get('engine')
+    )
+    
+    return jsonify({
+        'message': 'File uploaded successfully, added to processing queue',
+        'status': 'success',
+        'queue_id': queue_id
+    })
+
 @bp.route('/upload', methods=['POST'])
 def upload_file():
     try:
-        current_app.logger.info(f"Upload request received. Files: {request.files}")
-        current_app.logger.info(f"Form data: {request.form}")
-        
         if 'file' not in request.files:
             return jsonify({'error': 'No file provided'}), 400
             
         file = request.files['file']
-        session_id = request.form.get('session_id')
-        model_name = request.form.get('model', 'base')
-        queue_id = request.form.get('queue_id')
-        
-        if not session_id:
-            return jsonify({'error': 'No session ID provided'}), 400
-            
-        if not queue_id:
-            return jsonify({'error': 'No queue ID provided'}), 400
-            
-        if model_name not in VALID_MODELS:
-            return jsonify({'error': f'Invalid model name. Must be one of: {", ".join(VALID_MODELS)}'}), 400
+        options, error = _parse_upload_options(request.form)
+        if error:
+            return error
             
-        current_app.logger.info(f"File received: {file.filename}")
-        
         if not Config.allowed_file(file.filename):
             current_app.logger.warning(f"Invalid file type: {file.filename}")
             return jsonify({'error': 'Invalid file type'}), 400
             
-        # Ensure upload directory exists
-        upload_dir = current_app.config['UPLOAD_FOLDER']
-        current_app.logger.info(f"Upload directory confirmed: {upload_dir}")
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        # Generate unique filename
-        filename = secure_filename(file.filename)
-        unique_filename = f"{uuid.uuid4()}_{filename.replace(' ', '_')}"
-        filepath = os.path.join(upload_dir, unique_filename)
-        
-        current_app.logger.info(f"Saving file to: {filepath}")
-        file.save(filepath)
-        current_app.logger.info("File saved successfully")
-        
-        # Add to processing queue with selected model
-        queue_manager.add_task(filepath, session_id, model_name, queue_id)
-        
-        return jsonify({
-            'message': 'File uploaded successfully, added to processing queue',
-            'status': 'success',
-            'queue_id': queue_id
-        })
+        filepath = _upload_path(file.filename)
+        current_app.logger.debug(f"Saving upload {file.filename} to {filepath}")
+        with UPLOAD_SECONDS.labels('upload').time():
+            content_hash = save_stream(file.stream, filepath)
+        UPLOAD_BYTES_TOTAL.labels('upload').inc(os.path.getsize(filepath))
+
+        return _enqueue_upload(filepath, content_hash, options)
         
     except Exception as e:
         current_app.logger.error(f"Upload error: {str(e)}")
@@ -88,9 +202,231 @@ def upload_file():
         return jsonify({
             'error': str(e),
             'status': 'error',
-            'queue_id': queue_id if 'queue_id' in locals() else None
+            'queue_id': request.form.get('queue_id')
         }), 500
 
+@bp.route('/upload/stream', methods=['POST'])
+def upload_stream():
+    """Raw-body upload decoded to PCM by ffmpeg while the bytes arrive.
+
+    The media file is the request body; filename and task options are passed
+    as query parameters.
+    """
+    queue_id = request.args.get('queue_id')
+    try:
+        filename = request.args.get('filename', '')
+        options, error = _parse_upload_options(request.args)
+        if error:
+            return error
+
+        if not Config.allowed_file(filename):
+            current_app.logger.warning(f"Invalid file type: {filename}")
+            return jsonify({'error': 'Invalid file type'}), 400
+
+        pcm_path = _upload_path(filename, PCM_EXTENSION)
+        current_app.logger.debug(f"Streaming {filename} into {pcm_path}")
+        with UPLOAD_SECONDS.labels('stream').time():
+            content_hash = ingest_stream(request.stream, pcm_path, filename, ffmpeg=Config.FFMPEG_BINARY)
+        UPLOAD_BYTES_TOTAL.labels('stream').inc(request.content_length or 0)
+
+        return _enqueue_upload(pcm_path, content_hash, options)
+
+    except IngestError as e:
+        current_app.logger.warning(f"Stream ingest error: {str(e)}")
+        return jsonify({'error': str(e), 'status': 'error', 'queue_id': queue_id}), 400
+    except Exception as e:
+        current_app.logger.error(f"Upload error: {str(e)}")
+        current_app.logger.error(f"Traceback: {traceback.format_exc()}")
+        return jsonify({'error': str(e), 'status': 'error', 'queue_id': queue_id}), 500
+
+@bp.route('/uploads', methods=['POST'])
+def create_upload():
+    """Start a resumable chunked upload"""
+    data = request.get_json(silent=True) or {}
+    try:
+        options, error = _parse_upload_options(data)
+        if error:
+            return error
+
+        filename = data.get('filename', '')
+        if not Config.allowed_file(filename):
+            return jsonify({'error': 'Invalid file type'}), 400
+
+        upload = resumable_uploads.create(_upload_path(filename), filename, int(data.get('size', 0)), options)
+        return jsonify({'upload_id': upload['upload_id'], 'chunk_size': upload['chunk_size']}), 201
+
+    except (UploadError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Upload init error: {str(e)}")
+        current_app.logger.error(f"Traceback: {traceback.format_exc()}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    try:
+        return jsonify(resumable_uploads.status(upload_id))
+    except UploadNotFound as e:
+        return jsonify({'error': str(e)}), 404
+
+@bp.route('/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """Write one chunk; the byte offset is a query parameter, its SHA-256 an optional header"""
+    try:
+        offset = int(request.args.get('offset', ''))
+        with UPLOAD_SECONDS.labels('chunk').time():
+            data = request.get_data(cache=False)
+            resumable_uploads.write_chunk(upload_id, offset, data, request.headers.get('X-Chunk-SHA256'))
+        UPLOAD_BYTES_TOTAL.labels('chunk').inc(len(data))
+        return jsonify({'upload_id': upload_id, 'offset': offset, 'status': 'received'})
+
+    except UploadNotFound as e:
+        return jsonify({'error': str(e)}), 404
+    except ChunkIntegrityError as e:
+        return jsonify({'error': str(e)}), 422
+    except UploadAlreadyFinalized as e:
+        return jsonify({'error': str(e)}), 409
+    except (UploadError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Upload chunk error: {str(e)}")
+        current_app.logger.error(f"Traceback: {traceback.format_exc()}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_upload(upload_id):
+    """Assemble a completed chunked upload and queue it"""
+    try:
+        upload, content_hash = resumable_uploads.finalize(upload_id)
+        current_app.logger.info(f"Chunked upload {upload_id} complete: {upload['final_path']}")
+        return _enqueue_upload(upload['final_path'], content_hash, upload['options'])
+
+    except UploadNotFound as e:
+        return jsonify({'error': str(e)}), 404
+    except UploadAlreadyFinalized as e:
+        # A concurrent or repeated call; the first one queues the file under this ID
+        return jsonify({
+            'message': f"Upload already {e.upload['status']}",
+            'status': 'queued' if e.upload['status'] == 'finalized' else e.upload['status'],
+            'queue_id': e.upload['options']['queue_id']
+        }), 200 if e.upload['status'] == 'finalized' else 202
+    except UploadError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        current_app.logger.error(f"Upload finalize error: {str(e)}")
+        current_app.logger.error(f"Traceback: {traceback.format_exc()}")
+        return jsonify({'error': str(e), 'status': 'error'}), 500
+
+def _discard_batch(batch_id: str, paths):
+    """Undo a batch submission that failed before the batch was stored"""
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    if batch_id:
+        persistent_storage.release_batch(batch_id)
+
+@bp.route('/batch', methods=['POST'])
+def submit_batch():
+    """Queue many files in one request.
+
+    Accepts multipart ``files`` and/or ``paths`` naming files (or file:// URLs)
+    under BATCH_IMPORT_ROOT on the server. JSON bodies may pass ``paths`` as a list.
+    Members get the queue IDs ``<batch_id>-<n>``, imported paths numbered first.
+    """
+    # Undone if the submission fails before the batch is stored
+    reserved, saved = None, []
+    try:
+        if request.is_json:
+            params = request.get_json(silent=True) or {}
+            paths = params.get('paths') or []
+        else:
+            params = request.form
+            paths = request.form.getlist('paths')
+        files = request.files.getlist('files')
+
+        options, error = _parse_upload_options(params, require_queue_id=False)
+        if error:
+            return error
+        if not files and not paths:
+            return jsonify({'error': 'No files or paths provided'}), 400
+        if len(files) + len(paths) > Config.BATCH_MAX_FILES:
+            return jsonify({'error': f'At most {Config.BATCH_MAX_FILES} files per batch'}), 400
+
+        names = [file.filename for file in files] + [os.path.basename(path) for path in paths]
+        invalid = [name for name in names if not Config.allowed_file(name)]
+        if invalid:
+            return jsonify({'error': f'Invalid file type: {", ".join(invalid)}'}), 400
+
+        # Clients may pick the batch ID so they know the member queue IDs up front. It is
+        # reserved before anything is stored, so a reused ID cannot touch other results
+        batch_id = secure_filename(str(params.get('batch_id') or '')) or uuid.uuid4().hex
+        session_id = options['session_id']
+        if not persistent_storage.reserve_batch(batch_id, session_id, [f"{batch_id}-{i}" for i in range(len(names))]):
+            return jsonify({'error': f'Batch ID already in use: {batch_id}'}), 409
+        reserved = batch_id
+
+        # (file path, content hash, keep file) for every member of the batch
+        entries = []
+        for path in paths:
+            resolved = resolve_import_path(path, Config.BATCH_IMPORT_ROOT)
+            entries.append((resolved, hash_file(resolved), True))
+        for file in files:
+            filepath = _upload_path(file.filename)
+            saved.append(filepath)
+            entries.append((filepath, save_stream(file.stream, filepath), False))
+
+        members, tasks, cached_results = [], [], []
+        for i, (filepath, content_hash, keep_file) in enumerate(entries):
+            queue_id = f"{batch_id}-{i}"
+            name = os.path.basename(filepath)
+            cached = _cached_result(content_hash, options)
+            if cached is not None:
+                if not keep_file:
+                    os.remove(filepath)
+                    saved.remove(filepath)
+                cached_results.append((queue_id, cached))
+                members.append({'queue_id': queue_id, 'filename': name, 'status': 'completed'})
+                continue
+            tasks.append(queue_manager.build_task(
+                filepath, session_id, options['model_name'], queue_id,
+                language=options['language'], whisper_task=options['whisper_task'],
+                content_hash=content_hash, batch_id=batch_id, keep_file=keep_file, engine=options['engine']
+            ))
+            members.append({'queue_id': queue_id, 'filename': name, 'status': 'queued'})
+
+        queue_manager.add_batch(batch_id, session_id, tasks, [member['queue_id'] for member in members])
+        # The stored batch and its queued tasks now own the ID and the files
+        reserved, saved = None, []
+        # Only once the batch is stored, so a failed submission leaves no results behind
+        for queue_id, cached in cached_results:
+            queue_manager.complete_cached(session_id, queue_id, cached, options['model_name'])
+        current_app.logger.info(f"Batch {batch_id} submitted: {len(tasks)} queued, {len(members) - len(tasks)} cached")
+
+        return jsonify({
+            'batch_id': batch_id,
+            'status': 'success',
+            'tasks': members,
+            'progress': persistent_storage.get_batch_progress(batch_id)
+        }), 201
+
+    except UploadError as e:
+        _discard_batch(reserved, saved)
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        _discard_batch(reserved, saved)
+        current_app.logger.error(f"Batch error: {str(e)}")
+        current_app.logger.error(f"Traceback: {traceback.format_exc()}")
+        return jsonify({'error': str(e), 'status': 'error'}), 500
+
+@bp.route('/batch/<batch_id>')
+def batch_status(batch_id):
+    progress = persistent_storage.get_batch_progress(batch_id)
+    if progress is None:
+        return jsonify({'error': f'Unknown batch: {batch_id}'}), 404
+    return jsonify(progress)
+
 @socketio.on('connect')
 def handle_connect():
     current_app.logger.info(f"Client connected: {request.sid}")
@@ -0,0 +1,63 @@
+"""Asyncio serving mode: ``uvicorn app.asgi:app`` or ``python -m app.asgi``.
+
+Socket.IO connections are handled by python-socketio's AsyncServer on the
+event loop, so idle browsers cost a coroutine each instead of an OS thread.
+The Flask routes run unchanged through asgiref's WsgiToAsgi adapter, and
+the event names are the same as in the threaded server. Requires the
+optional ``uvicorn`` and ``asgiref`` packages.
+"""
+import asyncio
+import logging
+import os
+import socketio
+from app import create_app
+from app.core.config import Config
+from app.services import events
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError as e:
+    raise RuntimeError("The ASGI mode requires asgiref (pip install asgiref uvicorn)") from e
+
+logger = logging.getLogger(__name__)
+
+def _client_manager(config_class=Config):
+    if config_class.SOCKETIO_MESSAGE_QUEUE:
+        return socketio.AsyncRedisManager(config_class.SOCKETIO_MESSAGE_QUEUE)
+    return None
+
+sio = socketio.AsyncServer(
+    async_mode='asgi',
+    cors_allowed_origins='*',
+    client_manager=_client_manager()
+)
+
+@sio.event
+async def connect(sid, environ):
+    logger.info(f"Client connected: {sid}")
+    await sio.emit('response', {'data': 'Connected'}, to=sid)
+
+@sio.on('register_client')
+async def register_client(sid, data):
+    client_id = (data or {}).get('clientId')
+    if client_id:
+        logger.info(f"Registering client ID {client_id} for socket {sid}")
+        # Join the client's room using their persistent ID
+        await sio.enter_room(sid, client_id)
+
+def _use_async_server():
+    """Send service emits from worker threads through the AsyncServer's loop"""
+    events.use_emitter(events.AsyncServerEmitter(sio, asyncio.get_running_loop()))
+
+flask_app = create_app()
+app = socketio.ASGIApp(sio, other_asgi_app=WsgiToAsgi(flask_app), on_startup=_use_async_server)
+
+def main():
+    try:
+        import uvicorn
+    except ImportError as e:
+        raise RuntimeError("The ASGI mode requires uvicorn (pip install uvicorn)") from e
+    uvicorn.run(app, host=Config.HOST, port=Config.PORT, log_level=os.getenv('UVICORN_LOG_LEVEL', 'info'))
+
+if __name__ == '__main__':
+    main()
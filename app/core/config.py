@@ -4,6 +4,15 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
+def parse_key_values(value: str) -> dict:
+    """Parse a 'key=value,key=value' environment string into a dict"""
+    pairs = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            key, val = item.split('=', 1)
+            pairs[key.strip()] = val.strip()
+    return pairs
+
 class Config:
     # Flask
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-key-please-change-in-production')
@@ -18,9 +27,113 @@ class Config:
     UPLOAD_FOLDER = os.path.join(os.getcwd(), 'uploads')
     MAX_CONTENT_LENGTH = 500 * 1024 * 1024  # 500MB max file size
     ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'mp3', 'wav', 'm4a'}
+    FFMPEG_BINARY = os.getenv('FFMPEG_BINARY', 'ffmpeg')
+    FFPROBE_BINARY = os.getenv('FFPROBE_BINARY', 'ffprobe')
+    # Resumable chunked uploads
+    MAX_UPLOAD_SIZE = int(os.getenv('MAX_UPLOAD_SIZE', 2 * 1024 * 1024 * 1024))  # 2GB
+    UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))  # 8MB
+    UPLOAD_SESSION_TTL = float(os.getenv('UPLOAD_SESSION_TTL', 24 * 3600))  # seconds
+
+    # Storage
+    STORAGE_DIR = os.getenv('STORAGE_DIR', 'storage')
+    STORAGE_COMPACTION_INTERVAL = float(os.getenv('STORAGE_COMPACTION_INTERVAL', 3600))  # seconds, 0 disables
+
+    # Logging
+    LOG_DIR = os.getenv('LOG_DIR', 'logs')
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_LEVELS = os.getenv('LOG_LEVELS', '')  # per-logger overrides, e.g. "app.services.scheduler=DEBUG"
+    LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))  # rotate each log file at this size
+    LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))  # records beyond this are dropped, never waited on
+    LOG_SAMPLE_BURST = int(os.getenv('LOG_SAMPLE_BURST', 20))  # info/debug records per call site per interval, 0 disables
+    LOG_SAMPLE_INTERVAL = float(os.getenv('LOG_SAMPLE_INTERVAL', 60))  # seconds
 
     # Whisper
-    WHISPER_MODEL = "base"  # Can be tiny, base, small, medium, large
+    WHISPER_MODEL = os.getenv('WHISPER_MODEL', 'base')  # Can be tiny, base, small, medium, large
+    # Total memory for loaded models, idle instances are evicted LRU-first beyond it
+    MODEL_CACHE_BUDGET_MB = int(os.getenv('MODEL_CACHE_BUDGET_MB', 10240))
+    # Models loaded in the background at startup, e.g. "base,small"
+    MODEL_WARMUP = [name.strip() for name in os.getenv('MODEL_WARMUP', '').split(',') if name.strip()]
+    # Inference engine: 'whisper' (PyTorch fp32), 'whisper-int8' (dynamically quantized, CPU)
+    # or 'faster-whisper' (CTranslate2); uploads may pick one with the 'engine' field
+    INFERENCE_ENGINE = os.getenv('INFERENCE_ENGINE', 'whisper')
+    MODEL_ENGINES = parse_key_values(os.getenv('MODEL_ENGINES', ''))  # per-model overrides, e.g. "small=faster-whisper"
+    CT2_COMPUTE_TYPE = os.getenv('CT2_COMPUTE_TYPE', 'int8')  # CTranslate2 weight type for faster-whisper
+
+    # Transcription workers
+    TRANSCRIPTION_WORKERS = int(os.getenv('TRANSCRIPTION_WORKERS', 2))
+    MODEL_MEMORY_BUDGET_MB = int(os.getenv('MODEL_MEMORY_BUDGET_MB', 10240))
+    # Per-model concurrency caps, e.g. "large-v3=1,tiny=4"
+    MODEL_CONCURRENCY = {k: int(v) for k, v in parse_key_values(os.getenv('MODEL_CONCURRENCY', '')).items()}
+    ADMISSION_TIMEOUT = float(os.getenv('ADMISSION_TIMEOUT', 5))  # seconds a task waits to fit before yielding its worker
+
+    # Batch submission
+    BATCH_MAX_FILES = int(os.getenv('BATCH_MAX_FILES', 1000))
+    BATCH_IMPORT_ROOT = os.getenv('BATCH_IMPORT_ROOT', '')  # server-side directory batches may import from, empty disables
+
+    # Decoded audio cache shared by jobs on the same input
+    AUDIO_CACHE_MAX_BYTES = int(os.getenv('AUDIO_CACHE_MAX_BYTES', 10 * 1024 * 1024 * 1024))  # 10GB, 0 disables
+    AUDIO_CACHE_DTYPE = os.getenv('AUDIO_CACHE_DTYPE', 'float32')  # float16 halves disk use but needs a copy on load
+    # Remove uploaded media once its task has finished or been cancelled
+    DELETE_UPLOADS_AFTER_PROCESSING = os.getenv('DELETE_UPLOADS_AFTER_PROCESSING', 'True').lower() == 'true'
+
+    # Transcript cache keyed by upload content hash
+    RESULT_CACHE_MAX_ENTRIES = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', 10000))
+    RESULT_CACHE_TTL = float(os.getenv('RESULT_CACHE_TTL', 30 * 24 * 3600))  # seconds, 0 disables expiry
+
+    # Silence compression before inference
+    VAD_ENABLED = os.getenv('VAD_ENABLED', 'True').lower() == 'true'
+    VAD_MIN_SILENCE = float(os.getenv('VAD_MIN_SILENCE', 2.0))  # seconds; shorter pauses are left alone
+    VAD_KEEP_SILENCE = float(os.getenv('VAD_KEEP_SILENCE', 0.5))  # seconds of each long pause that remain
+    VAD_THRESHOLD_DB = float(os.getenv('VAD_THRESHOLD_DB', -40))  # silence level relative to the loud frames
+
+    # Progress reporting
+    PROGRESS_INTERVAL = float(os.getenv('PROGRESS_INTERVAL', 1.0))  # min seconds between progress events per job
+    STREAM_SEGMENTS = os.getenv('STREAM_SEGMENTS', 'True').lower() == 'true'  # send segments as they are decoded
+    WHISPER_VERBOSE = os.getenv('WHISPER_VERBOSE', 'False').lower() == 'true'  # print every segment to stdout
+
+    # Chunked transcription of long media
+    CHUNKED_TRANSCRIPTION = os.getenv('CHUNKED_TRANSCRIPTION', 'True').lower() == 'true'
+    CHUNK_MIN_DURATION = float(os.getenv('CHUNK_MIN_DURATION', 600))  # seconds of audio before chunking kicks in
+    CHUNK_SECONDS = float(os.getenv('CHUNK_SECONDS', 300))
+    CHUNK_OVERLAP_SECONDS = float(os.getenv('CHUNK_OVERLAP_SECONDS', 2))
+    CHUNK_PARALLELISM = int(os.getenv('CHUNK_PARALLELISM', 2))  # max model instances per chunked job
+
+    # Queue broker: 'local' (in-process), 'sqlite' (processes sharing STORAGE_DIR) or 'redis' (the same, with blocking claims)
+    QUEUE_BROKER = os.getenv('QUEUE_BROKER', 'local')
+    BROKER_URL = os.getenv('BROKER_URL', 'redis://localhost:6379/0')
+    # Socket.IO message queue (e.g. redis://...) so any process can emit to any client
+    SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE', '')
+    # Run transcription workers in this process; disable on web nodes in front of a shared broker
+    RUN_WORKERS = os.getenv('RUN_WORKERS', 'True').lower() == 'true'
+
+    # Scheduling: 'fifo', 'affinity' (prefer tasks whose model is already loaded)
+    # or 'fair' (short jobs first, then deficit round robin across sessions)
+    SCHEDULING_MODE = os.getenv('SCHEDULING_MODE', 'fair')
+    AFFINITY_MAX_BATCH = int(os.getenv('AFFINITY_MAX_BATCH', 8))  # max times the oldest task can be skipped in a row
+    AFFINITY_MAX_WAIT = float(os.getenv('AFFINITY_MAX_WAIT', 300))  # seconds before the oldest task must run
+    FAIR_QUANTUM = float(os.getenv('FAIR_QUANTUM', 300))  # seconds of audio each session may run per round
+    SESSION_WEIGHTS = {k: float(v) for k, v in parse_key_values(os.getenv('SESSION_WEIGHTS', '')).items()}
+    PRIORITY_SHORT_SECONDS = float(os.getenv('PRIORITY_SHORT_SECONDS', 120))  # jobs up to this long jump ahead
+    PRIORITY_LONG_SECONDS = float(os.getenv('PRIORITY_LONG_SECONDS', 1800))  # jobs this long run after the rest
+    QUEUE_POSITION_INTERVAL = float(os.getenv('QUEUE_POSITION_INTERVAL', 1.0))  # seconds between coalesced position updates
+
+    # Short clips from separate jobs with the same model, engine, language and task are decoded as one batch
+    INFERENCE_BATCH_SIZE = int(os.getenv('INFERENCE_BATCH_SIZE', 8))  # max clips per batch, 1 disables
+    INFERENCE_BATCH_WINDOW = float(os.getenv('INFERENCE_BATCH_WINDOW', 0.2))  # seconds to wait for more clips
+    INFERENCE_BATCH_MAX_SECONDS = float(os.getenv('INFERENCE_BATCH_MAX_SECONDS', 30))  # longest clip, at most one window
+
+    # CPU placement: workers split the cores allowed by affinity and the cgroup quota into disjoint sets
+    CPU_PINNING = os.getenv('CPU_PINNING', 'True').lower() == 'true'  # pin each running transcription to its set
+    CPU_RESERVED_CORES = int(os.getenv('CPU_RESERVED_CORES', 1))  # kept for web threads sharing the worker process
+    TORCH_THREADS = int(os.getenv('TORCH_THREADS', 0))  # intra-op threads per transcription, 0 sizes them to the set
+    TORCH_INTEROP_THREADS = int(os.getenv('TORCH_INTEROP_THREADS', 1))
+
+    # Cancellation and preemption of running tasks
+    PREEMPTION = os.getenv('PREEMPTION', 'True').lower() == 'true'  # higher-priority tasks interrupt lower ones
+    MAX_PREEMPTIONS = int(os.getenv('MAX_PREEMPTIONS', 3))  # times one task may be interrupted
+    CANCEL_POLL_INTERVAL = float(os.getenv('CANCEL_POLL_INTERVAL', 1.0))  # seconds between job database cancel checks
+    RUNNING_TASK_TTL = float(os.getenv('RUNNING_TASK_TTL', 120))  # seconds without a heartbeat before a worker's tasks are requeued
 
     @staticmethod
     def allowed_file(filename):
@@ -0,0 +1,169 @@
+import math
+import os
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+CPU_SYSFS = '/sys/devices/system/cpu'
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def cgroup_cpu_limit() -> Optional[float]:
+    """CPUs' worth of time the cgroup quota allows (e.g. 4.0 for cpus: '4'), None when unlimited"""
+    # cgroup v2: "<quota> <period>" or "max <period>", in this process's cgroup or the namespace root
+    relative = ''
+    for line in (_read('/proc/self/cgroup') or '').splitlines():
+        if line.startswith('0::'):
+            relative = line[3:].lstrip('/')
+    for directory in filter(None, (os.path.join(CGROUP_ROOT, relative) if relative else None, CGROUP_ROOT)):
+        value = _read(os.path.join(directory, 'cpu.max'))
+        if value:
+            quota, _, period = value.partition(' ')
+            if quota == 'max':
+                return None
+            return int(quota) / int(period or 100000)
+    # cgroup v1
+    for directory in ('cpu', 'cpu,cpuacct'):
+        quota = _read(os.path.join(CGROUP_ROOT, directory, 'cpu.cfs_quota_us'))
+        period = _read(os.path.join(CGROUP_ROOT, directory, 'cpu.cfs_period_us'))
+        if quota and period:
+            return int(quota) / int(period) if int(quota) > 0 else None
+    return None
+
+def allowed_cpus() -> List[int]:
+    """Logical CPUs this process may run on, honouring cpusets"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def cpu_core(cpu: int) -> Tuple[int, int]:
+    """(package, core) a logical CPU belongs to; hyperthread siblings share it"""
+    topology = os.path.join(CPU_SYSFS, f"cpu{cpu}", 'topology')
+    package = _read(os.path.join(topology, 'physical_package_id'))
+    core = _read(os.path.join(topology, 'core_id'))
+    if package is None or core is None:
+        return 0, cpu
+    return int(package), int(core)
+
+def order_by_core(cpus: List[int]) -> List[int]:
+    """One logical CPU of every physical core first, grouped by package, then their hyperthread siblings.
+
+    Filling cores before siblings keeps matrix multiplications from competing
+    for the same execution units until there is no other choice.
+    """
+    cores = {}
+    for cpu in cpus:
+        cores.setdefault(cpu_core(cpu), []).append(cpu)
+    ordered = []
+    for rank in range(max((len(siblings) for siblings in cores.values()), default=0)):
+        ordered += [siblings[rank] for _, siblings in sorted(cores.items()) if len(siblings) > rank]
+    return ordered
+
+class CpuPlacement:
+    """Disjoint core sets and a thread budget for concurrent transcriptions.
+
+    The usable CPUs are the process's affinity mask, cut down to the cgroup
+    quota, so ``cpus: '4'`` on a 64-core host means four cores. ``reserved``
+    of them are kept out of the sets, so the web request threads, which are
+    never pinned, always have cores no transcription runs on. The rest are
+    split into one set per worker, and each set gets as many torch intra-op
+    threads as it has CPUs, so jobs no longer oversubscribe the machine.
+
+    A thread is bound to one set for good, before it first runs a model:
+    affinity is per thread, and the OpenMP threads torch starts for a thread
+    copy its mask when they are created and never follow later changes.
+    Worker threads get their own set when they start; other threads, such as
+    chunk threads, take the least used set on their first model checkout.
+    faster-whisper creates its thread pool when an instance loads, so that
+    pool keeps the set of the thread that loaded the instance.
+    """
+
+    def __init__(self, slots: int, reserved: int = 0, pinning: bool = True, threads: int = 0,
+                 cpus: List[int] = None, limit: Optional[float] = -1):
+        cpus = allowed_cpus() if cpus is None else cpus
+        self.limit = cgroup_cpu_limit() if limit == -1 else limit
+        budget = len(cpus) if self.limit is None else max(1, min(len(cpus), math.floor(self.limit)))
+        ordered = order_by_core(cpus)
+        # Reserve from the end: hyperthread siblings, which suit I/O-bound request threads well
+        reserved = reserved if len(ordered) > reserved and budget > reserved else 0
+        self.web_cpus = sorted(ordered[len(ordered) - reserved:]) if reserved else []
+        workers = ordered[:budget - reserved]
+
+        # Contiguous slices of the core order keep a set on one package where it fits; leftovers
+        # widen the first sets, whose spare CPU absorbs decoding and Python overhead
+        count = min(slots, len(workers))
+        per_set, extra = divmod(len(workers), count) if count else (1, 0)
+        bounds = [i * per_set + min(i, extra) for i in range(count + 1)]
+        self.sets = [sorted(workers[start:end]) for start, end in zip(bounds, bounds[1:])]
+        self.worker_cpus = sorted(cpu for cpu_set in self.sets for cpu in cpu_set)
+        self.threads = threads or per_set
+        self.pinning = pinning and hasattr(os, 'sched_setaffinity')
+        self._users = [0] * len(self.sets)
+        self._lock = threading.Lock()
+        self._local = threading.local()  # index of the set the calling thread is bound to
+
+    def configure_torch(self, interop_threads: int = 1):
+        """Apply the thread budget to torch, before any inference runs"""
+        try:
+            import torch
+        except ImportError:
+            return
+        torch.set_num_threads(self.threads)
+        try:
+            torch.set_interop_threads(interop_threads)
+        except RuntimeError:
+            # Only settable once, before the first inter-op parallel work
+            logger.warning("torch inter-op threads were already initialized")
+
+    def _set_affinity(self, cpus: Set[int]):
+        try:
+            os.sched_setaffinity(0, cpus)
+        except OSError as e:
+            logger.warning(f"Could not pin thread to CPUs {sorted(cpus)}: {e}")
+
+    def _bind(self, index: int):
+        self._local.index = index
+        self._set_affinity(set(self.sets[index]))
+
+    def pin_worker(self, worker: int):
+        """Bind the calling worker thread to a set of its own, before it runs anything"""
+        if self.pinning and self.sets:
+            self._bind(worker % len(self.sets))
+
+    @contextmanager
+    def pinned(self):
+        """Run the calling thread on its set for the duration, binding it to the least used set first"""
+        if not self.pinning or not self.sets:
+            yield
+            return
+        with self._lock:
+            index = getattr(self._local, 'index', None)
+            if index is None:
+                index = min(range(len(self.sets)), key=lambda i: self._users[i])
+                self._bind(index)
+            self._users[index] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._users[index] -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            users = list(self._users)
+        return {
+            'cgroup_limit': self.limit,
+            'pinning': self.pinning,
+            'threads': self.threads,
+            'sets': [{'cpus': cpu_set, 'users': count} for cpu_set, count in zip(self.sets, users)],
+            'web_cpus': self.web_cpus,
+        }
@@ -0,0 +1,129 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from flask.logging import default_handler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Tuple
+from app.core.config import Config, parse_key_values
+from app.core.metrics import counter
+
+LOG_RECORDS_DROPPED = counter(
+    'transcription_log_records_dropped_total', 'Log records dropped because the log queue was full')
+LOG_RECORDS_SAMPLED = counter(
+    'transcription_log_records_sampled_total', 'Repeated log records suppressed by sampling')
+
+FILE_FORMAT = '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+
+_listener = None
+_queue_handler = None
+_setup_lock = threading.Lock()
+
+class SamplingFilter(logging.Filter):
+    """Rate-limit chatty call sites.
+
+    Each line of code may log ``burst`` records below WARNING per ``interval``
+    seconds; further records from it are dropped until the window ends, and
+    the first record of the next window notes how many were suppressed.
+    Warnings and errors always pass.
+    """
+
+    def __init__(self, burst: int = 20, interval: float = 60):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self._windows: Dict[Tuple[str, int], list] = {}  # call site -> [window start, count, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.burst <= 0 or record.levelno >= logging.WARNING:
+            return True
+        site = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(site)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._windows[site] = [now, 1, 0]
+            elif window[1] < self.burst:
+                window[1] += 1
+                return True
+            else:
+                window[2] += 1
+                LOG_RECORDS_SAMPLED.inc()
+                return False
+        if suppressed:
+            record.msg = f"{record.getMessage()} (suppressed {suppressed} similar messages)"
+            record.args = None
+        return True
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full"""
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+def _file_handler(filename: str, level: int, config_class) -> RotatingFileHandler:
+    handler = RotatingFileHandler(
+        filename,
+        maxBytes=config_class.LOG_MAX_BYTES,
+        backupCount=config_class.LOG_BACKUP_COUNT,
+        encoding='utf-8',
+        # Opened by the listener thread on first write, not by the caller
+        delay=True
+    )
+    handler.setFormatter(logging.Formatter(FILE_FORMAT))
+    handler.setLevel(level)
+    return handler
+
+def stop_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener, _queue_handler
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+        if _queue_handler is not None:
+            logging.getLogger('app').removeHandler(_queue_handler)
+            _queue_handler = None
+
+def setup_logging(app, config_class=Config):
+    """Configure logging for the application.
+
+    Request and worker threads only put records on an in-memory queue; a
+    single listener thread formats them and writes the rotating log files.
+    Service modules log through children of the ``app`` logger, so they share
+    the pipeline, and Flask's console handler is moved behind the queue too.
+    """
+    global _listener, _queue_handler
+    log_dir = config_class.LOG_DIR
+    os.makedirs(log_dir, exist_ok=True)
+    # Idempotent, e.g. when create_app runs more than once in a process
+    stop_logging()
+
+    handlers = [
+        _file_handler(os.path.join(log_dir, 'error.log'), logging.ERROR, config_class),
+        _file_handler(os.path.join(log_dir, 'access.log'), logging.INFO, config_class),
+        _file_handler(os.path.join(log_dir, 'app.log'), logging.INFO, config_class),
+        default_handler,
+    ]
+    queue_handler = _NonBlockingQueueHandler(queue.Queue(maxsize=config_class.LOG_QUEUE_SIZE))
+    queue_handler.addFilter(SamplingFilter(config_class.LOG_SAMPLE_BURST, config_class.LOG_SAMPLE_INTERVAL))
+
+    with _setup_lock:
+        # Flask's app.logger is the 'app' logger, the parent of every app.* module logger
+        app.logger.removeHandler(default_handler)
+        app.logger.addHandler(queue_handler)
+        app.logger.setLevel(logging.getLevelName(config_class.LOG_LEVEL.upper()))
+        for name, level in parse_key_values(config_class.LOG_LEVELS).items():
+            logging.getLogger(name).setLevel(logging.getLevelName(level.upper()))
+        _listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        _queue_handler = queue_handler
+
+atexit.register(stop_logging)
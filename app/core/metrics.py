@@ -0,0 +1,265 @@
+import bisect
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Label (name, value) pairs of one series
+Labels = Tuple[Tuple[str, str], ...]
+
+# Anything else is not allowed in a metric name
+_INVALID_NAME_CHARS = re.compile(r'[^a-zA-Z0-9_:]')
+
+# Seconds; spans fast storage calls up to long model loads and transcriptions
+DEFAULT_BUCKETS = (0.001, 0.005, 0.025, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Tuple[str, str] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    type = 'untyped'
+    child_type = None  # series of one label combination, set by subclasses
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """The child series for one combination of label values"""
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        return self.child_type()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for values, child in list(self._children.items()):
+            lines.extend(child.render(self.name, self.labelnames, values))
+        return lines
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def render(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {_format_value(self.value)}"]
+
+class Counter(_Metric):
+    """Monotonically increasing total"""
+    type = 'counter'
+    child_type = _CounterChild
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', '_lock')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def render(self, name, labelnames, values):
+        with self._lock:
+            counts = list(self.counts)
+            total = self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labelnames, values, ('le', _format_value(bound)))} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, values)} {_format_value(total)}")
+        lines.append(f"{name}_count{_format_labels(labelnames, values)} {cumulative}")
+        return lines
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+    type = 'histogram'
+    child_type = _HistogramChild
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return self.child_type(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+class Registry:
+    """Metrics of this process, rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def register_collector(self, collect: Callable[[], Dict[Tuple[str, Labels], float]], prefix: str,
+                           documentation: str):
+        """Expose numbers computed at scrape time, such as the /stats counters, as gauges.
+
+        ``collect`` returns values keyed by (name, labels), as flatten_stats does.
+        """
+        with self._lock:
+            self._collectors.append((collect, prefix, documentation))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        for collect, prefix, documentation in list(self._collectors):
+            try:
+                samples = collect()
+            except Exception:
+                continue
+            series = {}
+            for (key, labels), value in samples.items():
+                series.setdefault(metric_name(f"{prefix}_{key}"), []).append((labels, value))
+            for name, values in sorted(series.items()):
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} gauge")
+                for labels, value in sorted(values):
+                    names, label_values = zip(*labels) if labels else ((), ())
+                    lines.append(f"{name}{_format_labels(names, label_values)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+def counter(name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+def histogram(name: str, documentation: str, labelnames: Iterable[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+def metric_name(name: str) -> str:
+    """``name`` with every character a metric name cannot hold replaced by an underscore"""
+    return _INVALID_NAME_CHARS.sub('_', name)
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def flatten_stats(stats: Dict, prefix: str = '', labelled: Dict[str, str] = None) -> Dict[Tuple[str, Labels], float]:
+    """Numeric leaves of a nested stats dict keyed by their underscore-joined path and labels.
+
+    ``labelled`` maps the path of a dict keyed by data, such as model names,
+    to a label name; its entries become one series with that label instead
+    of a metric name each.
+    """
+    labelled = labelled or {}
+    flat = {}
+    for key, value in stats.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict) and path in labelled:
+            for label_value, number in value.items():
+                if _is_number(number):
+                    flat[(metric_name(path), ((labelled[path], str(label_value)),))] = number
+        elif isinstance(value, dict):
+            flat.update(flatten_stats(value, f"{path}_", labelled))
+        elif _is_number(value):
+            flat[(metric_name(path), ())] = value
+    return flat
+
+def timed(histogram_child) -> Callable:
+    """Decorator observing the duration of every call"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram_child.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+# Metrics shared across the services
+QUEUE_WAIT_SECONDS = histogram(
+    'transcription_queue_wait_seconds', 'Time tasks spent queued before a worker picked them up')
+JOBS_TOTAL = counter(
+    'transcription_jobs_total', 'Finished transcription jobs by model and outcome', ('model', 'status'))
+MODEL_LOAD_SECONDS = histogram(
+    'transcription_model_load_seconds', 'Time to load a Whisper model instance', ('model',))
+AUDIO_LOAD_SECONDS = histogram(
+    'transcription_audio_load_seconds', 'Time to decode or map input audio', ('source',))
+TRANSCRIBE_SECONDS = histogram(
+    'transcription_inference_seconds', 'Time spent in model.transcribe', ('model',))
+REALTIME_FACTOR = histogram(
+    'transcription_realtime_factor', 'Inference time divided by audio duration', ('model',),
+    buckets=(0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5))
+AUDIO_SECONDS_TOTAL = counter(
+    'transcription_audio_seconds_total', 'Seconds of audio transcribed', ('model',))
+INFERENCE_BATCH_SIZE = histogram(
+    'transcription_inference_batch_size', 'Clips from separate jobs decoded in one batch', ('model',),
+    buckets=(1, 2, 4, 8, 16, 32))
+SILENCE_REMOVED_SECONDS_TOTAL = counter(
+    'transcription_silence_removed_seconds_total', 'Seconds of silence skipped before inference', ('model',))
+STORAGE_SECONDS = histogram(
+    'transcription_storage_seconds', 'Job database operation latency', ('operation',),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1, 5))
+EMITS_TOTAL = counter(
+    'transcription_socketio_emits_total', 'Socket.IO events emitted', ('event',))
+EMIT_SECONDS = histogram(
+    'transcription_socketio_emit_seconds', 'Time to hand an event to the Socket.IO transport', ('event',),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 1))
+UPLOAD_BYTES_TOTAL = counter(
+    'transcription_upload_bytes_total', 'Bytes received by upload endpoints', ('endpoint',))
+UPLOAD_SECONDS = histogram(
+    'transcription_upload_seconds', 'Time to receive and store an upload', ('endpoint',))
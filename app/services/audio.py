@@ -0,0 +1,313 @@
+import bisect
+import hashlib
+import os
+import subprocess
+import tempfile
+import threading
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+import whisper
+from app.core.config import Config
+from app.core.metrics import AUDIO_LOAD_SECONDS
+from app.services.persistent_storage import persistent_storage
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+FRAME_SECONDS = 0.02
+# Pre-decoded 16 kHz mono signed 16-bit little-endian audio written at ingest
+PCM_EXTENSION = '.pcm'
+
+class AudioCache:
+    """Decoded audio kept on disk as .npy files and memory-mapped on reuse.
+
+    Transcribing the same input with several models then decodes it with
+    ffmpeg only once. An entry is removed when a task using it finishes and
+    ``in_use`` reports no other queued or running task with the same key.
+    That check reads the job database, so it holds when web and worker
+    processes share STORAGE_DIR. On top of that the least recently used
+    entries are evicted once ``max_bytes`` is exceeded.
+
+    float32 entries are mapped without a copy, float16 ones are converted to
+    one float32 array. With VAD on, compress_silence copies the kept samples
+    out of that, so a hit then saves the ffmpeg decode and, for float32, the
+    full-length array, but not the copy of the shortened audio. ``python -m
+    benchmarks audio`` measures both.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, dtype: str = 'float32',
+                 in_use: Callable[[str], bool] = None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.dtype = np.dtype(dtype)
+        self.in_use = in_use
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def key_for(self, file_path: str, content_hash: str = None) -> Optional[str]:
+        """Cache key of an input, None when it is not worth caching"""
+        if not self.enabled or file_path.endswith(PCM_EXTENSION):
+            # Ingested PCM is already decoded and cheap to load
+            return None
+        if content_hash:
+            return content_hash
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return hashlib.sha256(f"{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.{self.dtype.name}.npy")
+
+    def load(self, file_path: str, key: str) -> np.ndarray:
+        """Memory-map the decoded audio for key, decoding and storing it on a miss"""
+        path = self._path(key)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if os.path.exists(path):
+                with self._lock:
+                    self.stats['hits'] += 1
+                os.utime(path)  # mtime doubles as the LRU clock
+            else:
+                with self._lock:
+                    self.stats['misses'] += 1
+                with AUDIO_LOAD_SECONDS.labels('ffmpeg').time():
+                    audio = whisper.load_audio(file_path).astype(self.dtype, copy=False)
+                os.makedirs(self.cache_dir, exist_ok=True)
+                # Write then rename so readers never map a partial file
+                fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+                with os.fdopen(fd, 'wb') as f:
+                    np.save(f, audio)
+                os.replace(tmp_path, path)
+                self._evict(keep=path)
+        with AUDIO_LOAD_SECONDS.labels('mmap').time():
+            audio = np.load(path, mmap_mode='r')
+            if audio.dtype != np.float32:
+                audio = audio.astype(np.float32)
+        return audio
+
+    def release(self, key: Optional[str]):
+        """Remove an entry unless another queued or running task still needs it.
+
+        Call once the finished task has left the queue and the running tasks.
+        """
+        if not key or (self.in_use and self.in_use(key)):
+            return
+        self.discard(key)
+
+    def discard(self, key: str):
+        with self._lock:
+            self._key_locks.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, keep: str):
+        """Remove least recently used entries until the cache fits its byte budget"""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.npy'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            with self._lock:
+                self.stats['evictions'] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats)
+
+# Create a global instance
+audio_cache = AudioCache(
+    os.path.join(Config.STORAGE_DIR, 'audio_cache'),
+    Config.AUDIO_CACHE_MAX_BYTES,
+    Config.AUDIO_CACHE_DTYPE,
+    in_use=persistent_storage.audio_key_in_use
+)
+
+def load_audio(path: str, content_hash: str = None) -> np.ndarray:
+    """Decode a media file to float32 mono samples at SAMPLE_RATE"""
+    if path.endswith(PCM_EXTENSION):
+        # Already decoded at upload time, no ffmpeg process needed
+        with AUDIO_LOAD_SECONDS.labels('pcm').time():
+            audio = np.fromfile(path, dtype='<i2').astype(np.float32)
+            audio /= 32768.0
+            return audio
+    key = audio_cache.key_for(path, content_hash)
+    if key:
+        return audio_cache.load(path, key)
+    with AUDIO_LOAD_SECONDS.labels('ffmpeg').time():
+        return whisper.load_audio(path)
+
+def probe_duration(path: str, ffprobe: str = 'ffprobe', timeout: float = 10) -> Optional[float]:
+    """Media duration in seconds without decoding it, None when it cannot be determined"""
+    if path.endswith(PCM_EXTENSION):
+        try:
+            return os.path.getsize(path) / (SAMPLE_RATE * 2)
+        except OSError:
+            return None
+    try:
+        output = subprocess.run(
+            [ffprobe, '-v', 'error', '-show_entries', 'format=duration',
+             '-of', 'default=noprint_wrappers=1:nokey=1', path],
+            capture_output=True, text=True, timeout=timeout, check=True
+        ).stdout
+        return float(output.strip())
+    except (OSError, subprocess.SubprocessError, ValueError):
+        return None
+
+def frame_rms(audio: np.ndarray, frame_seconds: float = FRAME_SECONDS) -> np.ndarray:
+    """Root-mean-square energy of consecutive fixed-size frames"""
+    frame = max(1, int(frame_seconds * SAMPLE_RATE))
+    usable = len(audio) - len(audio) % frame
+    if usable == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = audio[:usable].reshape(-1, frame)
+    # Sums of squares straight from the (possibly memory-mapped) samples, without float32 copies of them
+    energy = np.einsum('ij,ij->i', frames, frames, dtype=np.float32)
+    energy /= frame
+    return np.sqrt(energy, out=energy)
+
+def split_on_silence(audio: np.ndarray, chunk_seconds: float, overlap_seconds: float,
+                     search_seconds: float = 5.0) -> List[Tuple[int, int]]:
+    """Split audio into overlapping (start, end) sample ranges.
+
+    Each cut is placed at the quietest frame within ``search_seconds`` before
+    the nominal chunk end, so chunk boundaries land in pauses rather than
+    mid-word. Consecutive chunks overlap by ``overlap_seconds``.
+    """
+    total = len(audio)
+    chunk = int(chunk_seconds * SAMPLE_RATE)
+    overlap = int(overlap_seconds * SAMPLE_RATE)
+    if total <= chunk:
+        return [(0, total)]
+
+    frame = int(FRAME_SECONDS * SAMPLE_RATE)
+    energy = frame_rms(audio)
+    search = int(search_seconds * SAMPLE_RATE)
+    ranges = []
+    start = 0
+    while start + chunk < total:
+        nominal_end = start + chunk
+        lo = max(start + chunk // 2, nominal_end - search) // frame
+        hi = nominal_end // frame
+        if hi > lo and hi <= len(energy):
+            cut = (lo + int(np.argmin(energy[lo:hi]))) * frame
+        else:
+            cut = nominal_end
+        # Extend past the cut so the next chunk's start is covered twice
+        ranges.append((start, min(total, cut + overlap // 2)))
+        start = max(0, cut - overlap // 2)
+    ranges.append((start, total))
+    return ranges
+
+def owned_segments(ranges: List[Tuple[int, int]], index: int, segments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Shift one chunk's segments to absolute time, dropping overlap duplicates.
+
+    Every chunk owns the span between the midpoints of its overlaps with its
+    neighbours, and a segment is kept only by the chunk owning its midpoint.
+    """
+    start, end = ranges[index]
+    offset = start / SAMPLE_RATE
+    owned_start = 0.0 if index == 0 else (start + ranges[index - 1][1]) / 2 / SAMPLE_RATE
+    owned_end = float('inf') if index == len(ranges) - 1 else (end + ranges[index + 1][0]) / 2 / SAMPLE_RATE
+    owned = []
+    for segment in segments:
+        seg_start = segment['start'] + offset
+        seg_end = segment['end'] + offset
+        if owned_start <= (seg_start + seg_end) / 2 < owned_end:
+            owned.append({'start': seg_start, 'end': seg_end, 'text': segment['text']})
+    return owned
+
+class Timeline:
+    """Maps times in silence-compressed audio back to the original media.
+
+    ``spans`` are the (start, end) sample ranges of the original audio that
+    were kept, in order; the compressed audio is their concatenation.
+    """
+
+    def __init__(self, spans: List[Tuple[int, int]], original_samples: int):
+        self.spans = spans
+        self.original_samples = original_samples
+        # Offset of each span within the compressed audio
+        self.offsets = []
+        position = 0
+        for start, end in spans:
+            self.offsets.append(position)
+            position += end - start
+        self.samples = position
+
+    @property
+    def removed_seconds(self) -> float:
+        return (self.original_samples - self.samples) / SAMPLE_RATE
+
+    def to_original(self, seconds: float, is_end: bool = False) -> float:
+        """Original time of a compressed time; an end time on a cut stays with the span before it"""
+        sample = seconds * SAMPLE_RATE
+        find = bisect.bisect_left if is_end else bisect.bisect_right
+        index = min(max(find(self.offsets, sample) - 1, 0), len(self.spans) - 1)
+        start, end = self.spans[index]
+        return min(start + sample - self.offsets[index], end) / SAMPLE_RATE
+
+    def remap(self, segments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [
+            {**segment, 'start': self.to_original(segment['start']), 'end': self.to_original(segment['end'], True)}
+            for segment in segments
+        ]
+
+def compress_silence(audio: np.ndarray, min_silence: float, keep_silence: float,
+                     threshold_db: float = -40.0) -> Tuple[np.ndarray, Optional[Timeline]]:
+    """Shorten pauses longer than ``min_silence`` seconds to ``keep_silence`` seconds.
+
+    A frame counts as silent when its energy is ``threshold_db`` below the
+    loud (95th percentile) frames of the recording. Half of the kept pause
+    stays on each side, so words next to a cut are not clipped. Returns the
+    audio unchanged and no timeline when nothing is worth removing.
+    """
+    energy = frame_rms(audio)
+    if len(energy) == 0 or min_silence <= keep_silence:
+        return audio, None
+    frame = int(FRAME_SECONDS * SAMPLE_RATE)
+    threshold = max(float(np.percentile(energy, 95)) * 10 ** (threshold_db / 20), 1e-4)
+    silent = np.concatenate(([False], energy < threshold, [False]))
+    edges = np.flatnonzero(np.diff(silent.astype(np.int8)))
+    runs = edges.reshape(-1, 2)  # [first silent frame, first frame after] pairs
+    runs = runs[(runs[:, 1] - runs[:, 0]) * FRAME_SECONDS >= min_silence]
+    if len(runs) == 0:
+        return audio, None
+
+    pad = int(keep_silence * SAMPLE_RATE / 2)
+    spans = []
+    position = 0
+    for first, after in runs:
+        cut_start = first * frame + pad
+        cut_end = min(after * frame, len(audio)) - pad
+        if cut_start > position:
+            spans.append((position, cut_start))
+        position = max(position, cut_end)
+    if position < len(audio):
+        spans.append((position, len(audio)))
+    if not spans:
+        # Nothing but silence; keep a sliver so there is something to decode
+        spans = [(0, min(len(audio), max(pad * 2, frame)))]
+    timeline = Timeline(spans, len(audio))
+    return np.concatenate([audio[start:end] for start, end in spans]), timeline
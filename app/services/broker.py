@@ -0,0 +1,323 @@
+import json
+import queue
+import threading
+import time
+import logging
+from typing import Dict, Any, Callable, Iterable, List, Optional
+from app.services.scheduler import TaskScheduler, PRIORITY_SHORT, PRIORITY_NORMAL, PRIORITY_LONG, priority_class
+
+logger = logging.getLogger(__name__)
+
+BROKERS = {'local', 'sqlite', 'redis'}
+
+class SQLiteBroker:
+    """Task queue shared through the SQLite job database.
+
+    Processes on one host that point at the same STORAGE_DIR pull from the
+    same queue: the queue table already holds every pending task, and a worker
+    claims one by deleting its row inside a write transaction. Ordering
+    follows the fair scheduler, with priority classes first and then the
+    least recently served session, but it round-robins per task rather than
+    by audio duration.
+    """
+
+    mode = 'sqlite'
+    # Tasks live in the database already, nothing to restore on startup
+    durable = True
+
+    def __init__(self, storage, max_wait: float = 300, short_seconds: float = 120,
+                 long_seconds: float = 1800, poll_interval: float = 0.5, worker_id: str = None):
+        self.storage = storage
+        # Claimed tasks are marked running under this id in the claiming transaction
+        self.worker_id = worker_id
+        self.max_wait = max_wait
+        self.short_seconds = short_seconds
+        self.long_seconds = long_seconds
+        self.poll_interval = poll_interval
+        self._condition = threading.Condition()
+        self.stats = {'dispatched': 0, 'empty_polls': 0}
+
+    def put(self, task: Dict[str, Any]):
+        """Wake local workers; the caller has already stored the task"""
+        with self._condition:
+            self._condition.notify()
+
+    def requeue(self, task: Dict[str, Any], refund: bool = True):
+        """Wake local workers for a task the caller put back at the head of the queue.
+
+        With ``refund`` the session's turn is given back, as if the claim
+        never happened.
+        """
+        if refund:
+            self.storage.restore_dispatch(task['session_id'])
+        self.put(task)
+
+    def get(self, timeout: float = None, warm_models: Iterable[str] = ()) -> Dict[str, Any]:
+        """Claim the next task, raising queue.Empty on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            task = self.storage.claim_next_task(self.short_seconds, self.long_seconds, self.max_wait, self.worker_id)
+            if task is not None:
+                self.stats['dispatched'] += 1
+                return task
+            self.stats['empty_polls'] += 1
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise queue.Empty
+            with self._condition:
+                # Other processes cannot notify us, so poll as well
+                wait = self.poll_interval if remaining is None else min(self.poll_interval, remaining)
+                self._condition.wait(wait)
+
+    def get_nowait(self) -> Dict[str, Any]:
+        return self.get(timeout=0)
+
+    def qsize(self) -> int:
+        return self.storage.get_queue_size()
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return self.storage.get_queue()
+
+    def position(self, queue_id: str) -> Optional[int]:
+        return self.storage.get_queue_position(queue_id)
+
+    def positions(self, session_ids: Iterable[str] = None) -> Dict[str, Dict[str, int]]:
+        wanted = None if session_ids is None else set(session_ids)
+        result = {session_id: {} for session_id in (wanted or ())}
+        for queue_id, session_id, position in self.storage.get_queue_positions():
+            if wanted is None or session_id in wanted:
+                result.setdefault(session_id, {})[queue_id] = position
+        return result
+
+    def sessions(self) -> List[str]:
+        return list({session_id for _, session_id, _ in self.storage.get_queue_positions()})
+
+    def remove(self, queue_id: str) -> Optional[Dict[str, Any]]:
+        return self.storage.remove_from_queue(queue_id)
+
+    def remove_session(self, session_id: str) -> List[Dict[str, Any]]:
+        return self.remove_where(lambda task: task['session_id'] == session_id)
+
+    def remove_where(self, predicate: Callable[[Dict[str, Any]], bool], limit: int = None) -> List[Dict[str, Any]]:
+        removed = []
+        for task in self.storage.get_queue():
+            if limit is not None and len(removed) >= limit:
+                break
+            # Skip tasks another process claimed in the meantime
+            if predicate(task) and self.storage.remove_from_queue(task['queue_id']) is not None:
+                removed.append(task)
+        return removed
+
+    def export_state(self) -> Optional[Dict[str, Any]]:
+        return None
+
+    def import_state(self, state: Dict[str, Any]):
+        pass
+
+class RedisBroker:
+    """Task queue kept in Redis, for web and worker processes on one host.
+
+    Every priority class is a sorted set scored by arrival order, and workers
+    claim tasks with BZPOPMIN across the classes, highest priority first. This
+    is atomic, so each task is delivered to exactly one worker. Requires the
+    optional ``redis`` package.
+
+    Only the queue moves to Redis. Results, running tasks, cancel requests,
+    batches, events and the result cache stay in the SQLite job database, and
+    tasks refer to uploads by local path, so every process must share one
+    STORAGE_DIR and UPLOAD_FOLDER. SQLite cannot be shared safely over a
+    network filesystem, which rules out separate hosts. Startup checks that
+    all processes using the queue see the same job database.
+    """
+
+    mode = 'redis'
+    durable = True
+
+    def __init__(self, url: str, storage, prefix: str = 'transcription:', short_seconds: float = 120,
+                 long_seconds: float = 1800):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("QUEUE_BROKER=redis requires the 'redis' package (pip install redis)") from e
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self.short_seconds = short_seconds
+        self.long_seconds = long_seconds
+        self.stats = {'dispatched': 0, 'cancelled_claims': 0}
+        self._check_shared_storage(storage)
+
+    def _check_shared_storage(self, storage):
+        """Refuse to use a queue whose tasks were created against another job database"""
+        key = self._key('store')
+        store_id = storage.get_store_id()
+        self.redis.setnx(key, store_id)
+        if self.redis.get(key) != store_id:
+            raise RuntimeError(
+                f"QUEUE_BROKER=redis: the queue at {key} belongs to another job database. All processes "
+                f"must share one STORAGE_DIR and UPLOAD_FOLDER on the same host. If the job database "
+                f"was recreated, delete the queue's keys ({self.prefix}*) first."
+            )
+
+    def _key(self, *parts: str) -> str:
+        return self.prefix + ':'.join(parts)
+
+    def _ready_keys(self) -> List[str]:
+        return [self._key('ready', str(priority)) for priority in (PRIORITY_SHORT, PRIORITY_NORMAL, PRIORITY_LONG)]
+
+    def put(self, task: Dict[str, Any]):
+        self._add(task, self.redis.incr(self._key('seq')))
+
+    def requeue(self, task: Dict[str, Any], refund: bool = True):
+        """Return a dequeued task that never started to the head of the queue.
+
+        Sessions take no turns here, so there is nothing to refund.
+        """
+        head = self.redis.zrange(self._key('order'), 0, 0, withscores=True)
+        self._add(task, head[0][1] - 1 if head else self.redis.incr(self._key('seq')))
+
+    def _add(self, task: Dict[str, Any], seq: float):
+        queue_id = task['queue_id']
+        pipe = self.redis.pipeline()
+        pipe.hset(self._key('tasks'), queue_id, json.dumps(task))
+        pipe.zadd(self._key('order'), {queue_id: seq})
+        pipe.sadd(self._key('session', task['session_id']), queue_id)
+        pipe.sadd(self._key('sessions'), task['session_id'])
+        # The ready set is written last so a worker never pops an unstored task
+        priority = priority_class(task.get('duration'), self.short_seconds, self.long_seconds)
+        pipe.zadd(self._key('ready', str(priority)), {queue_id: seq})
+        pipe.execute()
+
+    def get(self, timeout: float = None, warm_models: Iterable[str] = ()) -> Dict[str, Any]:
+        """Claim the next task, raising queue.Empty on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                popped = None
+                for key in self._ready_keys():
+                    items = self.redis.zpopmin(key)
+                    if items:
+                        popped = (key, *items[0])
+                        break
+            else:
+                # BZPOPMIN checks the keys in order; a timeout of 0 blocks forever
+                popped = self.redis.bzpopmin(self._ready_keys(), timeout=0 if remaining is None else remaining)
+            if not popped:
+                raise queue.Empty
+            task = self._discard(popped[1])
+            if task is not None:
+                self.stats['dispatched'] += 1
+                return task
+            # Cancelled between the pop and the claim
+            self.stats['cancelled_claims'] += 1
+
+    def get_nowait(self) -> Dict[str, Any]:
+        return self.get(timeout=0)
+
+    def _discard(self, queue_id: str) -> Optional[Dict[str, Any]]:
+        """Drop a task's bookkeeping, returning it if this caller removed it"""
+        pipe = self.redis.pipeline()
+        pipe.hget(self._key('tasks'), queue_id)
+        pipe.hdel(self._key('tasks'), queue_id)
+        pipe.zrem(self._key('order'), queue_id)
+        raw, deleted, _ = pipe.execute()
+        if not deleted:
+            return None
+        task = json.loads(raw)
+        session_key = self._key('session', task['session_id'])
+        self.redis.srem(session_key, queue_id)
+        if not self.redis.scard(session_key):
+            self.redis.srem(self._key('sessions'), task['session_id'])
+        return task
+
+    def qsize(self) -> int:
+        return self.redis.zcard(self._key('order'))
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        queue_ids = self.redis.zrange(self._key('order'), 0, -1)
+        if not queue_ids:
+            return []
+        return [json.loads(raw) for raw in self.redis.hmget(self._key('tasks'), queue_ids) if raw]
+
+    def position(self, queue_id: str) -> Optional[int]:
+        rank = self.redis.zrank(self._key('order'), queue_id)
+        return None if rank is None else rank + 1
+
+    def positions(self, session_ids: Iterable[str] = None) -> Dict[str, Dict[str, int]]:
+        if session_ids is None:
+            session_ids = self.sessions()
+        result = {}
+        for session_id in session_ids:
+            queue_ids = list(self.redis.smembers(self._key('session', session_id)))
+            pipe = self.redis.pipeline()
+            for queue_id in queue_ids:
+                pipe.zrank(self._key('order'), queue_id)
+            result[session_id] = {
+                queue_id: rank + 1 for queue_id, rank in zip(queue_ids, pipe.execute()) if rank is not None
+            }
+        return result
+
+    def sessions(self) -> List[str]:
+        return list(self.redis.smembers(self._key('sessions')))
+
+    def remove(self, queue_id: str) -> Optional[Dict[str, Any]]:
+        pipe = self.redis.pipeline()
+        for key in self._ready_keys():
+            pipe.zrem(key, queue_id)
+        pipe.execute()
+        return self._discard(queue_id)
+
+    def remove_session(self, session_id: str) -> List[Dict[str, Any]]:
+        removed = [self.remove(queue_id) for queue_id in self.redis.smembers(self._key('session', session_id))]
+        return [task for task in removed if task is not None]
+
+    def remove_where(self, predicate: Callable[[Dict[str, Any]], bool], limit: int = None) -> List[Dict[str, Any]]:
+        removed = []
+        for task in self.snapshot():
+            if limit is not None and len(removed) >= limit:
+                break
+            if predicate(task):
+                task = self.remove(task['queue_id'])
+                if task is not None:
+                    removed.append(task)
+        return removed
+
+    def export_state(self) -> Optional[Dict[str, Any]]:
+        return None
+
+    def import_state(self, state: Dict[str, Any]):
+        pass
+
+def create_broker(kind: str, storage, url: str = None, **options):
+    """Build the task queue backend named by QUEUE_BROKER.
+
+    ``local`` is the in-process TaskScheduler and supports every scheduling
+    mode. ``sqlite`` and ``redis`` are shared by several processes.
+    ``worker_id`` names this process in the running_tasks table, for brokers
+    that mark a task running as they hand it out.
+    """
+    if kind not in BROKERS:
+        raise ValueError(f"Invalid queue broker. Must be one of: {', '.join(sorted(BROKERS))}")
+    worker_id = options.pop('worker_id', None)
+    if kind == 'sqlite':
+        return SQLiteBroker(
+            storage,
+            max_wait=options['max_wait'],
+            short_seconds=options['short_seconds'],
+            long_seconds=options['long_seconds'],
+            worker_id=worker_id
+        )
+    if kind == 'redis':
+        return RedisBroker(
+            url,
+            storage,
+            short_seconds=options['short_seconds'],
+            long_seconds=options['long_seconds']
+        )
+    return TaskScheduler(**options)
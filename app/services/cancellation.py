@@ -0,0 +1,57 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+CANCELLED = 'cancelled'
+PREEMPTED = 'preempted'
+
+class TaskCancelled(Exception):
+    """Raised inside a running transcription once its token is cancelled.
+
+    ``checkpoint`` holds the work finished so far when the task was
+    preempted, so it can resume where it stopped instead of starting over.
+    """
+
+    def __init__(self, reason: str = CANCELLED, checkpoint: Dict[str, Any] = None):
+        super().__init__(f"Task {reason}")
+        self.reason = reason
+        self.checkpoint = checkpoint
+
+class CancellationToken:
+    """Cooperative stop signal for one running task.
+
+    The worker checks it between decode windows and chunks. Local callers
+    cancel it directly; cancels requested by other processes through the job
+    database are picked up by ``poll``, called at most every ``poll_interval``
+    seconds.
+    """
+
+    def __init__(self, poll: Callable[[], bool] = None, poll_interval: float = 1.0):
+        self.poll = poll
+        self.poll_interval = poll_interval
+        self.reason = None
+        self._last_poll = time.monotonic()
+        self._lock = threading.Lock()
+
+    def cancel(self, reason: str = CANCELLED) -> bool:
+        """Request a stop, returns False if one was already requested"""
+        with self._lock:
+            if self.reason is not None:
+                return False
+            self.reason = reason
+            return True
+
+    @property
+    def cancelled(self) -> bool:
+        if self.reason is None and self.poll is not None:
+            now = time.monotonic()
+            if now - self._last_poll >= self.poll_interval:
+                self._last_poll = now
+                if self.poll():
+                    self.cancel(CANCELLED)
+        return self.reason is not None
+
+    def check(self, checkpoint: Callable[[], Optional[Dict[str, Any]]] = None):
+        """Raise TaskCancelled if a stop was requested, with a checkpoint when preempted"""
+        if self.cancelled:
+            raise TaskCancelled(self.reason, checkpoint() if checkpoint and self.reason == PREEMPTED else None)
@@ -0,0 +1,167 @@
+from typing import List, Optional, Tuple
+import numpy as np
+import whisper
+from app.core.config import Config
+from app.services.progress import current_listener
+from app.services.cancellation import CancellationToken
+
+DEFAULT_ENGINE = 'whisper'
+
+# whisper.transcribe's defaults for accepting a temperature 0 decode
+COMPRESSION_RATIO_THRESHOLD = 2.4
+LOGPROB_THRESHOLD = -1.0
+NO_SPEECH_THRESHOLD = 0.6
+
+class WhisperEngine:
+    """The openai-whisper PyTorch model as shipped, fp32 on CPU.
+
+    Engines load instances for the model cache, and every instance they return
+    has whisper's ``transcribe(audio, verbose=, language=, task=)`` method,
+    returns ``{'text', 'segments', 'language'}`` and reports progress to the
+    listener installed by ``whisper_progress``.
+    """
+
+    name = 'whisper'
+    # Resident memory relative to the fp32 estimates in MODEL_MEMORY_MB
+    memory_factor = 1.0
+    # Implements transcribe_batch
+    supports_batching = True
+
+    def load(self, model_name: str, threads: int = 0):
+        # PyTorch's thread pool is process-wide, sized by CpuPlacement.configure_torch
+        return whisper.load_model(model_name)
+
+    def transcribe_batch(self, model, clips: List[np.ndarray], language: str, task: str,
+                         tokens: List[CancellationToken] = None) -> List[Optional[str]]:
+        """Decode clips of at most one 30 second window each in a single encoder and decoder pass.
+
+        Returns the text of each clip, or None for a clip whose greedy decode
+        fails whisper's quality checks and should be transcribed again on its
+        own, with temperature fallback. ``tokens`` holds one cancellation token
+        per clip; a cancelled clip stops decoding at the next token step while
+        the rest of the batch goes on, and its text is meaningless.
+        """
+        import torch
+
+        mel = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(clip), model.dims.n_mels) for clip in clips
+        ]).to(model.device)
+        options = whisper.DecodingOptions(
+            language=language, task=task, temperature=0.0, without_timestamps=True, fp16=model.device.type != 'cpu'
+        )
+        decoder = whisper.decoding.DecodingTask(model, options)
+        if tokens:
+            decoder.logit_filters.append(_EndCancelled(tokens, decoder.tokenizer.eot))
+        with torch.no_grad():
+            results = decoder.run(mel)
+        texts = []
+        for result in results:
+            # Same order as transcribe(): likely silence is never retried, only dropped when also unlikely text
+            silent = result.no_speech_prob > NO_SPEECH_THRESHOLD
+            if silent and result.avg_logprob <= LOGPROB_THRESHOLD:
+                texts.append('')
+            elif not silent and (result.compression_ratio > COMPRESSION_RATIO_THRESHOLD
+                                 or result.avg_logprob < LOGPROB_THRESHOLD):
+                texts.append(None)
+            else:
+                # Match the leading space of transcribe() output
+                texts.append(' ' + result.text if result.text else '')
+        return texts
+
+class _EndCancelled(whisper.decoding.LogitFilter):
+    """Leave only end-of-text to the batch rows of cancelled clips, so their decode finishes at once.
+
+    Greedy decoding keeps one row per clip in the order given, and the
+    decoder stops early once every row has ended.
+    """
+
+    def __init__(self, tokens: List[CancellationToken], eot: int):
+        self.tokens = tokens
+        self.eot = eot
+
+    def apply(self, logits, tokens):
+        for row, token in enumerate(self.tokens):
+            if token.cancelled:
+                logits[row, :] = -np.inf
+                logits[row, self.eot] = 0
+
+class QuantizedWhisperEngine(WhisperEngine):
+    """The same PyTorch model with its linear layers dynamically quantized to int8.
+
+    Weights are stored as int8 and activations are quantized on the fly, which
+    speeds up the matrix multiplications that dominate CPU inference. Embeddings
+    and convolutions stay fp32. It runs on the CPU only.
+    """
+
+    name = 'whisper-int8'
+    memory_factor = 0.6
+
+    def load(self, model_name: str, threads: int = 0):
+        import torch
+
+        model = whisper.load_model(model_name, device='cpu')
+        # whisper's Linear subclass only casts weights to the input dtype, which fp32
+        # on CPU never needs, and quantize_dynamic matches module types exactly
+        for module in model.modules():
+            if isinstance(module, whisper.model.Linear):
+                module.__class__ = torch.nn.Linear
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+class _CTranslate2Model:
+    """Adapts a faster-whisper model to the whisper transcribe interface"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def transcribe(self, audio, verbose: bool = None, language: str = None, task: str = 'transcribe', **kwargs):
+        # Greedy decoding with temperature fallback, like whisper's defaults
+        segments, info = self.model.transcribe(audio, language=language, task=task, beam_size=1)
+        listener = current_listener()
+        total_frames = len(audio) // whisper.audio.HOP_LENGTH
+        decoded = []
+        # Segments are decoded lazily while iterating, so progress follows the decoder
+        for segment in segments:
+            decoded.append({'id': len(decoded), 'start': segment.start, 'end': segment.end, 'text': segment.text})
+            if listener:
+                done_frames = int(segment.end * whisper.audio.SAMPLE_RATE / whisper.audio.HOP_LENGTH)
+                listener(min(done_frames, total_frames), total_frames, decoded)
+        return {'text': ''.join(segment['text'] for segment in decoded), 'segments': decoded,
+                'language': info.language}
+
+class CTranslate2Engine:
+    """faster-whisper's CTranslate2 port of the model, int8 on CPU by default (CT2_COMPUTE_TYPE)"""
+
+    name = 'faster-whisper'
+    memory_factor = 0.35
+    supports_batching = False
+
+    def load(self, model_name: str, threads: int = 0):
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError as e:
+            raise RuntimeError("The faster-whisper engine requires the 'faster-whisper' package "
+                               "(pip install faster-whisper)") from e
+        # CTranslate2 keeps a thread pool per model, 0 lets it pick its default
+        return _CTranslate2Model(WhisperModel(model_name, device='cpu', compute_type=Config.CT2_COMPUTE_TYPE,
+                                              cpu_threads=threads))
+
+ENGINES = {engine.name: engine for engine in (WhisperEngine(), QuantizedWhisperEngine(), CTranslate2Engine())}
+
+def get_engine(name: str):
+    if name not in ENGINES:
+        raise ValueError(f"Invalid engine. Must be one of: {', '.join(sorted(ENGINES))}")
+    return ENGINES[name]
+
+def resolve_engine(model_name: str, requested: Optional[str] = None) -> str:
+    """Engine for a job: the one requested, else MODEL_ENGINES for the model, else INFERENCE_ENGINE"""
+    name = requested or Config.MODEL_ENGINES.get(model_name) or Config.INFERENCE_ENGINE
+    return get_engine(name).name
+
+def model_key(model_name: str, engine: str = DEFAULT_ENGINE) -> str:
+    """Identifies loaded instances and cached results; plain model names keep meaning the default engine"""
+    return model_name if engine == DEFAULT_ENGINE else f"{model_name}@{engine}"
+
+def split_key(key: str) -> Tuple[str, str]:
+    """(model name, engine) of a model_key"""
+    model_name, _, engine = key.partition('@')
+    return model_name, engine or DEFAULT_ENGINE
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import time
+import logging
+from typing import Any, Dict
+from app import socketio
+from app.core.metrics import EMITS_TOTAL, EMIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+class SocketIOEmitter:
+    """Emit straight through Flask-SocketIO.
+
+    Inside the web process this reaches connected clients directly. In other
+    processes it only works when SOCKETIO_MESSAGE_QUEUE is set, in which case
+    the emit is published to the queue and delivered by the web process.
+    """
+
+    def emit(self, event: str, data: Dict[str, Any], to: str = None):
+        socketio.emit(event, data, to=to)
+
+class AsyncServerEmitter:
+    """Emit through a python-socketio AsyncServer from worker threads.
+
+    Used by the ASGI serving mode; each emit is scheduled on the server's
+    event loop, so callers never block on client I/O.
+    """
+
+    def __init__(self, server, loop):
+        self.server = server
+        self.loop = loop
+
+    def emit(self, event: str, data: Dict[str, Any], to: str = None):
+        asyncio.run_coroutine_threadsafe(self.server.emit(event, data, to=to), self.loop)
+
+class StorageEmitter:
+    """Write events to the shared job database for an EventRelay to deliver"""
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def emit(self, event: str, data: Dict[str, Any], to: str = None):
+        self.storage.add_event(event, data, to)
+
+class EventRelay:
+    """Deliver events written by worker processes to this process's Socket.IO clients.
+
+    Polls the events table for rows newer than the last one seen. Every web
+    process relays every event, so each of them reaches its own clients, and
+    rows are deleted once they are older than ``retention`` seconds.
+    """
+
+    def __init__(self, storage, poll_interval: float = 0.2, retention: float = 300):
+        self.storage = storage
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._stopped = threading.Event()
+        self._thread = None
+        self.stats = {'relayed': 0}
+
+    def start(self):
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='event-relay', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        # Only events written after startup; older ones were meant for earlier connections
+        last_id = self.storage.get_last_event_id()
+        last_prune = time.monotonic()
+        while not self._stopped.wait(self.poll_interval):
+            try:
+                for event_id, event, room, data in self.storage.get_events_after(last_id):
+                    emit(event, data, to=room)
+                    last_id = event_id
+                    self.stats['relayed'] += 1
+                if time.monotonic() - last_prune >= self.retention:
+                    self.storage.prune_events(self.retention)
+                    last_prune = time.monotonic()
+            except Exception as e:
+                logger.error(f"Error relaying events: {str(e)}")
+
+_emitter = SocketIOEmitter()
+
+def use_emitter(emitter):
+    """Route every service emit through emitter from now on"""
+    global _emitter
+    _emitter = emitter
+
+def emit(event: str, data: Dict[str, Any], to: str = None):
+    """Send a Socket.IO event to a client room through the configured transport"""
+    EMITS_TOTAL.labels(event).inc()
+    with EMIT_SECONDS.labels(event).time():
+        _emitter.emit(event, data, to=to)
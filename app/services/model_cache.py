@@ -0,0 +1,140 @@
+import ctypes
+import ctypes.util
+import gc
+import itertools
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable
+
+logger = logging.getLogger(__name__)
+
+def _free_memory():
+    """Return memory held by dropped model weights to the allocator and the OS"""
+    gc.collect()
+    try:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except ImportError:
+        pass
+    # glibc keeps freed arenas mapped; malloc_trim hands them back to the OS
+    libc_name = ctypes.util.find_library('c')
+    if libc_name:
+        try:
+            ctypes.CDLL(libc_name).malloc_trim(0)
+        except (OSError, AttributeError):
+            pass
+
+class ModelCache:
+    """Memory-budgeted LRU cache of loaded model instances.
+
+    Instances are checked out for the duration of one job and returned
+    afterwards. When loading another instance would exceed the budget, the
+    least recently used idle instances are evicted first. Pinned models always
+    keep at least one instance loaded.
+    """
+
+    def __init__(self, loader: Callable[[str], Any], memory_budget_mb: int,
+                 size_of: Callable[[str], int], pinned: Iterable[str] = ()):
+        self._loader = loader
+        self._size_of = size_of
+        self.memory_budget_mb = memory_budget_mb
+        self.pinned = set(pinned)
+        self.used_mb = 0
+        self._idle = OrderedDict()  # key -> (model_name, model), least recently used first
+        self._loaded = {}  # model_name -> number of loaded instances, idle or busy
+        self._keys = itertools.count()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'loads': 0, 'evictions': 0}
+
+    def acquire(self, model_name: str):
+        """Check out an instance of model_name, loading one if none is idle"""
+        with self._lock:
+            for key in reversed(self._idle):
+                if self._idle[key][0] == model_name:
+                    self.stats['hits'] += 1
+                    return self._idle.pop(key)[1]
+            self.stats['misses'] += 1
+            evicted = self._reserve(model_name)
+
+        if evicted:
+            del evicted
+            _free_memory()
+
+        try:
+            model = self._loader(model_name)
+        except Exception:
+            with self._lock:
+                self._unreserve(model_name)
+            raise
+        with self._lock:
+            self.stats['loads'] += 1
+        return model
+
+    def release(self, model_name: str, model):
+        """Return a checked-out instance to the idle pool"""
+        with self._lock:
+            self._idle[next(self._keys)] = (model_name, model)
+
+    def discard(self, model_name: str, model):
+        """Drop a checked-out instance instead of returning it"""
+        with self._lock:
+            self._unreserve(model_name)
+        del model
+        _free_memory()
+
+    def warm_models(self) -> set:
+        """Model names with an idle instance ready to use"""
+        with self._lock:
+            return {model_name for model_name, _ in self._idle.values()}
+
+    def warm_up(self, model_names: Iterable[str]):
+        """Load one idle instance of each model, skipping ones already loaded"""
+        for model_name in model_names:
+            with self._lock:
+                if self._loaded.get(model_name):
+                    continue
+            try:
+                self.release(model_name, self.acquire(model_name))
+                logger.info(f"Warmed up model: {model_name}")
+            except Exception as e:
+                logger.error(f"Failed to warm up model {model_name}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                'used_mb': self.used_mb,
+                'budget_mb': self.memory_budget_mb,
+                'loaded': dict(self._loaded),
+                'idle': len(self._idle)
+            }
+
+    def _reserve(self, model_name: str) -> list:
+        """Account for a new instance, evicting idle ones to make room. Caller holds the lock."""
+        need = self._size_of(model_name)
+        evicted = []
+        for key in list(self._idle):
+            if self.used_mb + need <= self.memory_budget_mb:
+                break
+            name, model = self._idle[key]
+            if name in self.pinned and self._loaded[name] == 1:
+                continue
+            del self._idle[key]
+            self._unreserve(name)
+            evicted.append(model)
+            self.stats['evictions'] += 1
+            logger.info(f"Evicted model {name} from cache")
+        if self.used_mb + need > self.memory_budget_mb:
+            logger.warning(f"Loading {model_name} exceeds the model cache budget "
+                           f"({self.used_mb + need} MB > {self.memory_budget_mb} MB)")
+        self.used_mb += need
+        self._loaded[model_name] = self._loaded.get(model_name, 0) + 1
+        return evicted
+
+    def _unreserve(self, model_name: str):
+        self.used_mb -= self._size_of(model_name)
+        self._loaded[model_name] -= 1
+        if not self._loaded[model_name]:
+            del self._loaded[model_name]
@@ -1,79 +1,820 @@
 import json
 import os
+import sqlite3
+import threading
+import time
 import logging
-from typing import Dict, List, Any
+import zlib
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Any, Optional, Tuple
 from pathlib import Path
+from app.core.config import Config
+from app.core.metrics import STORAGE_SECONDS, timed
 
 logger = logging.getLogger(__name__)
 
+# Transcripts compress 3-5x; level 6 costs well under a millisecond per result
+COMPRESSION_LEVEL = 6
+PREVIEW_CHARS = 200
+
+def _pack(value: Any) -> bytes:
+    return zlib.compress(json.dumps(value).encode('utf-8'), COMPRESSION_LEVEL)
+
+def _unpack(stored) -> Any:
+    # Rows written before compression hold plain JSON text
+    if isinstance(stored, bytes):
+        return json.loads(zlib.decompress(stored))
+    return json.loads(stored)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queue (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    queue_id TEXT NOT NULL UNIQUE,
+    task TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    queue_id TEXT PRIMARY KEY,
+    result BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    session_id TEXT,
+    model_name TEXT
+);
+CREATE TABLE IF NOT EXISTS result_cache (
+    cache_key TEXT PRIMARY KEY,
+    result BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS result_cache_accessed ON result_cache (accessed_at);
+CREATE INDEX IF NOT EXISTS result_cache_created ON result_cache (created_at);
+CREATE TABLE IF NOT EXISTS batches (
+    batch_id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    queue_ids TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS uploads (
+    upload_id TEXT PRIMARY KEY,
+    upload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'open'
+);
+CREATE TABLE IF NOT EXISTS upload_chunks (
+    upload_id TEXT NOT NULL,
+    chunk_offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    PRIMARY KEY (upload_id, chunk_offset)
+);
+CREATE TABLE IF NOT EXISTS broker_sessions (
+    session_id TEXT PRIMARY KEY,
+    last_dispatch REAL NOT NULL,
+    previous_dispatch REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS running_tasks (
+    queue_id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    worker_id TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    audio_key TEXT,
+    heartbeat_at REAL,
+    task TEXT
+);
+CREATE INDEX IF NOT EXISTS running_tasks_session ON running_tasks (session_id);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event TEXT NOT NULL,
+    room TEXT,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scheduler_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    state TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS store_identity (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    store_id TEXT NOT NULL
+);
+"""
+
 class PersistentStorage:
-    def __init__(self, storage_dir: str = "storage"):
+    """SQLite (WAL mode) backed store for queued tasks and transcription results.
+
+    Every operation touches a single indexed row, so appends and lookups by
+    ``queue_id`` stay O(1) regardless of how much history has accumulated.
+    """
+
+    def __init__(self, storage_dir: str = "storage", compaction_interval: float = 3600):
         self.storage_dir = Path(storage_dir)
+        self.db_file = self.storage_dir / "jobs.db"
+        # Legacy JSON files, only read once for migration
         self.queue_file = self.storage_dir / "queue.json"
         self.results_file = self.storage_dir / "results.json"
+        self.compaction_interval = compaction_interval
+        self._local = threading.local()
+        self._compaction_thread = None
         self._ensure_storage_exists()
-    
+        self._migrate_json_files()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Get the calling thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # NORMAL is crash-safe in WAL mode; only the last commit can be lost on power failure
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Run a block inside a write transaction, rolling back on error"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+
     def _ensure_storage_exists(self):
-        """Ensure storage directory and files exist"""
+        """Ensure storage directory and database schema exist"""
         self.storage_dir.mkdir(exist_ok=True)
-        if not self.queue_file.exists():
-            self._save_queue([])
-        if not self.results_file.exists():
-            self._save_results({})
-    
-    def _save_queue(self, queue_data: List[Dict[str, Any]]):
-        """Save queue data to file"""
-        with open(self.queue_file, 'w') as f:
-            json.dump(queue_data, f, indent=2)
-    
-    def _save_results(self, results_data: Dict[str, Any]):
-        """Save results data to file"""
-        with open(self.results_file, 'w') as f:
-            json.dump(results_data, f, indent=2)
-    
+        conn = self._connect()
+        # Must be set before the first table is created to take effect
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.executescript(SCHEMA)
+        self._migrate_schema(conn)
+
+    @staticmethod
+    def _migrate_schema(conn: sqlite3.Connection):
+        """Add columns introduced after a database was created, then their indexes"""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(results)")}
+        for column in ('session_id', 'model_name'):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE results ADD COLUMN {column} TEXT")
+        # The rowid is the page cursor, so an index on session_id alone serves per-session pages
+        conn.execute("CREATE INDEX IF NOT EXISTS results_session ON results (session_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS results_created ON results (created_at)")
+        if 'previous_dispatch' not in {row[1] for row in conn.execute("PRAGMA table_info(broker_sessions)")}:
+            conn.execute("ALTER TABLE broker_sessions ADD COLUMN previous_dispatch REAL NOT NULL DEFAULT 0")
+        running_columns = {row[1] for row in conn.execute("PRAGMA table_info(running_tasks)")}
+        for column, kind in (('audio_key', 'TEXT'), ('heartbeat_at', 'REAL'), ('task', 'TEXT')):
+            if column not in running_columns:
+                conn.execute(f"ALTER TABLE running_tasks ADD COLUMN {column} {kind}")
+        if 'status' not in {row[1] for row in conn.execute("PRAGMA table_info(uploads)")}:
+            conn.execute("ALTER TABLE uploads ADD COLUMN status TEXT NOT NULL DEFAULT 'open'")
+        # Serve audio_key_in_use; the expression must match the query's exactly
+        conn.execute("CREATE INDEX IF NOT EXISTS running_tasks_audio ON running_tasks (audio_key)")
+        conn.execute("CREATE INDEX IF NOT EXISTS queue_audio_key ON queue (json_extract(task, '$.audio_key'))")
+
+    def _migrate_json_files(self):
+        """One-time import of the legacy queue.json/results.json files"""
+        if not self.queue_file.exists() and not self.results_file.exists():
+            return
+
+        queue_data = self._read_json_file(self.queue_file, [])
+        results_data = self._read_json_file(self.results_file, {})
+        now = time.time()
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO queue (queue_id, task, created_at) VALUES (?, ?, ?)",
+                [(task['queue_id'], json.dumps(task), now) for task in queue_data if task.get('queue_id')]
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO results (queue_id, result, created_at) VALUES (?, ?, ?)",
+                [(queue_id, _pack(result), now) for queue_id, result in results_data.items()]
+            )
+
+        for path in (self.queue_file, self.results_file):
+            if path.exists():
+                os.replace(path, path.with_name(path.name + '.migrated'))
+        logger.info(f"Migrated {len(queue_data)} queued tasks and {len(results_data)} results from JSON storage")
+
+    @staticmethod
+    def _read_json_file(path: Path, default):
+        if not path.exists():
+            return default
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Error reading legacy storage file {path}: {e}")
+            return default
+
+    def start_compaction(self):
+        """Start the background WAL checkpoint/vacuum thread"""
+        if self._compaction_thread is None and self.compaction_interval > 0:
+            self._compaction_thread = threading.Thread(target=self._compaction_loop, daemon=True)
+            self._compaction_thread.start()
+
+    def _compaction_loop(self):
+        while True:
+            time.sleep(self.compaction_interval)
+            try:
+                self.compact()
+            except Exception as e:
+                logger.error(f"Storage compaction failed: {e}")
+
+    def compact(self):
+        """Fold the WAL back into the database and release free pages"""
+        conn = self._connect()
+        with self._transaction() as tx:
+            # Sessions with nothing queued start over as least recently served
+            tx.execute(
+                "DELETE FROM broker_sessions WHERE session_id NOT IN "
+                "(SELECT json_extract(task, '$.session_id') FROM queue)"
+            )
+        self.compress_legacy_results()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("PRAGMA incremental_vacuum")
+        conn.execute("PRAGMA optimize")
+
+    def compress_legacy_results(self, batch_size: int = 500) -> int:
+        """Compress results stored as plain JSON by earlier versions, a batch per transaction"""
+        converted = 0
+        while True:
+            with self._transaction() as conn:
+                rows = conn.execute(
+                    "SELECT queue_id, result FROM results WHERE typeof(result) = 'text' LIMIT ?", (batch_size,)
+                ).fetchall()
+                conn.executemany(
+                    "UPDATE results SET result = ? WHERE queue_id = ?",
+                    [(_pack(json.loads(result)), queue_id) for queue_id, result in rows]
+                )
+            converted += len(rows)
+            if len(rows) < batch_size:
+                return converted
+
     def get_queue(self) -> List[Dict[str, Any]]:
         """Get current queue data"""
         try:
-            with open(self.queue_file, 'r') as f:
-                return json.load(f)
+            rows = self._connect().execute("SELECT task FROM queue ORDER BY seq").fetchall()
+            return [json.loads(task) for (task,) in rows]
         except Exception as e:
-            logger.error(f"Error reading queue file: {e}")
+            logger.error(f"Error reading queue: {e}")
             return []
-    
+
+    def list_queue(self, session_id: str = None, after: int = None, limit: int = 20) -> Dict[str, Any]:
+        """One page of queued tasks in queue order, with only what a listing shows.
+
+        Pages are keyed by seq: pass the returned ``next_after`` to get the
+        next page. Only the rows of the requested page are read.
+        """
+        clauses, params = [], []
+        if session_id is not None:
+            clauses.append("json_extract(task, '$.session_id') = ?")
+            params.append(session_id)
+        if after is not None:
+            clauses.append("seq > ?")
+            params.append(after)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._connect().execute(
+            f"SELECT seq, queue_id, json_extract(task, '$.session_id'), json_extract(task, '$.model_name'), "
+            f"json_extract(task, '$.file_path'), created_at FROM queue {where} ORDER BY seq LIMIT ?",
+            (*params, limit + 1)
+        ).fetchall()
+        tasks = [
+            {'seq': seq, 'queue_id': queue_id, 'session_id': row_session, 'model_name': model_name,
+             'filename': os.path.basename(file_path or ''), 'created_at': created_at}
+            for seq, queue_id, row_session, model_name, file_path, created_at in rows[:limit]
+        ]
+        return {'tasks': tasks, 'next_after': tasks[-1]['seq'] if len(rows) > limit else None}
+
+    def get_task(self, queue_id: str) -> Optional[Dict[str, Any]]:
+        """Get a single queued task"""
+        row = self._connect().execute("SELECT task FROM queue WHERE queue_id = ?", (queue_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
     def get_results(self) -> Dict[str, Any]:
         """Get stored results"""
         try:
-            with open(self.results_file, 'r') as f:
-                return json.load(f)
+            rows = self._connect().execute("SELECT queue_id, result FROM results ORDER BY created_at").fetchall()
+            return {queue_id: _unpack(result) for queue_id, result in rows}
         except Exception as e:
-            logger.error(f"Error reading results file: {e}")
+            logger.error(f"Error reading results: {e}")
             return {}
-    
+
+    def get_result(self, queue_id: str) -> Optional[Any]:
+        """Get a single stored result"""
+        row = self._connect().execute("SELECT result FROM results WHERE queue_id = ?", (queue_id,)).fetchone()
+        return _unpack(row[0]) if row else None
+
+    def list_results(self, session_id: str = None, before: int = None, since: float = None,
+                     limit: int = 20) -> Dict[str, Any]:
+        """One page of results, newest first, with a text preview instead of the full transcript.
+
+        Pages are keyed by row id: pass the returned ``next_before`` to get the
+        next page. Only the rows of the requested page are read.
+        """
+        clauses, params = [], []
+        if session_id is not None:
+            clauses.append("session_id = ?")
+            params.append(session_id)
+        if before is not None:
+            clauses.append("rowid < ?")
+            params.append(before)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._connect().execute(
+            f"SELECT rowid, queue_id, result, created_at, session_id, model_name FROM results {where} "
+            "ORDER BY rowid DESC LIMIT ?",
+            (*params, limit + 1)
+        ).fetchall()
+        items = []
+        for rowid, queue_id, result, created_at, row_session, model_name in rows[:limit]:
+            text = _unpack(result)
+            text = text if isinstance(text, str) else json.dumps(text)
+            items.append({
+                'id': rowid,
+                'queue_id': queue_id,
+                'session_id': row_session,
+                'model_name': model_name,
+                'created_at': created_at,
+                'preview': text[:PREVIEW_CHARS],
+                'truncated': len(text) > PREVIEW_CHARS
+            })
+        return {'results': items, 'next_before': items[-1]['id'] if len(rows) > limit else None}
+
     def add_to_queue(self, task: Dict[str, Any]):
         """Add a task to the queue"""
-        queue_data = self.get_queue()
-        queue_data.append(task)
-        self._save_queue(queue_data)
-    
-    def remove_from_queue(self, queue_id: str) -> Dict[str, Any]:
-        """Remove and return a task from the queue"""
-        queue_data = self.get_queue()
-        for i, task in enumerate(queue_data):
-            if task['queue_id'] == queue_id:
-                removed_task = queue_data.pop(i)
-                self._save_queue(queue_data)
-                return removed_task
-        return None
-    
-    def save_result(self, queue_id: str, result: str):
-        """Save a transcription result"""
-        results = self.get_results()
-        results[queue_id] = result
-        self._save_results(results)
-    
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO queue (queue_id, task, created_at) VALUES (?, ?, ?)",
+                (task['queue_id'], json.dumps(task), time.time())
+            )
+
+    def requeue_task(self, task: Dict[str, Any]):
+        """Put a task that was dequeued but never started back at the head of the queue.
+
+        It keeps the time it was first queued, so max_wait aging still
+        applies. A task whose row is still here, as with the local and redis
+        brokers, keeps its row unchanged.
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO queue (seq, queue_id, task, created_at) "
+                "VALUES ((SELECT COALESCE(MIN(seq), 1) - 1 FROM queue), ?, ?, ?)",
+                (task['queue_id'], json.dumps(task), task.get('enqueued_at') or time.time())
+            )
+
+    def restore_dispatch(self, session_id: str):
+        """Undo the last claim's turn for a session whose task went back to the queue"""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE broker_sessions SET last_dispatch = previous_dispatch WHERE session_id = ?", (session_id,)
+            )
+
+    def reserve_batch(self, batch_id: str, session_id: str, queue_ids: List[str]) -> bool:
+        """Claim a batch ID and its member queue IDs, False if any of them is already in use"""
+        members = json.dumps(queue_ids)
+        with self._transaction() as conn:
+            taken = conn.execute(
+                """
+                SELECT 1 FROM batches WHERE batch_id = ?
+                UNION ALL
+                SELECT 1 FROM json_each(?) m
+                WHERE EXISTS (SELECT 1 FROM queue WHERE queue_id = m.value)
+                    OR EXISTS (SELECT 1 FROM results WHERE queue_id = m.value)
+                    OR EXISTS (SELECT 1 FROM running_tasks WHERE queue_id = m.value)
+                LIMIT 1
+                """,
+                (batch_id, members)
+            ).fetchone()
+            if taken:
+                return False
+            conn.execute(
+                "INSERT INTO batches (batch_id, session_id, queue_ids, created_at) VALUES (?, ?, ?, ?)",
+                (batch_id, session_id, members, time.time())
+            )
+        return True
+
+    def release_batch(self, batch_id: str):
+        """Drop a reserved batch whose submission failed"""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM batches WHERE batch_id = ?", (batch_id,))
+
+    def add_batch(self, batch_id: str, session_id: str, tasks: List[Dict[str, Any]], queue_ids: List[str] = None):
+        """Record a batch, possibly reserved beforehand, and queue all of its tasks in a single transaction"""
+        if queue_ids is None:
+            queue_ids = [task['queue_id'] for task in tasks]
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO batches (batch_id, session_id, queue_ids, created_at) VALUES (?, ?, ?, ?)",
+                (batch_id, session_id, json.dumps(queue_ids), now)
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO queue (queue_id, task, created_at) VALUES (?, ?, ?)",
+                [(task['queue_id'], json.dumps(task), now) for task in tasks]
+            )
+
+    def get_batch_progress(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """Aggregate state of a batch's tasks"""
+        conn = self._connect()
+        row = conn.execute("SELECT queue_ids FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+        if row is None:
+            return None
+        (completed,) = conn.execute(
+            "SELECT COUNT(*) FROM results WHERE queue_id IN (SELECT value FROM json_each(?))", row
+        ).fetchone()
+        (queued,) = conn.execute(
+            "SELECT COUNT(*) FROM queue WHERE queue_id IN (SELECT value FROM json_each(?))", row
+        ).fetchone()
+        total = len(json.loads(row[0]))
+        return {
+            'batch_id': batch_id,
+            'total': total,
+            'completed': completed,
+            'queued': queued,
+            'progress': completed / total * 100 if total else 100.0
+        }
+
+    def remove_from_queue(self, queue_id: str, scheduler_state: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Remove and return a task from the queue, saving the scheduler state alongside"""
+        with self._transaction() as conn:
+            if scheduler_state is not None:
+                self._save_scheduler_state(conn, scheduler_state)
+            row = conn.execute("SELECT task FROM queue WHERE queue_id = ?", (queue_id,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("DELETE FROM queue WHERE queue_id = ?", (queue_id,))
+        return json.loads(row[0])
+
+    def remove_many_from_queue(self, queue_ids: List[str]):
+        """Remove several tasks from the queue in one transaction"""
+        with self._transaction() as conn:
+            conn.executemany("DELETE FROM queue WHERE queue_id = ?", [(queue_id,) for queue_id in queue_ids])
+
+    def claim_next_task(self, short_seconds: float, long_seconds: float, max_wait: float,
+                        worker_id: str = None) -> Optional[Dict[str, Any]]:
+        """Atomically remove and return the next task for a worker, None if the queue is empty.
+
+        Used when several processes share this database as their queue.
+        Shorter priority classes go first, then the session served least
+        recently, then arrival order. A class whose oldest task has waited
+        longer than max_wait joins the first class, where it takes turns by
+        session rather than jumping the whole queue. With a worker_id the task
+        is marked running in the same transaction, so a cancel always finds it.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                """
+                WITH classed AS (
+                    SELECT queue_id, task, seq, created_at, json_extract(task, '$.session_id') AS session_id,
+                        CASE
+                            WHEN json_extract(task, '$.duration') IS NULL THEN 1
+                            WHEN json_extract(task, '$.duration') <= ? THEN 0
+                            WHEN json_extract(task, '$.duration') >= ? THEN 2
+                            ELSE 1
+                        END AS priority
+                    FROM queue
+                ), aged AS (
+                    SELECT *, MIN(created_at) OVER (PARTITION BY priority) <= ? AS overdue FROM classed
+                )
+                SELECT a.queue_id, a.task FROM aged a
+                LEFT JOIN broker_sessions s ON s.session_id = a.session_id
+                ORDER BY
+                    CASE WHEN a.overdue THEN 0 ELSE a.priority END,
+                    COALESCE(s.last_dispatch, 0),
+                    a.seq
+                LIMIT 1
+                """,
+                (short_seconds, long_seconds, now - max_wait)
+            ).fetchone()
+            if row is None:
+                return None
+            task = json.loads(row[1])
+            conn.execute("DELETE FROM queue WHERE queue_id = ?", (row[0],))
+            if worker_id is not None:
+                self._mark_running(conn, task, worker_id)
+            conn.execute(
+                "INSERT INTO broker_sessions (session_id, last_dispatch) VALUES (?, ?) "
+                "ON CONFLICT (session_id) DO UPDATE SET "
+                "previous_dispatch = last_dispatch, last_dispatch = excluded.last_dispatch",
+                (task['session_id'], now)
+            )
+        return task
+
+    def get_queue_positions(self) -> List[tuple]:
+        """(queue_id, session_id, 1-based arrival position) of every queued task"""
+        return self._connect().execute(
+            "SELECT queue_id, json_extract(task, '$.session_id'), ROW_NUMBER() OVER (ORDER BY seq) FROM queue"
+        ).fetchall()
+
+    def get_queue_position(self, queue_id: str) -> Optional[int]:
+        row = self._connect().execute(
+            "SELECT COUNT(*) FROM queue WHERE seq <= (SELECT seq FROM queue WHERE queue_id = ?)", (queue_id,)
+        ).fetchone()
+        return row[0] or None
+
+    def get_queue_size(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM queue").fetchone()[0]
+
+    def mark_running(self, task: Dict[str, Any], worker_id: str) -> bool:
+        """Record that a worker, possibly in another process, took a task.
+
+        Returns whether a cancel was already requested, while the task was on
+        its way from the queue to the worker.
+        """
+        with self._transaction() as conn:
+            self._mark_running(conn, task, worker_id)
+            (cancel_requested,) = conn.execute(
+                "SELECT cancel_requested FROM running_tasks WHERE queue_id = ?", (task['queue_id'],)
+            ).fetchone()
+        return bool(cancel_requested)
+
+    @staticmethod
+    def _mark_running(conn: sqlite3.Connection, task: Dict[str, Any], worker_id: str):
+        # An existing row keeps its cancel_requested flag. The task is kept so a
+        # dead worker's task can be queued again, see expire_running
+        now = time.time()
+        conn.execute(
+            "INSERT INTO running_tasks (queue_id, session_id, worker_id, started_at, audio_key, heartbeat_at, task) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (queue_id) DO UPDATE SET "
+            "worker_id = excluded.worker_id, started_at = excluded.started_at, audio_key = excluded.audio_key, "
+            "heartbeat_at = excluded.heartbeat_at, task = excluded.task",
+            (task['queue_id'], task['session_id'], worker_id, now, task.get('audio_key'), now, json.dumps(task))
+        )
+
+    def audio_key_in_use(self, audio_key: str) -> bool:
+        """Whether a queued or running task, in any process sharing this database, still reads the decoded audio"""
+        return bool(self._connect().execute(
+            "SELECT EXISTS (SELECT 1 FROM queue WHERE json_extract(task, '$.audio_key') = ?)"
+            " OR EXISTS (SELECT 1 FROM running_tasks WHERE audio_key = ?)",
+            (audio_key, audio_key)
+        ).fetchone()[0])
+
+    def mark_finished(self, queue_id: str):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM running_tasks WHERE queue_id = ?", (queue_id,))
+
+    def clear_running(self, worker_id: str = None):
+        """Forget tasks left behind by an earlier run of a worker process, or by every process"""
+        with self._transaction() as conn:
+            if worker_id is None:
+                conn.execute("DELETE FROM running_tasks")
+            else:
+                conn.execute("DELETE FROM running_tasks WHERE worker_id = ?", (worker_id,))
+
+    def heartbeat_running(self, worker_id: str):
+        """Show that a worker process is alive and still running its tasks"""
+        with self._transaction() as conn:
+            conn.execute("UPDATE running_tasks SET heartbeat_at = ? WHERE worker_id = ?", (time.time(), worker_id))
+
+    def expire_running(self, before: float) -> List[Tuple[Dict[str, Any], bool]]:
+        """Forget running tasks whose worker has not sent a heartbeat since before.
+
+        The worker was stopped or its container recreated under a new ID, so
+        nothing will finish or cancel these tasks. Returns (task, cancel
+        requested) for each one that has no result yet, so the caller can queue
+        it again or drop it. Rows written before running tasks were stored, for
+        tasks no longer in the queue table, come back with only their IDs.
+        """
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT r.queue_id, r.session_id, r.audio_key, "
+                "COALESCE(r.task, (SELECT task FROM queue WHERE queue_id = r.queue_id)), r.cancel_requested "
+                "FROM running_tasks r "
+                "WHERE COALESCE(r.heartbeat_at, r.started_at) < ? "
+                "AND NOT EXISTS (SELECT 1 FROM results WHERE queue_id = r.queue_id)",
+                (before,)
+            ).fetchall()
+            conn.execute("DELETE FROM running_tasks WHERE COALESCE(heartbeat_at, started_at) < ?", (before,))
+        return [
+            (json.loads(task) if task else {'queue_id': queue_id, 'session_id': session_id, 'audio_key': audio_key},
+             bool(cancel_requested))
+            for queue_id, session_id, audio_key, task, cancel_requested in rows
+        ]
+
+    def get_running_tasks(self, session_id: str = None) -> List[Dict[str, Any]]:
+        """Tasks being processed by any worker process"""
+        query = "SELECT queue_id, session_id, worker_id, started_at, cancel_requested FROM running_tasks"
+        params = ()
+        if session_id:
+            query += " WHERE session_id = ?"
+            params = (session_id,)
+        return [
+            {'queue_id': queue_id, 'session_id': sid, 'worker_id': worker_id,
+             'started_at': started_at, 'cancel_requested': bool(cancel_requested)}
+            for queue_id, sid, worker_id, started_at, cancel_requested
+            in self._connect().execute(query, params).fetchall()
+        ]
+
+    def request_cancel(self, queue_ids: List[str]):
+        """Flag running tasks for cancellation by whichever process runs them"""
+        with self._transaction() as conn:
+            conn.executemany(
+                "UPDATE running_tasks SET cancel_requested = 1 WHERE queue_id = ?",
+                [(queue_id,) for queue_id in queue_ids]
+            )
+
+    def request_cancel_dequeued(self, task: Dict[str, Any], worker_id: str):
+        """Flag a task a worker took from the queue but may not have marked running yet.
+
+        mark_running keeps the flag and reports it, so the worker drops the task.
+        """
+        with self._transaction() as conn:
+            now = time.time()
+            conn.execute(
+                "INSERT INTO running_tasks "
+                "(queue_id, session_id, worker_id, started_at, cancel_requested, audio_key, heartbeat_at, task) "
+                "VALUES (?, ?, ?, ?, 1, ?, ?, ?) "
+                "ON CONFLICT (queue_id) DO UPDATE SET cancel_requested = 1",
+                (task['queue_id'], task['session_id'], worker_id, now, task.get('audio_key'), now, json.dumps(task))
+            )
+
+    def is_cancel_requested(self, queue_id: str) -> bool:
+        row = self._connect().execute(
+            "SELECT cancel_requested FROM running_tasks WHERE queue_id = ?", (queue_id,)
+        ).fetchone()
+        return bool(row and row[0])
+
+    def add_event(self, event: str, data: Dict[str, Any], room: str = None):
+        """Queue a Socket.IO event for delivery by the web processes"""
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO events (event, room, data, created_at) VALUES (?, ?, ?, ?)",
+                (event, room, json.dumps(data), time.time())
+            )
+
+    def get_last_event_id(self) -> int:
+        return self._connect().execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+
+    def get_events_after(self, event_id: int, limit: int = 500) -> List[tuple]:
+        """(id, event, room, data) of events newer than event_id, oldest first"""
+        rows = self._connect().execute(
+            "SELECT id, event, room, data FROM events WHERE id > ? ORDER BY id LIMIT ?", (event_id, limit)
+        ).fetchall()
+        return [(row_id, event, room, json.loads(data)) for row_id, event, room, data in rows]
+
+    def prune_events(self, max_age: float):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM events WHERE created_at < ?", (time.time() - max_age,))
+
+    def get_store_id(self) -> str:
+        """Random id of this job database, created on first use, telling separate databases apart"""
+        with self._transaction() as conn:
+            conn.execute("INSERT OR IGNORE INTO store_identity (id, store_id) VALUES (1, ?)", (uuid.uuid4().hex,))
+            return conn.execute("SELECT store_id FROM store_identity WHERE id = 1").fetchone()[0]
+
+    def get_scheduler_state(self) -> Optional[Dict[str, Any]]:
+        """Fair-share scheduler state saved at the last dispatch"""
+        row = self._connect().execute("SELECT state FROM scheduler_state WHERE id = 1").fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _save_scheduler_state(self, conn: sqlite3.Connection, state: Dict[str, Any]):
+        conn.execute(
+            "INSERT OR REPLACE INTO scheduler_state (id, state, updated_at) VALUES (1, ?, ?)",
+            (json.dumps(state), time.time())
+        )
+
+    def replace_queue(self, tasks: List[Dict[str, Any]]):
+        """Atomically replace the stored queue with the given tasks"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM queue")
+            conn.executemany(
+                "INSERT OR REPLACE INTO queue (queue_id, task, created_at) VALUES (?, ?, ?)",
+                [(task['queue_id'], json.dumps(task), now) for task in tasks]
+            )
+
+    def save_result(self, queue_id: str, result: str, session_id: str = None, model_name: str = None):
+        """Save a transcription result, compressed"""
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results (queue_id, result, created_at, session_id, model_name) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (queue_id, _pack(result), time.time(), session_id, model_name)
+            )
+
+    def get_cached_result(self, cache_key: str, max_age: float = None) -> Optional[Any]:
+        """Look up a cached result and mark it as recently used"""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT result, created_at FROM result_cache WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if max_age is not None and now - row[1] > max_age:
+                conn.execute("DELETE FROM result_cache WHERE cache_key = ?", (cache_key,))
+                return None
+            conn.execute("UPDATE result_cache SET accessed_at = ? WHERE cache_key = ?", (now, cache_key))
+        return _unpack(row[0])
+
+    def cache_result(self, cache_key: str, result: Any):
+        """Store a result in the content-hash cache"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO result_cache (cache_key, result, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (cache_key, _pack(result), now, now)
+            )
+
+    def evict_cached_results(self, max_entries: int, max_age: float = None) -> int:
+        """Drop expired cache entries, then least recently used ones beyond max_entries"""
+        with self._transaction() as conn:
+            evicted = 0
+            if max_age is not None:
+                evicted += conn.execute(
+                    "DELETE FROM result_cache WHERE created_at < ?", (time.time() - max_age,)
+                ).rowcount
+            (count,) = conn.execute("SELECT COUNT(*) FROM result_cache").fetchone()
+            if count > max_entries:
+                evicted += conn.execute(
+                    "DELETE FROM result_cache WHERE cache_key IN "
+                    "(SELECT cache_key FROM result_cache ORDER BY accessed_at LIMIT ?)",
+                    (count - max_entries,)
+                ).rowcount
+        return evicted
+
+    def create_upload(self, upload_id: str, upload: Dict[str, Any]):
+        """Record a new resumable upload session"""
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO uploads (upload_id, upload, created_at) VALUES (?, ?, ?)",
+                (upload_id, json.dumps(upload), time.time())
+            )
+
+    def get_upload(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        """Get a resumable upload session, with its status: open, finalizing or finalized"""
+        row = self._connect().execute(
+            "SELECT upload, status FROM uploads WHERE upload_id = ?", (upload_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        upload = json.loads(row[0])
+        upload['status'] = row[1]
+        return upload
+
+    def claim_upload(self, upload_id: str) -> Optional[str]:
+        """Move an open upload to finalizing, returning the status it had before, or None if unknown.
+
+        Only the caller that sees 'open' owns the finalization.
+        """
+        with self._transaction() as conn:
+            row = conn.execute("SELECT status FROM uploads WHERE upload_id = ?", (upload_id,)).fetchone()
+            if row is None:
+                return None
+            if row[0] == 'open':
+                conn.execute("UPDATE uploads SET status = 'finalizing' WHERE upload_id = ?", (upload_id,))
+            return row[0]
+
+    def set_upload_status(self, upload_id: str, status: str):
+        """Record that a claimed upload was finalized, or reopen it after a failed finalization"""
+        with self._transaction() as conn:
+            conn.execute("UPDATE uploads SET status = ? WHERE upload_id = ?", (status, upload_id))
+
+    def record_upload_chunk(self, upload_id: str, offset: int, length: int):
+        """Mark a chunk of a resumable upload as written"""
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO upload_chunks (upload_id, chunk_offset, length) VALUES (?, ?, ?)",
+                (upload_id, offset, length)
+            )
+
+    def get_upload_chunks(self, upload_id: str) -> Dict[int, int]:
+        """Offsets and lengths of the chunks written so far"""
+        rows = self._connect().execute(
+            "SELECT chunk_offset, length FROM upload_chunks WHERE upload_id = ?", (upload_id,)
+        ).fetchall()
+        return dict(rows)
+
+    def delete_upload(self, upload_id: str):
+        """Forget a resumable upload session and its chunks"""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM upload_chunks WHERE upload_id = ?", (upload_id,))
+            conn.execute("DELETE FROM uploads WHERE upload_id = ?", (upload_id,))
+
+    def get_stale_uploads(self, created_before: float) -> List[Dict[str, Any]]:
+        """Upload sessions started before the given timestamp"""
+        rows = self._connect().execute(
+            "SELECT upload FROM uploads WHERE created_at < ?", (created_before,)
+        ).fetchall()
+        return [json.loads(upload) for (upload,) in rows]
+
     def clear_queue(self):
         """Clear the entire queue"""
-        self._save_queue([])
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM queue")
+
+# Time every public operation, one histogram series per method
+for _name, _method in list(vars(PersistentStorage).items()):
+    if callable(_method) and not _name.startswith('_') and _name != 'start_compaction':
+        setattr(PersistentStorage, _name, timed(STORAGE_SECONDS.labels(_name))(_method))
 
 # Create a global instance
-persistent_storage = PersistentStorage() 
\ No newline at end of file
+persistent_storage = PersistentStorage(Config.STORAGE_DIR, Config.STORAGE_COMPACTION_INTERVAL)
@@ -0,0 +1,93 @@
+import threading
+import logging
+from typing import Callable, Dict, Iterable
+from app.services.scheduler import TaskScheduler
+
+logger = logging.getLogger(__name__)
+
+class PositionBroadcaster:
+    """Coalesce queue position changes into one update per session per tick.
+
+    Callers only mark sessions as dirty; a background thread wakes at most
+    every ``interval`` seconds, looks up the current positions of the dirty
+    sessions and emits a single ``queue_positions`` event to each of them,
+    containing only the positions that changed since the last update.
+    """
+
+    def __init__(self, scheduler: TaskScheduler, emit: Callable[..., None], interval: float = 1.0):
+        self.scheduler = scheduler
+        self.emit = emit
+        self.interval = interval
+        self._dirty = set()
+        self._all_dirty = False
+        self._sent = {}  # session_id -> {queue_id: last position sent}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.is_running = False
+        self.stats = {'ticks': 0, 'events': 0, 'positions': 0}
+
+    def start(self):
+        if not self.is_running:
+            self.is_running = True
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='queue-positions', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self.is_running = False
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def mark(self, session_ids: Iterable[str] = None):
+        """Schedule an update for some sessions, or for every queued session by default"""
+        with self._lock:
+            if session_ids is None:
+                self._all_dirty = True
+            else:
+                self._dirty.update(session_ids)
+        self._wakeup.set()
+
+    def _run(self):
+        while self.is_running:
+            self._wakeup.wait()
+            if not self.is_running:
+                break
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error broadcasting queue positions: {str(e)}")
+            # Rate limit: further changes during the pause are merged into the next tick
+            self._stopped.wait(self.interval)
+
+    def flush(self):
+        """Emit pending position changes now"""
+        with self._lock:
+            sessions, self._dirty = self._dirty, set()
+            if self._all_dirty:
+                self._all_dirty = False
+                sessions = set(self.scheduler.sessions()) | set(self._sent)
+        if not sessions:
+            return
+        self.stats['ticks'] += 1
+        current = self.scheduler.positions(sessions)
+        for session_id in sessions:
+            positions = current.get(session_id, {})
+            sent = self._sent.get(session_id, {})
+            changed = {queue_id: pos for queue_id, pos in positions.items() if sent.get(queue_id) != pos}
+            if positions:
+                self._sent[session_id] = positions
+            else:
+                self._sent.pop(session_id, None)
+            if changed:
+                self.emit('queue_positions', {'positions': changed}, to=session_id)
+                self.stats['events'] += 1
+                self.stats['positions'] += len(changed)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {**self.stats, 'interval': self.interval}
@@ -0,0 +1,107 @@
+import importlib
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+# Called with (frames done, total frames, segments decoded so far)
+ProgressListener = Callable[[int, int, List[Dict[str, Any]]], None]
+
+_local = threading.local()
+_install_lock = threading.Lock()
+_installed = False
+
+class _ProgressBar:
+    """Stand-in for the tqdm bar whisper.transcribe drives while decoding.
+
+    Whisper advances the bar by the number of mel frames consumed after every
+    30 second window, and appends the window's segments to its local
+    ``all_segments`` list just before, so both are forwarded to the listener.
+    """
+
+    def __init__(self, listener: ProgressListener, segments: List[Dict[str, Any]], total: int = None, **kwargs):
+        self.listener = listener
+        self.segments = segments
+        self.total = total or 0
+        self.n = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def update(self, n: int = 1):
+        self.n += n
+        self.listener(self.n, self.total, self.segments)
+
+    def close(self):
+        pass
+
+class _TqdmProxy:
+    """Replaces the ``tqdm`` module reference inside whisper.transcribe"""
+
+    def __init__(self, tqdm_module):
+        self._tqdm = tqdm_module
+
+    def tqdm(self, *args, **kwargs):
+        listener = getattr(_local, 'listener', None)
+        if listener is None:
+            return self._tqdm.tqdm(*args, **kwargs)
+        # The caller is whisper's transcribe(); its segment list is filled in place
+        segments = sys._getframe(1).f_locals.get('all_segments', [])
+        return _ProgressBar(listener, segments, total=kwargs.get('total'))
+
+    def __getattr__(self, name):
+        return getattr(self._tqdm, name)
+
+def _install():
+    global _installed
+    with _install_lock:
+        if not _installed:
+            module = importlib.import_module('whisper.transcribe')
+            module.tqdm = _TqdmProxy(module.tqdm)
+            _installed = True
+
+def current_listener() -> Optional[ProgressListener]:
+    """The listener installed by whisper_progress for this thread, for engines that report progress themselves"""
+    return getattr(_local, 'listener', None)
+
+@contextmanager
+def whisper_progress(listener: ProgressListener):
+    """Report the progress of model.transcribe calls made by this thread to listener"""
+    _install()
+    previous = getattr(_local, 'listener', None)
+    _local.listener = listener
+    try:
+        yield
+    finally:
+        _local.listener = previous
+
+class ProgressReporter:
+    """Throttle progress updates and estimate the time remaining.
+
+    ``emit`` receives the completed fraction and the ETA in seconds (None
+    until there is something to extrapolate from).
+    """
+
+    def __init__(self, emit: Callable[[float, Optional[float]], None], interval: float = 1.0):
+        self.emit = emit
+        self.interval = interval
+        self.started = time.monotonic()
+        self._last_emit = None
+        self._lock = threading.Lock()
+
+    def update(self, fraction: float, force: bool = False) -> bool:
+        """Emit if the interval has passed or force is set, returns whether it did"""
+        fraction = min(max(fraction, 0.0), 1.0)
+        now = time.monotonic()
+        with self._lock:
+            if not force and self._last_emit is not None and now - self._last_emit < self.interval:
+                return False
+            self._last_emit = now
+        elapsed = now - self.started
+        eta = elapsed * (1 - fraction) / fraction if fraction > 0 else None
+        self.emit(fraction, eta)
+        return True
@@ -1,185 +1,788 @@
+import os
 import queue
+import socket
+import time
 import threading
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Callable, List, Optional
 from flask import current_app
-from app import socketio
-from app.services.transcription import TranscriptionService, VALID_MODELS
+from app.core.config import Config
+from app.core.metrics import REGISTRY, QUEUE_WAIT_SECONDS, JOBS_TOTAL, flatten_stats
+from app.core.cpu import CpuPlacement
+from app.services.transcription import TranscriptionService, VALID_MODELS, model_memory_mb
+from app.services.audio import audio_cache, probe_duration
 from app.services.persistent_storage import persistent_storage
+from app.services.result_cache import result_cache
+from app.services.broker import create_broker
+from app.services.scheduler import priority_class
+from app.services.engines import resolve_engine, model_key
+from app.services.cancellation import CancellationToken, TaskCancelled, CANCELLED, PREEMPTED
+from app.services import events
+from app.services.positions import PositionBroadcaster
 import traceback
 
 logger = logging.getLogger(__name__)
 
+class ModelAdmission:
+    """Gate concurrent transcriptions by per-model caps and a shared memory budget.
+
+    A task that timed out waiting can reserve its model's share of the
+    budget. While the oldest reservation stands, other tasks are only
+    admitted if they leave room for it, so a large model is not starved by a
+    stream of smaller ones that never let the budget drain.
+    """
+
+    def __init__(self, memory_budget_mb: int, model_limits: Dict[str, int] = None):
+        self.memory_budget_mb = memory_budget_mb
+        self.model_limits = model_limits or {}
+        self.used_mb = 0
+        self.running = {}
+        self._reservations = {}  # queue_id -> (model_name, enqueued_at) of tasks that timed out waiting
+        self._condition = threading.Condition()
+
+    def _reserved_model(self, queue_id: Optional[str]) -> Optional[str]:
+        """Model of the oldest reservation, None if there is none or queue_id holds it"""
+        if not self._reservations:
+            return None
+        owner, (model_name, _) = min(self._reservations.items(), key=lambda item: item[1][1])
+        return None if owner == queue_id else model_name
+
+    def _can_admit(self, model_name: str, queue_id: str = None) -> bool:
+        limit = self.model_limits.get(model_name)
+        if limit is not None and self.running.get(model_name, 0) >= limit:
+            return False
+        reserved = self._reserved_model(queue_id)
+        if reserved is not None:
+            return self.used_mb + model_memory_mb(model_name) + model_memory_mb(reserved) <= self.memory_budget_mb
+        # A model bigger than the whole budget may still run on its own
+        if self.used_mb == 0:
+            return True
+        return self.used_mb + model_memory_mb(model_name) <= self.memory_budget_mb
+
+    def fits(self, model_name: str, queue_id: str = None) -> bool:
+        """Whether a job for model_name would be admitted right now"""
+        with self._condition:
+            return self._can_admit(model_name, queue_id)
+
+    def acquire(self, model_name: str, timeout: float = None, queue_id: str = None) -> bool:
+        """Block until a job for model_name fits, returns False on timeout"""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._can_admit(model_name, queue_id), timeout=timeout):
+                return False
+            self.used_mb += model_memory_mb(model_name)
+            self.running[model_name] = self.running.get(model_name, 0) + 1
+            return True
+
+    def reserve(self, queue_id: str, model_name: str, enqueued_at: float):
+        """Hold back budget for a task that could not be admitted, until it is or unreserve is called"""
+        with self._condition:
+            self._reservations[queue_id] = (model_name, enqueued_at)
+
+    def unreserve(self, queue_id: str):
+        with self._condition:
+            if self._reservations.pop(queue_id, None) is not None:
+                self._condition.notify_all()
+
+    def prune(self, pending: Callable[[str], bool]):
+        """Drop reservations of tasks that are no longer pending, e.g. claimed by another process"""
+        with self._condition:
+            queue_ids = list(self._reservations)
+        # Checked without the lock, pending may query the job database
+        for queue_id in queue_ids:
+            if not pending(queue_id):
+                self.unreserve(queue_id)
+
+    def acquire_extra(self, model_name: str, count: int) -> int:
+        """Grab up to count additional slots without waiting, returns how many were granted"""
+        granted = 0
+        while granted < count and self.acquire(model_name, timeout=0):
+            granted += 1
+        return granted
+
+    def release(self, model_name: str):
+        with self._condition:
+            self.used_mb -= model_memory_mb(model_name)
+            self.running[model_name] -= 1
+            if not self.running[model_name]:
+                del self.running[model_name]
+            self._condition.notify_all()
+
 class QueueManager:
-    def __init__(self):
-        self.task_queue = queue.Queue()
-        self.processing_thread = None
+    def __init__(self, num_workers: int = 1, run_workers: bool = True):
+        # Identifies this process's workers in the shared running_tasks table
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.task_queue = create_broker(
+            Config.QUEUE_BROKER,
+            persistent_storage,
+            Config.BROKER_URL,
+            mode=Config.SCHEDULING_MODE,
+            max_batch=Config.AFFINITY_MAX_BATCH,
+            max_wait=Config.AFFINITY_MAX_WAIT,
+            quantum=Config.FAIR_QUANTUM,
+            weights=Config.SESSION_WEIGHTS,
+            short_seconds=Config.PRIORITY_SHORT_SECONDS,
+            long_seconds=Config.PRIORITY_LONG_SECONDS,
+            worker_id=self.worker_id
+        )
+        self.positions = PositionBroadcaster(self.task_queue, events.emit, Config.QUEUE_POSITION_INTERVAL)
+        self.num_workers = max(1, num_workers)
+        # Web processes in front of an external broker leave the work to separate worker processes
+        self.run_workers = run_workers
+        # Cores kept for web request threads; standalone workers have none to serve
+        self.reserved_cores = Config.CPU_RESERVED_CORES
+        self.placement = None
+        self.worker_threads = []
         self.is_running = False
-        self.transcription_service = TranscriptionService()
-        self._app_context = None
-        self.current_task = None
+        self.admission = ModelAdmission(Config.MODEL_MEMORY_BUDGET_MB, Config.MODEL_CONCURRENCY)
+        self.transcription_service = TranscriptionService(self.admission)
+        self._app = None
+        self.current_tasks = {}  # worker name -> task being processed
+        self.tokens = {}  # queue_id -> cancellation token of a task being processed here
         self.processing_lock = threading.Lock()
         self._restore_queue()
 
     def _restore_queue(self):
         """Restore queue from persistent storage"""
+        if self.task_queue.durable:
+            return
         stored_queue = persistent_storage.get_queue()
         for task in stored_queue:
             self.task_queue.put(task)
+        self.task_queue.import_state(persistent_storage.get_scheduler_state())
         logger.info(f"Restored {len(stored_queue)} tasks from persistent storage")
 
+    @property
+    def current_task(self):
+        """The first in-flight task, kept for single-worker callers"""
+        with self.processing_lock:
+            return next(iter(self.current_tasks.values()), None)
+
     def start(self):
-        """Start the queue processing thread"""
+        """Start the queue worker threads"""
         if not self.is_running:
             if not current_app:
                 raise RuntimeError("Queue manager must be started within an application context")
             
             self.is_running = True
-            self._app_context = current_app._get_current_object().app_context()
+            self._app = current_app._get_current_object()
+            if not self.run_workers:
+                if not self.task_queue.durable:
+                    logger.warning("Workers are disabled but the local queue is not shared; tasks will not run")
+                logger.info(f"Queue manager started without workers ({self.task_queue.mode} broker)")
+                return
+            if self.task_queue.durable:
+                persistent_storage.clear_running(self.worker_id)
+            else:
+                # Nothing else uses a local queue, so every running task is left over from an
+                # earlier run, whatever its worker ID; the restored queue still holds them
+                persistent_storage.clear_running()
+            # Before any model loads, which size their thread pools from it
+            self.placement = CpuPlacement(self.num_workers, self.reserved_cores, Config.CPU_PINNING,
+                                          Config.TORCH_THREADS)
+            self.placement.configure_torch(Config.TORCH_INTEROP_THREADS)
+            self.transcription_service.placement = self.placement
+            logger.info(f"CPU placement: {self.placement.get_stats()}")
+            self.transcription_service.start_warmup(Config.MODEL_WARMUP, self._app)
+            self.positions.start()
             
-            self.processing_thread = threading.Thread(target=self._process_queue)
-            self.processing_thread.daemon = True
-            self.processing_thread.start()
-            logger.info("Queue manager started")
+            for i in range(self.num_workers):
+                worker = threading.Thread(target=self._process_queue, args=(i,), name=f"transcription-worker-{i}")
+                worker.daemon = True
+                worker.start()
+                self.worker_threads.append(worker)
+            threading.Thread(target=self._heartbeat_loop, name='running-heartbeat', daemon=True).start()
+            logger.info(f"Queue manager started with {self.num_workers} workers")
 
     def stop(self):
-        """Stop the queue processing thread"""
+        """Stop the queue worker threads"""
         self.is_running = False
-        if self.processing_thread:
-            self.processing_thread.join()
-            logger.info("Queue manager stopped")
+        for worker in self.worker_threads:
+            worker.join()
+        self.worker_threads = []
+        self.positions.stop()
+        logger.info("Queue manager stopped")
 
     def clear_queue(self, session_id: str = None):
         """Clear all tasks from the queue and stop current processing"""
         with self.processing_lock:
-            # Stop current processing
-            if self.current_task and (not session_id or self.current_task['session_id'] == session_id):
-                logger.info("Stopping current task processing")
-                socketio.emit('task_cancelled', {
-                    'queue_id': self.current_task['queue_id']
-                }, to=self.current_task['session_id'])
+            # Stop current processing, in this process or any other sharing the job database
+            running_tasks = persistent_storage.get_running_tasks(session_id)
+            persistent_storage.request_cancel([task['queue_id'] for task in running_tasks])
+            for current_task in running_tasks:
+                logger.info(f"Stopping current task processing: {current_task['queue_id']}")
+                # Workers in this process stop at the next window without waiting for the poll
+                token = self.tokens.get(current_task['queue_id'])
+                if token:
+                    token.cancel(CANCELLED)
+                events.emit('task_cancelled', {
+                    'queue_id': current_task['queue_id']
+                }, to=current_task['session_id'])
             
             # Clear the queue
-            stored_tasks = []
-            while not self.task_queue.empty():
-                try:
-                    task = self.task_queue.get_nowait()
-                    if not session_id or task['session_id'] == session_id:
-                        socketio.emit('task_cancelled', {
-                            'queue_id': task['queue_id']
-                        }, to=task['session_id'])
-                        logger.info(f"Removed task from queue: {task['queue_id']}")
-                    else:
-                        stored_tasks.append(task)
-                except queue.Empty:
-                    break
+            if session_id:
+                removed_tasks = self.task_queue.remove_session(session_id)
+            else:
+                removed_tasks = self.task_queue.remove_where(lambda task: True)
+            # Update persistent storage first, the audio cache checks it for other users of an entry
+            persistent_storage.remove_many_from_queue([task['queue_id'] for task in removed_tasks])
+            for task in removed_tasks:
+                self.admission.unreserve(task['queue_id'])
+                self._release_upload(task)
+                events.emit('task_cancelled', {
+                    'queue_id': task['queue_id']
+                }, to=task['session_id'])
+                logger.info(f"Removed task from queue: {task['queue_id']}")
             
-            # Update persistent storage
-            persistent_storage._save_queue(stored_tasks)
+            if removed_tasks:
+                self.positions.mark()
             logger.info("Queue cleared")
 
-    def add_task(self, file_path: str, session_id: str, model_name: str = 'base', queue_id: str = None):
-        """Add a new transcription task to the queue"""
+    def cancel_task(self, queue_id: str, session_id: str) -> Optional[str]:
+        """Cancel one of a session's tasks.
+
+        Returns 'cancelled' for a task taken off the queue, 'cancelling' for a
+        running one, which stops at its next decode window, and None when the
+        session has no such task.
+        """
+        with self.processing_lock:
+            queued = persistent_storage.get_task(queue_id)
+            if queued and queued['session_id'] == session_id:
+                task = self.task_queue.remove(queue_id)
+                if task:
+                    persistent_storage.remove_many_from_queue([queue_id])
+                    self.admission.unreserve(queue_id)
+                    self._release_upload(task)
+                    events.emit('task_cancelled', {'queue_id': queue_id}, to=session_id)
+                    self.positions.mark()
+                    logger.info(f"Removed task from queue: {queue_id}")
+                    return 'cancelled'
+                # Stored but no longer in the broker: a worker took it and may not have registered it yet
+                persistent_storage.request_cancel_dequeued(queued, self.worker_id)
+            elif any(task['queue_id'] == queue_id for task in persistent_storage.get_running_tasks(session_id)):
+                persistent_storage.request_cancel([queue_id])
+            else:
+                return None
+            token = self.tokens.get(queue_id)
+            if token:
+                token.cancel(CANCELLED)
+            events.emit('task_cancelled', {'queue_id': queue_id}, to=session_id)
+            logger.info(f"Stopping current task processing: {queue_id}")
+            return 'cancelling'
+
+    def _priority_of(self, task: Dict[str, Any]) -> int:
+        return priority_class(task.get('duration'), Config.PRIORITY_SHORT_SECONDS, Config.PRIORITY_LONG_SECONDS)
+
+    def _maybe_preempt(self, task: Dict[str, Any]):
+        """Interrupt a lower-priority task when a new one would otherwise wait for a busy worker.
+
+        The victim is checkpointed and requeued, and its priority class keeps
+        it behind the task that displaced it. A task is preempted at most
+        MAX_PREEMPTIONS times so long jobs still finish under a steady stream
+        of short ones.
+        """
+        if not (Config.PREEMPTION and self.run_workers and self.is_running):
+            return
+        # Only the fair scheduler and the shared brokers run by priority class
+        if self.task_queue.mode in ('fifo', 'affinity'):
+            return
+        priority = self._priority_of(task)
+        with self.processing_lock:
+            if len(self.current_tasks) < self.num_workers:
+                return
+            candidates = [
+                running for running in self.current_tasks.values()
+                if self._priority_of(running) > priority
+                # Still waiting for admission, nothing to interrupt
+                and 'started_at' in running
+                and running.get('preemptions', 0) < Config.MAX_PREEMPTIONS
+                and running['queue_id'] in self.tokens
+                and not self.tokens[running['queue_id']].cancelled
+            ]
+            if not candidates:
+                return
+            # Least urgent first, then the one that started last and has the least to lose
+            victim = max(candidates, key=lambda running: (self._priority_of(running), running.get('started_at', 0)))
+            if self.tokens[victim['queue_id']].cancel(PREEMPTED):
+                logger.info(f"Preempting {victim['queue_id']} for {task['queue_id']}")
+
+    def _requeue_preempted(self, task: Dict[str, Any], checkpoint: Optional[Dict[str, Any]]):
+        """Put a preempted task back in the queue so it resumes from its checkpoint"""
+        task['checkpoint'] = checkpoint
+        task['preemptions'] = task.get('preemptions', 0) + 1
+        task['enqueued_at'] = time.time()
+        task.pop('started_at', None)
+        persistent_storage.add_to_queue(task)
+        self.task_queue.put(task)
+        self.positions.mark()
+        events.emit('queue_update', {
+            'position': self.task_queue.position(task['queue_id']),
+            'status': 'queued',
+            'queue_id': task['queue_id'],
+            'preempted': True
+        }, to=task['session_id'])
+
+    def _put_back(self, task: Dict[str, Any], refund: bool):
+        """Return a dequeued task that has not started to the head of the queue, keeping its age.
+
+        With ``refund`` the scheduler gives back what dispatching it charged
+        the session; tasks taken with remove_where were never charged.
+        """
+        persistent_storage.requeue_task(task)
+        self.task_queue.requeue(task, refund)
+        self.positions.mark()
+
+    def _is_pending(self, queue_id: str) -> bool:
+        """Whether a task is still waiting to run, in the queue or held by a worker here"""
+        with self.processing_lock:
+            if queue_id in self.tokens:
+                return True
+        return persistent_storage.get_task(queue_id) is not None
+
+    def _register(self, task: Dict[str, Any]) -> CancellationToken:
+        """Make a task taken from the broker cancellable before it waits for a batch or for admission"""
+        queue_id = task['queue_id']
+        token = CancellationToken(
+            lambda: persistent_storage.is_cancel_requested(queue_id), Config.CANCEL_POLL_INTERVAL
+        )
+        # cancel_task flags a task it finds stored but gone from the broker, and marking it running keeps
+        # that flag; the SQLite broker claims and marks running in one transaction
+        with self.processing_lock:
+            self.tokens[queue_id] = token
+            if persistent_storage.mark_running(task, self.worker_id):
+                token.cancel(CANCELLED)
+        return token
+
+    def _unregister(self, task: Dict[str, Any], token: CancellationToken):
+        with self.processing_lock:
+            # A requeued task may already be held by another worker
+            if self.tokens.get(task['queue_id']) is token:
+                del self.tokens[task['queue_id']]
+
+    def _drop_cancelled(self, task: Dict[str, Any]):
+        """Finish a task cancelled before it started; the canceller already told the client"""
+        logger.info(f"Dropping task cancelled before it started: {task['queue_id']}")
+        self.admission.unreserve(task['queue_id'])
+        JOBS_TOTAL.labels(task['model_name'], 'cancelled').inc()
+        persistent_storage.remove_from_queue(task['queue_id'])
+        persistent_storage.mark_finished(task['queue_id'])
+        self._release_upload(task)
+
+    def _unclaim(self, task: Dict[str, Any], token: CancellationToken, refund: bool = False):
+        """Give up a task that has not started, dropping it instead if it was cancelled meanwhile"""
+        self._unregister(task, token)
+        if token.cancelled:
+            self._drop_cancelled(task)
+            return
+        with self.processing_lock:
+            # Leave running_tasks first, a cancel must find the task in the queue again
+            persistent_storage.mark_finished(task['queue_id'])
+            self._put_back(task, refund)
+
+    def _admit(self, batch: List[Dict[str, Any]], tokens: Dict[str, CancellationToken]) -> List[Dict[str, Any]]:
+        """Wait for the batch's model to fit, or swap the batch for a queued task that fits now.
+
+        Returns the admitted tasks that were not cancelled while waiting,
+        possibly none. Waiting without a limit would hold the worker on a task
+        that cannot run while smaller jobs queued behind it could use the free
+        budget. A batch that times out goes back to the head of the queue and
+        reserves its model's budget, so the jobs run meanwhile cannot keep it
+        waiting forever.
+        """
+        head = batch[0]
+        model_name = head['model_name']
+        if not self.admission.acquire(model_name, timeout=Config.ADMISSION_TIMEOUT, queue_id=head['queue_id']):
+            logger.info(f"{model_name} does not fit after {Config.ADMISSION_TIMEOUT}s, "
+                        f"returning {[task['queue_id'] for task in batch]} to the queue")
+            self.admission.reserve(head['queue_id'], model_name, head.get('enqueued_at') or time.time())
+            # In reverse so the batch keeps its order at the head; only the first task was dispatched by get
+            for index in reversed(range(len(batch))):
+                self._unclaim(batch[index], tokens[batch[index]['queue_id']], refund=index == 0)
+            self.admission.prune(self._is_pending)
+            batch = self.task_queue.remove_where(
+                lambda queued: self.admission.fits(queued['model_name'], queued['queue_id']), limit=1
+            )
+            if not batch:
+                return []
+            tokens[batch[0]['queue_id']] = self._register(batch[0])
+            model_name = batch[0]['model_name']
+            if not self.admission.acquire(model_name, timeout=0, queue_id=batch[0]['queue_id']):
+                # Another worker took the budget in the meantime
+                self._unclaim(batch[0], tokens[batch[0]['queue_id']])
+                return []
+
+        admitted = []
+        for task in batch:
+            self.admission.unreserve(task['queue_id'])
+            if tokens[task['queue_id']].cancelled:
+                self._unregister(task, tokens[task['queue_id']])
+                self._drop_cancelled(task)
+            else:
+                admitted.append(task)
+        if not admitted:
+            self.admission.release(model_name)
+        return admitted
+
+    def build_task(self, file_path: str, session_id: str, model_name: str = 'base', queue_id: str = None,
+                   language: str = 'en', whisper_task: str = 'transcribe', content_hash: str = None,
+                   batch_id: str = None, keep_file: bool = False, engine: str = None) -> Dict[str, Any]:
+        """Create a validated task record"""
         if model_name not in VALID_MODELS:
             raise ValueError(f"Invalid model name. Must be one of: {', '.join(VALID_MODELS)}")
-            
-        task = {
+
+        return {
             'file_path': file_path,
             'session_id': session_id,
             'model_name': model_name,
-            'queue_id': queue_id
+            'queue_id': queue_id,
+            'language': language,
+            'whisper_task': whisper_task,
+            # Resolved now so the result is cached under the engine that actually ran
+            'engine': resolve_engine(model_name, engine),
+            'content_hash': content_hash,
+            'audio_key': audio_cache.key_for(file_path, content_hash),
+            # Sets the task's priority class and fair-share cost
+            'duration': probe_duration(file_path, Config.FFPROBE_BINARY),
+            'batch_id': batch_id,
+            # Server-side imports point at files we do not own
+            'keep_file': keep_file,
+            'enqueued_at': time.time()
         }
-        self.task_queue.put(task)
-        
-        # Save to persistent storage
+
+    def add_task(self, file_path: str, session_id: str, model_name: str = 'base', queue_id: str = None,
+                 language: str = 'en', whisper_task: str = 'transcribe', content_hash: str = None,
+                 engine: str = None):
+        """Add a new transcription task to the queue"""
+        task = self.build_task(file_path, session_id, model_name, queue_id, language, whisper_task, content_hash,
+                               engine=engine)
+
+        # Persist before queueing so a worker cannot finish the task before it is stored
         persistent_storage.add_to_queue(task)
+        self.task_queue.put(task)
+        self._maybe_preempt(task)
         
-        queue_size = self.task_queue.qsize()
-        logger.info(f"Added task to queue. Current queue size: {queue_size}")
+        logger.info(f"Added task to queue. Current queue size: {self.task_queue.qsize()}")
         
-        socketio.emit('queue_update', {
-            'position': queue_size,
+        events.emit('queue_update', {
+            'position': self.task_queue.position(queue_id),
             'status': 'queued',
             'queue_id': queue_id
         }, to=session_id)
 
-    def _process_queue(self):
-        """Process tasks from the queue"""
-        with self._app_context:
-            logger.info("Queue processing thread started with app context")
+    def add_batch(self, batch_id: str, session_id: str, tasks: List[Dict[str, Any]], queue_ids: List[str] = None):
+        """Queue many tasks with one storage transaction and one client notification.
+
+        queue_ids lists every member of the batch, including ones already
+        answered from the result cache, and defaults to the queued tasks.
+        """
+        persistent_storage.add_batch(batch_id, session_id, tasks, queue_ids)
+        first_position = self.task_queue.qsize() + 1
+        for task in tasks:
+            self.task_queue.put(task)
+        if tasks:
+            self._maybe_preempt(min(tasks, key=self._priority_of))
+        logger.info(f"Added batch {batch_id} with {len(tasks)} tasks. Current queue size: {self.task_queue.qsize()}")
+
+        events.emit('batch_queued', {
+            'batch_id': batch_id,
+            'tasks': [
+                {'queue_id': task['queue_id'], 'position': first_position + i, 'status': 'queued'}
+                for i, task in enumerate(tasks)
+            ]
+        }, to=session_id)
+
+    def _heartbeat_loop(self):
+        """Keep this process's running tasks alive, and take over those of worker processes that are gone.
+
+        A worker ID changes when its container is recreated, so rows left by
+        the old one would otherwise stay running forever, answering cancels
+        with 'cancelling' and pinning their decoded audio.
+        """
+        while self.is_running:
+            try:
+                persistent_storage.heartbeat_running(self.worker_id)
+                self._expire_running()
+            except Exception as e:
+                logger.error(f"Running task heartbeat failed: {str(e)}")
+            time.sleep(Config.RUNNING_TASK_TTL / 4)
+
+    def _expire_running(self):
+        """Queue the tasks of dead workers again, or drop them if they were cancelled"""
+        for task, cancel_requested in persistent_storage.expire_running(time.time() - Config.RUNNING_TASK_TTL):
+            if 'file_path' not in task:
+                # Claimed before running tasks were stored; only its decoded audio is left to free
+                logger.warning(f"Task {task['queue_id']} of a stopped worker cannot be restored")
+                audio_cache.release(task.get('audio_key'))
+            elif cancel_requested:
+                self._drop_cancelled(task)
+            else:
+                logger.info(f"Requeueing task {task['queue_id']} of a stopped worker")
+                self._put_back(task, refund=False)
+
+    def _release_upload(self, task: Dict[str, Any]):
+        """Drop a finished task's hold on its decoded audio and uploaded file"""
+        audio_cache.release(task.get('audio_key'))
+        if Config.DELETE_UPLOADS_AFTER_PROCESSING and not task.get('keep_file'):
+            try:
+                os.remove(task['file_path'])
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Error removing upload {task['file_path']}: {str(e)}")
+
+    def _emit_batch_progress(self, batch_id: str, session_id: str):
+        progress = persistent_storage.get_batch_progress(batch_id)
+        if progress:
+            events.emit('batch_progress', progress, to=session_id)
+
+    def complete_cached(self, session_id: str, queue_id: str, result: str, model_name: str = None):
+        """Record and announce a result served from the result cache"""
+        persistent_storage.save_result(queue_id, result, session_id, model_name)
+        JOBS_TOTAL.labels(model_name or '-', 'cached').inc()
+        events.emit('transcription_complete', {
+            'text': result,
+            'queue_id': queue_id,
+            'cached': True
+        }, to=session_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue and scheduler counters"""
+        with self.processing_lock:
+            processing = len(self.current_tasks)
+        return {
+            'queued': self.task_queue.qsize(),
+            'processing': processing,
+            'workers': self.num_workers,
+            'scheduler': {'mode': self.task_queue.mode, **self.task_queue.stats},
+            'positions': self.positions.get_stats(),
+            'model_cache': self.transcription_service.model_cache.get_stats(),
+            'result_cache': result_cache.get_stats(),
+            'audio_cache': audio_cache.get_stats(),
+            'cpu': self.placement.get_stats() if self.placement else None
+        }
+
+    def _finish_task(self, task: Dict[str, Any], result: str):
+        """Cache, store and announce the transcript of a finished task"""
+        if task.get('content_hash'):
+            result_cache.put(
+                task['content_hash'],
+                model_key(task['model_name'], resolve_engine(task['model_name'], task.get('engine'))),
+                task.get('language', 'en'),
+                task.get('whisper_task', 'transcribe'),
+                result
+            )
+
+        # Cancelled while running, possibly from another process; the client already moved on
+        if persistent_storage.is_cancel_requested(task['queue_id']):
+            logger.info(f"Discarding result of cancelled task: {task['queue_id']}")
+            JOBS_TOTAL.labels(task['model_name'], 'cancelled').inc()
+            return
+
+        # Save result to persistent storage
+        persistent_storage.save_result(task['queue_id'], result, task['session_id'], task['model_name'])
+
+        logger.info(f"Emitting completion for task: {task['queue_id']}")
+        events.emit('transcription_complete', {
+            'text': result,
+            'queue_id': task['queue_id']
+        }, to=task['session_id'])
+        if task.get('batch_id'):
+            self._emit_batch_progress(task['batch_id'], task['session_id'])
+        JOBS_TOTAL.labels(task['model_name'], 'completed').inc()
+
+    def _fail_task(self, task: Dict[str, Any], error: Exception):
+        JOBS_TOTAL.labels(task['model_name'], 'failed').inc()
+        logger.error(f"Error processing task {task['queue_id']}: {str(error)}")
+        events.emit('error', {
+            'message': f"Error processing file: {str(error)}",
+            'queue_id': task['queue_id']
+        }, to=task['session_id'])
+
+    @staticmethod
+    def _batch_key(task: Dict[str, Any]):
+        """Tasks with equal keys can share one decode, or None if the task cannot be batched"""
+        duration = task.get('duration')
+        if duration is None or duration > Config.INFERENCE_BATCH_MAX_SECONDS or task.get('checkpoint'):
+            return None
+        return (task['model_name'], resolve_engine(task['model_name'], task.get('engine')),
+                task.get('language', 'en'), task.get('whisper_task', 'transcribe'))
+
+    def _gather_batch(self, task: Dict[str, Any], tokens: Dict[str, CancellationToken]) -> List[Dict[str, Any]]:
+        """The task plus queued short clips that can be decoded in the same batch.
+
+        Waits up to INFERENCE_BATCH_WINDOW seconds for matching clips to
+        arrive. Clips are taken in arrival order regardless of their session,
+        which costs the scheduler's fairness little as each is a single window.
+        """
+        key = self._batch_key(task)
+        if Config.INFERENCE_BATCH_SIZE <= 1 or key is None:
+            return [task]
+        if not self.transcription_service.supports_batching(task['model_name'], task.get('engine')):
+            return [task]
+
+        batch = [task]
+        deadline = time.monotonic() + Config.INFERENCE_BATCH_WINDOW
+        while self.is_running:
+            gathered = self.task_queue.remove_where(
+                lambda queued: self._batch_key(queued) == key, limit=Config.INFERENCE_BATCH_SIZE - len(batch)
+            )
+            for queued in gathered:
+                tokens[queued['queue_id']] = self._register(queued)
+            batch += gathered
+            remaining = deadline - time.monotonic()
+            if len(batch) >= Config.INFERENCE_BATCH_SIZE or remaining <= 0:
+                break
+            time.sleep(min(0.05, remaining))
+        return batch
+
+    def _process_batch(self, worker_name: str, batch: List[Dict[str, Any]], tokens: Dict[str, CancellationToken]):
+        """Run several short tasks through one batched decode and complete each of them.
+
+        The caller has admitted the batch's model; its slot is released here.
+        """
+        model_name = batch[0]['model_name']
+        self.positions.mark()
+
+        with self.processing_lock:
+            self.current_tasks[worker_name] = batch[0]
+        logger.info(f"{worker_name} processing batch of {len(batch)} tasks: {[task['queue_id'] for task in batch]}")
+        try:
+            for task in batch:
+                persistent_storage.remove_from_queue(task['queue_id'], self.task_queue.export_state())
+                events.emit('queue_update', {
+                    'status': 'processing',
+                    'queue_id': task['queue_id']
+                }, to=task['session_id'])
+
+            try:
+                results = self.transcription_service.transcribe_batch(batch, tokens)
+            except Exception as e:
+                logger.error(f"Traceback: {traceback.format_exc()}")
+                results = {task['queue_id']: e for task in batch}
+            for task in batch:
+                result = results.get(task['queue_id'])
+                try:
+                    if isinstance(result, TaskCancelled):
+                        # The canceller already told the client
+                        JOBS_TOTAL.labels(task['model_name'], 'cancelled').inc()
+                    elif isinstance(result, Exception):
+                        self._fail_task(task, result)
+                    else:
+                        self._finish_task(task, result)
+                except Exception as e:
+                    self._fail_task(task, e)
+        finally:
+            with self.processing_lock:
+                self.current_tasks.pop(worker_name, None)
+            for task in batch:
+                self._unregister(task, tokens[task['queue_id']])
+                persistent_storage.mark_finished(task['queue_id'])
+                self._release_upload(task)
+            self.admission.release(model_name)
+
+    def _process_queue(self, index: int):
+        """Worker loop: process tasks from the shared queue"""
+        worker_name = threading.current_thread().name
+        # Before any model runs here, so torch's threads for this one start on the same cores
+        self.placement.pin_worker(index)
+        with self._app.app_context():
+            logger.info(f"{worker_name} started with app context")
             while self.is_running:
                 try:
-                    logger.info("Waiting for next task...")
-                    task = self.task_queue.get(timeout=1)
-                    logger.info(f"Got task from queue: {task['queue_id']}")
-                    
+                    task = self.task_queue.get(
+                        timeout=1,
+                        warm_models=self.transcription_service.warm_models()
+                    )
+                    logger.info(f"{worker_name} got task from queue: {task['queue_id']}")
+                    tokens = {task['queue_id']: self._register(task)}
                     with self.processing_lock:
-                        self.current_task = task
-                        logger.info(f"Processing task: {task['queue_id']}")
-                    
-                    # Remove from persistent storage
-                    persistent_storage.remove_from_queue(task['queue_id'])
-                    
-                    socketio.emit('queue_update', {
-                        'status': 'processing',
-                        'queue_id': task['queue_id']
-                    }, to=task['session_id'])
+                        self.current_tasks[worker_name] = task
+                    # Every task behind this one moved up
+                    self.positions.mark()
+
+                    # Wait until the model fits the memory budget and per-model cap
+                    batch = self._admit(self._gather_batch(task, tokens), tokens)
+                    if not batch:
+                        with self.processing_lock:
+                            self.current_tasks.pop(worker_name, None)
+                        continue
+                    now = time.time()
+                    for task in batch:
+                        if task.get('enqueued_at'):
+                            QUEUE_WAIT_SECONDS.observe(max(0.0, now - task['enqueued_at']))
+                    if len(batch) > 1:
+                        self._process_batch(worker_name, batch, tokens)
+                        logger.info(f"Batch completed. Remaining tasks: {self.task_queue.qsize()}")
+                        continue
+                    task = batch[0]
+
+                    token = tokens[task['queue_id']]
+                    requeued = False
+                    task['started_at'] = time.time()
+                    with self.processing_lock:
+                        self.current_tasks[worker_name] = task
+                        logger.info(f"{worker_name} processing task: {task['queue_id']}")
                     
                     try:
+                        # Remove from persistent storage
+                        persistent_storage.remove_from_queue(task['queue_id'], self.task_queue.export_state())
+                        
+                        events.emit('queue_update', {
+                            'status': 'processing',
+                            'queue_id': task['queue_id']
+                        }, to=task['session_id'])
+                        
                         logger.info(f"Starting transcription for task: {task['queue_id']}")
                         result = self.transcription_service.transcribe(
                             task['file_path'], 
                             task['session_id'],
-                            task['model_name']
+                            task['model_name'],
+                            queue_id=task['queue_id'],
+                            language=task.get('language', 'en'),
+                            task=task.get('whisper_task', 'transcribe'),
+                            content_hash=task.get('content_hash'),
+                            token=token,
+                            checkpoint=task.get('checkpoint'),
+                            engine=task.get('engine')
                         )
                         logger.info(f"Transcription completed for task: {task['queue_id']}")
-                        
-                        # Save result to persistent storage
-                        persistent_storage.save_result(task['queue_id'], result)
-                        
-                        logger.info(f"Emitting completion for task: {task['queue_id']}")
-                        socketio.emit('transcription_complete', {
-                            'text': result,
-                            'queue_id': task['queue_id']
-                        }, to=task['session_id'])
+                        self._finish_task(task, result)
+                    except TaskCancelled as e:
+                        if e.reason == PREEMPTED:
+                            JOBS_TOTAL.labels(task['model_name'], 'preempted').inc()
+                            # Leave running_tasks first, a cancel must find the task in the queue again
+                            persistent_storage.mark_finished(task['queue_id'])
+                            self._requeue_preempted(task, e.checkpoint)
+                            requeued = True
+                        else:
+                            # The canceller already told the client
+                            JOBS_TOTAL.labels(task['model_name'], 'cancelled').inc()
                     except Exception as e:
-                        logger.error(f"Error processing task: {str(e)}")
+                        self._fail_task(task, e)
                         logger.error(f"Traceback: {traceback.format_exc()}")
-                        socketio.emit('error', {
-                            'message': f"Error processing file: {str(e)}",
-                            'queue_id': task['queue_id']
-                        }, to=task['session_id'])
                     finally:
                         with self.processing_lock:
-                            self.current_task = None
+                            self.current_tasks.pop(worker_name, None)
+                        self._unregister(task, token)
+                        if not requeued:
+                            persistent_storage.mark_finished(task['queue_id'])
+                            self._release_upload(task)
+                        self.admission.release(task['model_name'])
                     
-                    self.task_queue.task_done()
-                    
-                    remaining = self.task_queue.qsize()
-                    logger.info(f"Task completed. Remaining tasks: {remaining}")
-                    
-                    if remaining > 0:
-                        try:
-                            with self.task_queue.mutex:
-                                remaining_tasks = list(self.task_queue.queue)
-                            for pos, remaining_task in enumerate(remaining_tasks, 1):
-                                socketio.emit('queue_update', {
-                                    'position': pos,
-                                    'status': 'queued',
-                                    'queue_id': remaining_task['queue_id']
-                                }, to=remaining_task['session_id'])
-                        except Exception as e:
-                            logger.error(f"Error updating queue positions: {str(e)}")
+                    logger.info(f"Task completed. Remaining tasks: {self.task_queue.qsize()}")
 
                 except queue.Empty:
                     continue
                 except Exception as e:
                     logger.error(f"Error in queue processing: {str(e)}")
                     if 'task' in locals():
-                        socketio.emit('error', {
+                        events.emit('error', {
                             'message': f"Queue processing error: {str(e)}",
                             'queue_id': task['queue_id']
-                        }, room=task['session_id'])
+                        }, to=task['session_id'])
 
 # Create a global instance
-queue_manager = QueueManager() 
\ No newline at end of file
+queue_manager = QueueManager(Config.TRANSCRIPTION_WORKERS, Config.RUN_WORKERS) 
+REGISTRY.register_collector(
+    lambda: flatten_stats(queue_manager.get_stats(), labelled={'model_cache_loaded': 'model'}),
+    'transcription_stats', 'Value reported by GET /stats'
+)
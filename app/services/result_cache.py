@@ -0,0 +1,59 @@
+import threading
+import logging
+from typing import Any, Dict, Optional
+from app.core.config import Config
+from app.services.persistent_storage import persistent_storage
+
+logger = logging.getLogger(__name__)
+
+class ResultCache:
+    """Transcripts keyed by upload content hash and transcription options.
+
+    Entries live in persistent storage so they survive restarts, expire after
+    ``ttl`` seconds and are trimmed least-recently-used first beyond
+    ``max_entries``.
+    """
+
+    def __init__(self, storage, max_entries: int = 10000, ttl: float = None):
+        self.storage = storage
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    @staticmethod
+    def make_key(content_hash: str, model_name: str, language: str, task: str) -> str:
+        return f"{content_hash}:{model_name}:{language}:{task}"
+
+    def get(self, content_hash: str, model_name: str, language: str, task: str) -> Optional[Any]:
+        """Return the cached transcript, or None on a miss"""
+        try:
+            result = self.storage.get_cached_result(self.make_key(content_hash, model_name, language, task), self.ttl)
+        except Exception as e:
+            logger.error(f"Error reading result cache: {e}")
+            result = None
+        with self._lock:
+            self.stats['hits' if result is not None else 'misses'] += 1
+        return result
+
+    def put(self, content_hash: str, model_name: str, language: str, task: str, result: Any):
+        """Store a transcript and enforce the size and age limits"""
+        try:
+            self.storage.cache_result(self.make_key(content_hash, model_name, language, task), result)
+            evicted = self.storage.evict_cached_results(self.max_entries, self.ttl)
+        except Exception as e:
+            logger.error(f"Error writing result cache: {e}")
+            return
+        with self._lock:
+            self.stats['stores'] += 1
+            self.stats['evictions'] += evicted
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+# Create a global instance
+result_cache = ResultCache(persistent_storage, Config.RESULT_CACHE_MAX_ENTRIES, Config.RESULT_CACHE_TTL or None)
@@ -0,0 +1,420 @@
+import itertools
+import queue
+import threading
+import time
+import logging
+from collections import OrderedDict, deque
+from typing import Dict, Any, Callable, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SCHEDULING_MODES = {'fifo', 'affinity', 'fair'}
+
+# Priority classes, lower runs first
+PRIORITY_SHORT, PRIORITY_NORMAL, PRIORITY_LONG = 0, 1, 2
+
+def priority_class(duration: Optional[float], short_seconds: float, long_seconds: float) -> int:
+    """Priority class for a task of the given audio duration, NORMAL when unknown"""
+    if duration is None:
+        return PRIORITY_NORMAL
+    if duration <= short_seconds:
+        return PRIORITY_SHORT
+    if duration >= long_seconds:
+        return PRIORITY_LONG
+    return PRIORITY_NORMAL
+
+class _Entry:
+    __slots__ = ('task', 'seq', 'slot', 'enqueued_at', 'removed')
+
+    def __init__(self, task: Dict[str, Any], seq: int, slot: int):
+        self.task = task
+        self.seq = seq
+        self.slot = slot
+        self.enqueued_at = time.monotonic()
+        self.removed = False
+
+class _PositionIndex:
+    """Fenwick tree over arrival slots counting the entries still queued.
+
+    The position of an entry is the number of live slots up to and including
+    its own, so lookups and removals cost O(log n) regardless of where in the
+    queue they happen.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._tree = [0] * (capacity + 1)
+
+    def add(self, slot: int, delta: int):
+        i = slot + 1
+        while i <= self.capacity:
+            self._tree[i] += delta
+            i += i & -i
+
+    def prefix(self, slot: int) -> int:
+        """Live entries in slots [0, slot]"""
+        i = slot + 1
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    @classmethod
+    def filled(cls, count: int, capacity: int) -> '_PositionIndex':
+        """Index with slots [0, count) live, built in O(capacity)"""
+        index = cls(capacity)
+        tree = index._tree
+        for i in range(1, count + 1):
+            tree[i] += 1
+            parent = i + (i & -i)
+            if parent <= capacity:
+                tree[parent] += tree[i]
+        for i in range(count + 1, capacity + 1):
+            parent = i + (i & -i)
+            if parent <= capacity:
+                tree[parent] += tree[i]
+        return index
+
+class TaskScheduler:
+    """Pending-task queue that can group work by model to avoid reloading weights.
+
+    In ``fifo`` mode tasks come out in arrival order. In ``affinity`` mode a
+    worker gets the oldest task for a model that is already loaded, but the
+    oldest task overall is never passed over more than ``max_batch`` times in a
+    row or for longer than ``max_wait`` seconds.
+
+    In ``fair`` mode tasks are split into priority classes by audio duration
+    and short jobs run first. Within a class, sessions share the workers by
+    deficit round robin: each turn a session earns ``quantum`` seconds of audio
+    times its weight and spends the duration of the tasks it runs, so one
+    client with hundreds of files cannot lock everyone else out. A lower class
+    whose oldest task has waited longer than ``max_wait`` seconds gets every
+    other dispatch until it catches up, still shared among its sessions, so
+    long jobs are not starved by a steady stream of short ones.
+
+    Positions are always reported in arrival order and tasks are indexed by
+    queue_id and session, so looking up or cancelling a task never scans the
+    whole queue.
+    """
+
+    MIN_CAPACITY = 64
+    # Pending tasks only live in memory and are restored from storage on startup
+    durable = False
+
+    def __init__(self, mode: str = 'affinity', max_batch: int = 8, max_wait: float = 300,
+                 quantum: float = 300, weights: Dict[str, float] = None,
+                 short_seconds: float = 120, long_seconds: float = 1800):
+        if mode not in SCHEDULING_MODES:
+            raise ValueError(f"Invalid scheduling mode. Must be one of: {', '.join(sorted(SCHEDULING_MODES))}")
+        self.mode = mode
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.quantum = quantum
+        self.weights = weights or {}
+        # A session that never earns credit would keep the round robin spinning
+        if quantum <= 0:
+            raise ValueError("The fair scheduling quantum must be positive")
+        if any(weight <= 0 for weight in self.weights.values()):
+            raise ValueError("Session weights must be positive")
+        self.short_seconds = short_seconds
+        self.long_seconds = long_seconds
+        self._fair = {}  # priority -> OrderedDict of session_id -> deque of entries, next session first
+        self._deficits = {}  # session_id -> seconds of audio the session may still run this round
+        self._class_order = {}  # priority -> deque of entries in arrival order, to age each class
+        self._promoted_last = False  # the last fair dispatch served an overdue lower class
+        self._order = deque()  # all entries in arrival order, removed ones are skipped lazily
+        self._by_model = {}  # model_name -> deque of entries in arrival order
+        self._by_id = {}  # queue_id -> entry
+        self._by_session = {}  # session_id -> {queue_id: entry}
+        self._positions = _PositionIndex(self.MIN_CAPACITY)
+        self._next_slot = 0
+        self._size = 0
+        self._seq = itertools.count()
+        self._head_skips = 0
+        self._last_model = None
+        self._condition = threading.Condition()
+        self.stats = {
+            'dispatched': 0,
+            'model_switches': 0,
+            'switches_avoided': 0,
+            'fairness_overrides': 0
+        }
+
+    def put(self, task: Dict[str, Any]):
+        """Add a task at the back of the queue"""
+        with self._condition:
+            if self._next_slot >= self._positions.capacity:
+                self._reindex()
+            entry = _Entry(task, next(self._seq), self._next_slot)
+            self._next_slot += 1
+            self._positions.add(entry.slot, 1)
+            self._order.append(entry)
+            self._by_model.setdefault(task['model_name'], deque()).append(entry)
+            self._by_id[task['queue_id']] = entry
+            self._by_session.setdefault(task['session_id'], {})[task['queue_id']] = entry
+            priority = self.priority_of(task)
+            sessions = self._fair.setdefault(priority, OrderedDict())
+            sessions.setdefault(task['session_id'], deque()).append(entry)
+            self._class_order.setdefault(priority, deque()).append(entry)
+            self._size += 1
+            self._condition.notify()
+
+    def requeue(self, task: Dict[str, Any], refund: bool = True):
+        """Return a dequeued task that never started to the head of the queue.
+
+        The task keeps its age, so max_wait still counts from when it was
+        first queued. With ``refund`` its session gets back the deficit that
+        dispatching it cost. Every position shifts, so this is O(n); it is
+        only meant for tasks that could not start.
+        """
+        with self._condition:
+            head = self._head(self._order)
+            entry = _Entry(task, head.seq - 1 if head else next(self._seq), 0)
+            entry.enqueued_at -= max(0.0, time.time() - task.get('enqueued_at', time.time()))
+            self._order.appendleft(entry)
+            self._by_model.setdefault(task['model_name'], deque()).appendleft(entry)
+            self._by_id[task['queue_id']] = entry
+            self._by_session.setdefault(task['session_id'], {})[task['queue_id']] = entry
+            priority = self.priority_of(task)
+            sessions = self._fair.setdefault(priority, OrderedDict())
+            sessions.setdefault(task['session_id'], deque()).appendleft(entry)
+            # The session was first in line when the task was dispatched
+            sessions.move_to_end(task['session_id'], last=False)
+            self._class_order.setdefault(priority, deque()).appendleft(entry)
+            if refund and self.mode == 'fair':
+                self._deficits[task['session_id']] = (
+                    self._deficits.get(task['session_id'], 0.0) + self.cost_of(task)
+                )
+            self._size += 1
+            self._reindex()
+            self._condition.notify()
+
+    def get(self, timeout: float = None, warm_models: Iterable[str] = ()) -> Dict[str, Any]:
+        """Remove and return the next task, raising queue.Empty on timeout"""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._size > 0, timeout=timeout):
+                raise queue.Empty
+            warm_models = set(warm_models)
+            entry = self._select(warm_models)
+            self._remove(entry)
+            self._record_dispatch(entry.task['model_name'], warm_models)
+            return entry.task
+
+    def get_nowait(self) -> Dict[str, Any]:
+        return self.get(timeout=0)
+
+    def qsize(self) -> int:
+        return self._size
+
+    def empty(self) -> bool:
+        return self._size == 0
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Pending tasks in arrival order"""
+        with self._condition:
+            return [entry.task for entry in self._order if not entry.removed]
+
+    def position(self, queue_id: str) -> Optional[int]:
+        """1-based arrival-order position of a pending task, None if it is not queued"""
+        with self._condition:
+            entry = self._by_id.get(queue_id)
+            return self._positions.prefix(entry.slot) if entry else None
+
+    def positions(self, session_ids: Iterable[str] = None) -> Dict[str, Dict[str, int]]:
+        """Positions of pending tasks grouped by session, for all sessions by default"""
+        with self._condition:
+            if session_ids is None:
+                session_ids = list(self._by_session)
+            return {
+                session_id: {
+                    queue_id: self._positions.prefix(entry.slot)
+                    for queue_id, entry in self._by_session.get(session_id, {}).items()
+                }
+                for session_id in session_ids
+            }
+
+    def priority_of(self, task: Dict[str, Any]) -> int:
+        """Priority class of a task from its probed audio duration"""
+        return priority_class(task.get('duration'), self.short_seconds, self.long_seconds)
+
+    def cost_of(self, task: Dict[str, Any]) -> float:
+        """Seconds of audio a task charges against its session's deficit"""
+        duration = task.get('duration')
+        return self.quantum if duration is None else duration
+
+    def export_state(self) -> Dict[str, Any]:
+        """Fair-share state worth keeping across restarts"""
+        with self._condition:
+            return {
+                'deficits': dict(self._deficits),
+                'session_order': {
+                    str(priority): list(sessions) for priority, sessions in self._fair.items()
+                }
+            }
+
+    def import_state(self, state: Dict[str, Any]):
+        """Restore state saved by export_state, after the pending tasks were put back"""
+        if not state:
+            return
+        with self._condition:
+            self._deficits.update({
+                session_id: deficit for session_id, deficit in state.get('deficits', {}).items()
+                if session_id in self._by_session
+            })
+            for priority, order in state.get('session_order', {}).items():
+                sessions = self._fair.get(int(priority))
+                if not sessions:
+                    continue
+                # Sessions that were next in line before the restart stay next
+                for session_id in reversed(order):
+                    if session_id in sessions:
+                        sessions.move_to_end(session_id, last=False)
+
+    def sessions(self) -> List[str]:
+        """Sessions with at least one pending task"""
+        with self._condition:
+            return list(self._by_session)
+
+    def remove(self, queue_id: str) -> Optional[Dict[str, Any]]:
+        """Remove and return a pending task by queue_id, None if it is not queued"""
+        with self._condition:
+            entry = self._by_id.get(queue_id)
+            if entry is None:
+                return None
+            self._remove(entry)
+            return entry.task
+
+    def remove_session(self, session_id: str) -> List[Dict[str, Any]]:
+        """Remove and return every pending task of one session"""
+        with self._condition:
+            removed = list(self._by_session.get(session_id, {}).values())
+            for entry in removed:
+                self._remove(entry)
+            return [entry.task for entry in removed]
+
+    def remove_where(self, predicate: Callable[[Dict[str, Any]], bool], limit: int = None) -> List[Dict[str, Any]]:
+        """Remove and return pending tasks matching predicate, at most limit of them in arrival order"""
+        with self._condition:
+            removed = []
+            for entry in self._order:
+                if limit is not None and len(removed) >= limit:
+                    break
+                if not entry.removed and predicate(entry.task):
+                    removed.append(entry)
+            for entry in removed:
+                self._remove(entry)
+            return [entry.task for entry in removed]
+
+    def _reindex(self):
+        """Renumber live entries from slot 0 and drop removed ones. Caller holds the lock.
+
+        Runs when the slot space is exhausted, and the capacity doubles with
+        the live count, so the cost is amortized O(1) per put. requeue runs it
+        too, to give the returned task the first slot.
+        """
+        live = [entry for entry in self._order if not entry.removed]
+        self._order = deque(live)
+        for priority, entries in self._class_order.items():
+            self._class_order[priority] = deque(entry for entry in entries if not entry.removed)
+        for slot, entry in enumerate(live):
+            entry.slot = slot
+        capacity = max(self.MIN_CAPACITY, 2 * len(live))
+        self._positions = _PositionIndex.filled(len(live), capacity)
+        self._next_slot = len(live)
+
+    def _head(self, entries: deque) -> Optional[_Entry]:
+        while entries and entries[0].removed:
+            entries.popleft()
+        return entries[0] if entries else None
+
+    def _select(self, warm_models: set) -> _Entry:
+        head = self._head(self._order)
+        if self.mode == 'fair':
+            return self._select_fair()
+        if self.mode == 'fifo' or head.task['model_name'] in warm_models:
+            self._head_skips = 0
+            return head
+
+        if self._head_skips >= self.max_batch or time.monotonic() - head.enqueued_at >= self.max_wait:
+            self.stats['fairness_overrides'] += 1
+            self._head_skips = 0
+            return head
+
+        # Keep going with the model dispatched last, then any other warm model
+        preferred = [self._last_model] if self._last_model in warm_models else []
+        preferred += sorted(warm_models - {self._last_model})
+        for model_name in preferred:
+            candidate = self._head(self._by_model.get(model_name, deque()))
+            if candidate is not None:
+                self._head_skips += 1
+                self.stats['switches_avoided'] += 1
+                return candidate
+
+        self._head_skips = 0
+        return head
+
+    def _select_fair(self) -> _Entry:
+        priorities = sorted(self._fair)
+        if not self._promoted_last:
+            now = time.monotonic()
+            oldest = {priority: self._head(self._class_order[priority]) for priority in priorities[1:]}
+            overdue = [priority for priority, entry in oldest.items() if now - entry.enqueued_at >= self.max_wait]
+            if overdue:
+                # Alternating keeps the promoted class from starving the classes above it in turn
+                self._promoted_last = True
+                self.stats['fairness_overrides'] += 1
+                return self._select_session(min(overdue, key=lambda priority: oldest[priority].seq))
+        self._promoted_last = False
+        return self._select_session(priorities[0])
+
+    def _select_session(self, priority: int) -> _Entry:
+        """Next task of a priority class by deficit round robin over its sessions"""
+        sessions = self._fair[priority]
+        while sessions:
+            session_id, entries = next(iter(sessions.items()))
+            candidate = self._head(entries)
+            if candidate is None:
+                del sessions[session_id]
+                continue
+            cost = self.cost_of(candidate.task)
+            deficit = self._deficits.get(session_id, 0.0)
+            if deficit >= cost:
+                self._deficits[session_id] = deficit - cost
+                return candidate
+            # Out of credit: earn this round's quantum and let the next session go
+            self._deficits[session_id] = deficit + self.quantum * self.weights.get(session_id, 1.0)
+            sessions.move_to_end(session_id)
+        return self._head(self._class_order[priority])
+
+    def _remove(self, entry: _Entry):
+        entry.removed = True
+        self._size -= 1
+        self._positions.add(entry.slot, -1)
+        queue_id = entry.task['queue_id']
+        # A reused queue_id may already point at a newer entry
+        if self._by_id.get(queue_id) is entry:
+            del self._by_id[queue_id]
+            session_entries = self._by_session[entry.task['session_id']]
+            del session_entries[queue_id]
+            if not session_entries:
+                del self._by_session[entry.task['session_id']]
+                # Idle sessions do not bank credit, as in standard deficit round robin
+                self._deficits.pop(entry.task['session_id'], None)
+        sessions = self._fair.get(self.priority_of(entry.task))
+        if sessions is not None:
+            session_queue = sessions.get(entry.task['session_id'])
+            if session_queue is not None and self._head(session_queue) is None:
+                del sessions[entry.task['session_id']]
+            if not sessions:
+                del self._fair[self.priority_of(entry.task)]
+                self._class_order.pop(self.priority_of(entry.task), None)
+        model_entries = self._by_model.get(entry.task['model_name'])
+        if model_entries is not None and self._head(model_entries) is None:
+            del self._by_model[entry.task['model_name']]
+
+    def _record_dispatch(self, model_name: str, warm_models: set):
+        self.stats['dispatched'] += 1
+        if model_name not in warm_models:
+            self.stats['model_switches'] += 1
+        self._last_model = model_name
@@ -1,9 +1,24 @@
 import logging
 from flask import current_app
 import whisper
-from app import socketio
+from app.services import events
+from app.core.config import Config
+from app.core.metrics import (
+    MODEL_LOAD_SECONDS, TRANSCRIBE_SECONDS, REALTIME_FACTOR, AUDIO_SECONDS_TOTAL, SILENCE_REMOVED_SECONDS_TOTAL,
+    INFERENCE_BATCH_SIZE
+)
+from app.services.audio import load_audio, split_on_silence, owned_segments, compress_silence
+from app.services.model_cache import ModelCache
+from app.services.engines import DEFAULT_ENGINE, get_engine, resolve_engine, model_key, split_key
+from app.services.cancellation import CancellationToken, TaskCancelled, PREEMPTED
+from app.services.progress import ProgressReporter, whisper_progress
 import traceback
+import threading
+import time
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, List
 
 logger = logging.getLogger(__name__)
 
@@ -19,51 +34,171 @@ VALID_MODELS = {
     'turbo'
 }
 
+VALID_TASKS = {'transcribe', 'translate'}
+VALID_LANGUAGES = set(whisper.tokenizer.LANGUAGES)
+
+# Approximate resident memory of one loaded model while transcribing, in MB
+MODEL_MEMORY_MB = {
+    'tiny': 1024, 'tiny.en': 1024,
+    'base': 1024, 'base.en': 1024,
+    'small': 2048, 'small.en': 2048,
+    'medium': 5120, 'medium.en': 5120,
+    'large-v1': 10240, 'large-v2': 10240, 'large-v3': 10240, 'large': 10240,
+    'turbo': 6144
+}
+
+def model_memory_mb(model_name: str) -> int:
+    """Estimated memory footprint of a model instance, by model name or model_key"""
+    model_name, engine = split_key(model_name)
+    return int(MODEL_MEMORY_MB.get(model_name, 10240) * get_engine(engine).memory_factor)
+
 class TranscriptionService:
-    def __init__(self):
-        self.models = {}  # Cache for loaded models
+    def __init__(self, admission=None, placement=None):
+        # Grants extra concurrent model slots for chunked jobs when capacity is free
+        self.admission = admission
+        # CpuPlacement giving each running transcription its own cores, set by the queue manager
+        self.placement = placement
+        # Whisper installs per-call kv-cache hooks on the model, so one instance
+        # must never serve two jobs at once; the cache hands out whole instances.
+        self.model_cache = ModelCache(
+            self.load_model,
+            Config.MODEL_CACHE_BUDGET_MB,
+            size_of=model_memory_mb,
+            pinned={model_key(Config.WHISPER_MODEL, resolve_engine(Config.WHISPER_MODEL))}
+        )
 
-    def load_model(self, model_name: str):
-        """Load the Whisper model if not already loaded"""
+    def load_model(self, key: str):
+        """Load a new model instance for a model_key with the engine it names"""
+        model_name, engine = split_key(key)
         if model_name not in VALID_MODELS:
             raise ValueError(f"Invalid model name. Must be one of: {', '.join(sorted(VALID_MODELS))}")
-            
-        if model_name not in self.models:
-            current_app.logger.info(f"Loading Whisper model: {model_name}")
-            self.models[model_name] = whisper.load_model(model_name)
-            current_app.logger.info(f"Whisper model {model_name} loaded successfully")
-        return self.models[model_name]
-
-    def transcribe(self, file_path: str, session_id: str, model_name: str = 'base'):
-        """Transcribe audio file with progress updates"""
+
+        current_app.logger.info(f"Loading Whisper model: {model_name} ({engine} engine)")
+        with MODEL_LOAD_SECONDS.labels(key).time():
+            model = get_engine(engine).load(model_name, self.placement.threads if self.placement else 0)
+        current_app.logger.info(f"Whisper model {model_name} loaded successfully")
+        return model
+
+    def warm_models(self) -> set:
+        """Model names with an idle instance ready to use"""
+        return {split_key(key)[0] for key in self.model_cache.warm_models()}
+
+    def start_warmup(self, model_names, app):
+        """Load the given models in the background so first requests skip the load latency"""
+        keys = [model_key(name, resolve_engine(name)) for name in model_names if name in VALID_MODELS]
+        if not keys:
+            return
+
+        def warm_up():
+            with app.app_context(), self.placement.pinned() if self.placement else nullcontext():
+                self.model_cache.warm_up(keys)
+
+        threading.Thread(target=warm_up, name="model-warmup", daemon=True).start()
+
+    @contextmanager
+    def checkout_model(self, model_name: str, engine: str = DEFAULT_ENGINE):
+        """Borrow a model instance for the duration of one job, running on the calling thread's core set"""
+        key = model_key(model_name, engine)
+        with self.placement.pinned() if self.placement else nullcontext():
+            model = self.model_cache.acquire(key)
+            try:
+                yield model
+            finally:
+                self.model_cache.release(key, model)
+
+    def transcribe(self, file_path: str, session_id: str, model_name: str = 'base', queue_id: str = None,
+                   language: str = 'en', task: str = 'transcribe', content_hash: str = None,
+                   token: CancellationToken = None, checkpoint: Dict[str, Any] = None, engine: str = None):
+        """Transcribe audio file with progress updates.
+
+        ``token`` is checked after every decode window; cancelling it raises
+        TaskCancelled, which carries a checkpoint when the task was preempted.
+        Passing that checkpoint back in resumes the job where it stopped.
+        ``engine`` defaults to the one configured for the model.
+        """
+        engine = resolve_engine(model_name, engine)
+        key = model_key(model_name, engine)
+        token = token or CancellationToken()
+        checkpoint = checkpoint or {}
         try:
-            model = self.load_model(model_name)
-            
             # First detect the language
             current_app.logger.info("Detecting language...")
-            audio = whisper.load_audio(file_path)
+            audio = load_audio(file_path, content_hash)
             
             # Get audio duration for progress calculation
             duration = len(audio) / whisper.audio.SAMPLE_RATE
             current_app.logger.info(f"Audio duration: {duration:.2f} seconds")
-            
-            # Emit initial progress
-            self._emit_progress(0.1, session_id)
-            
+
+            # Long pauses are not sent through the model; timeline maps segments back
+            started = time.perf_counter()
+            audio, timeline = self._compress_silence(audio, model_name)
+
+            if Config.CHUNKED_TRANSCRIPTION and len(audio) / whisper.audio.SAMPLE_RATE >= Config.CHUNK_MIN_DURATION:
+                text = self._transcribe_chunked(
+                    audio, session_id, model_name, queue_id, language, task, timeline, token, checkpoint, engine
+                )
+                self._record_speed(key, duration, time.perf_counter() - started)
+                return text
+
+            # A preempted job resumes after the last complete decode window
+            offset = int(checkpoint.get('offset', 0))
+            done_segments = checkpoint.get('segments', [])
+            remaining = audio[offset:]
+            offset_seconds = offset / whisper.audio.SAMPLE_RATE
+            if offset:
+                current_app.logger.info(f"Resuming {queue_id} at {offset_seconds:.2f} seconds")
+
+            reporter = self._progress_reporter(session_id, queue_id)
+            reporter.update(offset / len(audio) if len(audio) else 0.0, force=True)
+            streamed = 0
+            decoded = {'frames': 0, 'segments': []}
+
+            def shifted(segments):
+                return [
+                    {'start': segment['start'] + offset_seconds, 'end': segment['end'] + offset_seconds,
+                     'text': segment['text']}
+                    for segment in segments
+                ]
+
+            def make_checkpoint():
+                consumed = min(decoded['frames'] * whisper.audio.HOP_LENGTH, len(remaining))
+                return {'offset': offset + consumed, 'segments': done_segments + shifted(decoded['segments'])}
+
+            def on_progress(done_frames: int, total_frames: int, segments):
+                nonlocal streamed
+                decoded['frames'], decoded['segments'] = done_frames, segments
+                # Whisper calls this between windows, so stopping here never interrupts a decode
+                token.check(make_checkpoint)
+                done = offset + min(done_frames * whisper.audio.HOP_LENGTH, len(remaining))
+                # Segments decoded since the last update ride along with the throttled progress
+                if reporter.update(done / len(audio)) and Config.STREAM_SEGMENTS and len(segments) > streamed:
+                    new_segments = shifted(segments[streamed:])
+                    streamed = len(segments)
+                    if timeline:
+                        new_segments = timeline.remap(new_segments)
+                    self._emit_segments(new_segments, 0, 1, session_id, queue_id)
+
             # Perform transcription
-            current_app.logger.info(f"Starting transcription with {model_name} model...")
-            result = model.transcribe(
-                audio,
-                verbose=True,
-                language='en',
-                task='transcribe'
-            )
+            current_app.logger.info(f"Starting transcription with {model_name} model ({engine} engine)...")
+            with self.checkout_model(model_name, engine) as model, whisper_progress(on_progress):
+                token.check(make_checkpoint)
+                with TRANSCRIBE_SECONDS.labels(key).time():
+                    result = model.transcribe(
+                        remaining,
+                        verbose=self._verbose(),
+                        language=language,
+                        task=task
+                    )
+            self._record_speed(key, duration, time.perf_counter() - started)
             
             # Emit completion
-            self._emit_progress(1.0, session_id)
+            reporter.update(1.0, force=True)
             current_app.logger.info("Transcription completed successfully")
-            return result['text']
-            
+            return ''.join(segment['text'] for segment in done_segments) + result['text']
+
+        except TaskCancelled as e:
+            current_app.logger.info(f"Transcription {e.reason}: {queue_id}")
+            raise
         except Exception as e:
             # Log the error with traceback
             current_app.logger.error(f"Transcription error: {str(e)}")
@@ -71,12 +206,214 @@ class TranscriptionService:
             # Re-raise the exception for the caller to handle
             raise
 
-    def _emit_progress(self, progress: float, session_id: str):
-        """Emit transcription progress via Socket.IO"""
+    def supports_batching(self, model_name: str, engine: str = None) -> bool:
+        return get_engine(resolve_engine(model_name, engine)).supports_batching
+
+    def transcribe_batch(self, tasks: List[Dict[str, Any]],
+                         tokens: Dict[str, CancellationToken] = None) -> Dict[str, Any]:
+        """Transcribe short clips from several jobs with one batched decode.
+
+        All tasks must share model, engine, language and task. Returns the
+        transcript, or the exception that stopped it, for each queue_id. Clips
+        longer than one window, or ones the batch decode is unsure about, are
+        transcribed on their own with the same model instance. ``tokens`` maps
+        queue_ids to cancellation tokens, checked between every step and at
+        each token of the batched decode; a cancelled clip gets TaskCancelled.
+        """
+        tokens = {task['queue_id']: (tokens or {}).get(task['queue_id']) or CancellationToken() for task in tasks}
+        first = tasks[0]
+        model_name, language = first['model_name'], first.get('language', 'en')
+        whisper_task = first.get('whisper_task', 'transcribe')
+        engine = resolve_engine(model_name, first.get('engine'))
+        key = model_key(model_name, engine)
+
+        results, clips = {}, []
+        duration = 0.0
+        for task in tasks:
+            if tokens[task['queue_id']].cancelled:
+                results[task['queue_id']] = TaskCancelled()
+                continue
+            try:
+                audio = load_audio(task['file_path'], task.get('content_hash'))
+                duration += len(audio) / whisper.audio.SAMPLE_RATE
+                audio, _ = self._compress_silence(audio, model_name)
+                clips.append((task, audio))
+            except Exception as e:
+                current_app.logger.error(f"Error loading audio for {task['queue_id']}: {str(e)}")
+                results[task['queue_id']] = e
+            self._emit_progress(0.0, task['session_id'], task['queue_id'])
+        if not clips:
+            return results
+
+        batched = [
+            (task, audio) for task, audio in clips
+            if len(audio) <= whisper.audio.N_SAMPLES and not tokens[task['queue_id']].cancelled
+        ]
+        started = time.perf_counter()
+        current_app.logger.info(f"Decoding {len(batched)} clips as one batch with {model_name} model ({engine} engine)")
+        with self.checkout_model(model_name, engine) as model:
+            texts = {}
+            if batched:
+                with TRANSCRIBE_SECONDS.labels(key).time():
+                    decoded = get_engine(engine).transcribe_batch(
+                        model, [audio for _, audio in batched], language, whisper_task,
+                        [tokens[task['queue_id']] for task, _ in batched]
+                    )
+                texts = {task['queue_id']: text for (task, _), text in zip(batched, decoded)}
+                INFERENCE_BATCH_SIZE.labels(key).observe(len(batched))
+            for task, audio in clips:
+                token = tokens[task['queue_id']]
+                text = texts.get(task['queue_id'])
+                try:
+                    token.check()
+                    if text is None:
+                        # Clips longer than a window stop between windows
+                        with TRANSCRIBE_SECONDS.labels(key).time(), whisper_progress(lambda *_: token.check()):
+                            text = model.transcribe(
+                                audio, verbose=self._verbose(), language=language, task=whisper_task
+                            )['text']
+                    results[task['queue_id']] = text
+                    self._emit_progress(1.0, task['session_id'], task['queue_id'])
+                except TaskCancelled as e:
+                    current_app.logger.info(f"Transcription cancelled: {task['queue_id']}")
+                    results[task['queue_id']] = e
+                except Exception as e:
+                    current_app.logger.error(f"Transcription error for {task['queue_id']}: {str(e)}")
+                    results[task['queue_id']] = e
+        self._record_speed(key, duration, time.perf_counter() - started)
+        return results
+
+    def _compress_silence(self, audio, model_name: str):
+        """Shorten long pauses when enabled, returning the audio and its timeline (or None)"""
+        if not Config.VAD_ENABLED:
+            return audio, None
+        audio, timeline = compress_silence(
+            audio, Config.VAD_MIN_SILENCE, Config.VAD_KEEP_SILENCE, Config.VAD_THRESHOLD_DB
+        )
+        if timeline:
+            SILENCE_REMOVED_SECONDS_TOTAL.labels(model_name).inc(timeline.removed_seconds)
+            current_app.logger.info(f"Removed {timeline.removed_seconds:.2f} seconds of silence before inference")
+        return audio, timeline
+
+    def _transcribe_chunked(self, audio, session_id: str, model_name: str, queue_id: str, language: str, task: str,
+                            timeline=None, token: CancellationToken = None, checkpoint: Dict[str, Any] = None,
+                            engine: str = DEFAULT_ENGINE):
+        """Transcribe overlapping silence-aligned chunks in parallel and stitch the segments"""
+        ranges = split_on_silence(audio, Config.CHUNK_SECONDS, Config.CHUNK_OVERLAP_SECONDS)
+        # The caller already holds one slot for this job, borrow spare ones for parallel chunks
+        wanted = min(Config.CHUNK_PARALLELISM, len(ranges)) - 1
+        extra_slots = self.admission.acquire_extra(model_name, wanted) if self.admission and wanted > 0 else 0
+        try:
+            return self._run_chunks(audio, ranges, session_id, model_name, queue_id, 1 + extra_slots, language, task,
+                                    timeline, token or CancellationToken(), checkpoint or {}, engine)
+        finally:
+            for _ in range(extra_slots):
+                self.admission.release(model_name)
+
+    def _run_chunks(self, audio, ranges, session_id: str, model_name: str, queue_id: str, parallelism: int,
+                    language: str, task: str, timeline, token: CancellationToken, checkpoint: Dict[str, Any],
+                    engine: str = DEFAULT_ENGINE):
+        """Transcribe chunks on a thread pool, emitting segments as each chunk finishes.
+
+        Chunks finished before a preemption are taken from the checkpoint, the
+        chunk layout being deterministic for the same audio and settings.
+        """
+        # Overlaps are transcribed twice, so measure progress against the summed chunk lengths
+        total_samples = sum(end - start for start, end in ranges)
+        current_app.logger.info(
+            f"Starting chunked transcription with {model_name} model: {len(ranges)} chunks, parallelism {parallelism}"
+        )
+        chunk_segments = [None] * len(ranges)
+        # Samples of each chunk decoded so far, updated from the chunk threads
+        chunk_done = [0] * len(ranges)
+        if checkpoint.get('count') == len(ranges):
+            for index, segments in checkpoint.get('chunks', {}).items():
+                index = int(index)
+                chunk_segments[index] = segments
+                chunk_done[index] = ranges[index][1] - ranges[index][0]
+        pending = [i for i, segments in enumerate(chunk_segments) if segments is None]
+        if len(pending) < len(ranges):
+            current_app.logger.info(f"Resuming {queue_id} with {len(ranges) - len(pending)} chunks already done")
+        reporter = self._progress_reporter(session_id, queue_id)
+        reporter.update(sum(chunk_done) / total_samples, force=True)
+
+        app = current_app._get_current_object()
+
+        def transcribe_chunk(index: int):
+            start, end = ranges[index]
+
+            def on_progress(done_frames: int, total_frames: int, segments):
+                token.check()
+                if total_frames:
+                    chunk_done[index] = (end - start) * min(done_frames / total_frames, 1.0)
+                    reporter.update(sum(chunk_done) / total_samples)
+
+            with app.app_context(), self.checkout_model(model_name, engine) as model, whisper_progress(on_progress):
+                token.check()
+                with TRANSCRIBE_SECONDS.labels(model_key(model_name, engine)).time():
+                    result = model.transcribe(audio[start:end], verbose=self._verbose(), language=language, task=task)
+            return owned_segments(ranges, index, result['segments'])
+
+        with ThreadPoolExecutor(max_workers=max(1, parallelism), thread_name_prefix="chunk") as executor:
+            futures = {executor.submit(transcribe_chunk, i): i for i in pending}
+            try:
+                for future in as_completed(futures):
+                    index = futures[future]
+                    chunk_segments[index] = future.result()
+                    start, end = ranges[index]
+                    chunk_done[index] = end - start
+                    # Chunk segments are only final once overlap duplicates are dropped
+                    segments = timeline.remap(chunk_segments[index]) if timeline else chunk_segments[index]
+                    self._emit_segments(segments, index, len(ranges), session_id, queue_id)
+                    reporter.update(sum(chunk_done) / total_samples)
+            except TaskCancelled as e:
+                # Chunks still queued never start; running ones stop at their next window
+                for future in futures:
+                    future.cancel()
+                finished = {str(i): segments for i, segments in enumerate(chunk_segments) if segments is not None}
+                raise TaskCancelled(
+                    e.reason, {'chunks': finished, 'count': len(ranges)} if e.reason == PREEMPTED else None
+                )
+
+        reporter.update(1.0, force=True)
+        current_app.logger.info("Chunked transcription completed successfully")
+        return ''.join(segment['text'] for segments in chunk_segments for segment in segments)
+
+    @staticmethod
+    def _record_speed(key: str, duration: float, elapsed: float):
+        """Track audio throughput per model and engine; includes waiting for a model instance, as the user sees it"""
+        AUDIO_SECONDS_TOTAL.labels(key).inc(duration)
+        if duration > 0:
+            REALTIME_FACTOR.labels(key).observe(elapsed / duration)
+
+    def _progress_reporter(self, session_id: str, queue_id: str) -> ProgressReporter:
+        return ProgressReporter(
+            lambda fraction, eta: self._emit_progress(fraction, session_id, queue_id, eta),
+            Config.PROGRESS_INTERVAL
+        )
+
+    @staticmethod
+    def _verbose():
+        # None silences both Whisper's per-segment printing and its progress bar
+        return True if Config.WHISPER_VERBOSE else None
+
+    def _emit_segments(self, segments, chunk: int, chunks: int, session_id: str, queue_id: str):
+        """Emit the finished segments of one chunk via Socket.IO"""
+        try:
+            events.emit(
+                'transcription_segment',
+                {'queue_id': queue_id, 'chunk': chunk, 'chunks': chunks, 'segments': segments},
+                to=session_id
+            )
+        except Exception as e:
+            current_app.logger.error(f"Error emitting segments: {str(e)}")
+
+    def _emit_progress(self, progress: float, session_id: str, queue_id: str = None, eta: float = None):
+        """Emit transcription progress and the estimated seconds remaining via Socket.IO"""
         try:
-            socketio.emit(
+            events.emit(
                 'transcription_progress',
-                {'progress': progress * 100},
+                {'progress': progress * 100, 'eta': None if eta is None else round(eta), 'queue_id': queue_id},
                 to=session_id
             )
         except Exception as e:
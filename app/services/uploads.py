@@ -0,0 +1,329 @@
+import hashlib
+import os
+import struct
+import subprocess
+import tempfile
+import time
+import uuid
+import logging
+from typing import Any, Dict
+from urllib.parse import unquote, urlparse
+from app.core.config import Config
+from app.services.audio import SAMPLE_RATE
+from app.services.persistent_storage import persistent_storage
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 1024 * 1024
+
+class UploadError(Exception):
+    """Raised for invalid upload requests"""
+
+class UploadNotFound(UploadError):
+    """Raised when an upload session does not exist"""
+
+class ChunkIntegrityError(UploadError):
+    """Raised when a chunk does not match its declared checksum"""
+
+class UploadAlreadyFinalized(UploadError):
+    """Raised when another request has finalized, or is finalizing, an upload"""
+
+    def __init__(self, upload: Dict[str, Any]):
+        super().__init__(f"Upload {upload['upload_id']} is already {upload['status']}")
+        self.upload = upload
+
+def save_stream(stream, path: str, block_size: int = BLOCK_SIZE) -> str:
+    """Copy an upload stream to path, returning the SHA-256 computed on the way"""
+    digest = hashlib.sha256()
+    with open(path, 'wb') as f:
+        for block in iter(lambda: stream.read(block_size), b''):
+            digest.update(block)
+            f.write(block)
+    return digest.hexdigest()
+
+def hash_file(path: str, block_size: int = BLOCK_SIZE) -> str:
+    """SHA-256 of a file already on disk"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def resolve_import_path(location: str, import_root: str) -> str:
+    """Map a server-side path or file:// URL to a real path inside import_root"""
+    if not import_root:
+        raise UploadError("Server-side imports are disabled")
+    if location.startswith('file://'):
+        location = unquote(urlparse(location).path)
+    root = os.path.realpath(import_root)
+    path = os.path.realpath(os.path.join(root, location))
+    if os.path.commonpath([root, path]) != root:
+        raise UploadError(f"Path is outside the import directory: {location}")
+    if not os.path.isfile(path):
+        raise UploadError(f"File not found: {location}")
+    return path
+
+# Containers that may keep their index at the end of the file and so cannot
+# always be decoded from a non-seekable pipe
+SEEKABLE_CONTAINERS = {'mp4', 'mov', 'm4a'}
+
+class _Mp4Layout:
+    """Tells from the top-level boxes of an MP4-family stream whether it can be decoded from a pipe.
+
+    ``streamable`` stays None until known. It becomes True when the index
+    (moov) or the first movie fragment (moof) comes before the media data, as
+    in faststart and fragmented files, and False when the media data (mdat)
+    comes first, so the index is only reached after all the samples. Only box
+    headers are buffered, whatever the size of the boxes in between.
+    """
+
+    def __init__(self):
+        self.streamable = None
+        self._next = 0  # stream offset of the next box header
+        self._base = 0  # stream offset of _buffer[0]
+        self._buffer = b''
+
+    def feed(self, block: bytes):
+        if self.streamable is not None:
+            return
+        self._buffer += block
+        while self.streamable is None:
+            skip = self._next - self._base
+            if skip >= len(self._buffer):
+                # The next header has not arrived yet, nothing before it matters
+                self._base += len(self._buffer)
+                self._buffer = b''
+                return
+            self._buffer = self._buffer[skip:]
+            self._base = self._next
+            if len(self._buffer) < 8:
+                return
+            size, kind = struct.unpack('>I4s', self._buffer[:8])
+            if size == 1:
+                if len(self._buffer) < 16:
+                    return
+                (size,) = struct.unpack('>Q', self._buffer[8:16])
+            if kind in (b'moov', b'moof'):
+                self.streamable = True
+            elif kind == b'mdat' or size < 8:
+                # Media data first, or a box running to the end of the file or a corrupt one
+                self.streamable = False
+            else:
+                self._next += size
+
+class IngestError(Exception):
+    """Raised when an uploaded stream cannot be decoded to audio"""
+
+def _ffmpeg_to_pcm(ffmpeg: str, source: str, pcm_path: str, stdin=None, stderr=None) -> subprocess.Popen:
+    """Start ffmpeg decoding source to 16 kHz mono 16-bit PCM at pcm_path"""
+    cmd = [
+        ffmpeg, '-nostdin', '-loglevel', 'error', '-y',
+        '-i', source,
+        '-vn', '-ac', '1', '-ar', str(SAMPLE_RATE),
+        '-f', 's16le', '-acodec', 'pcm_s16le', pcm_path
+    ]
+    return subprocess.Popen(cmd, stdin=stdin, stdout=subprocess.DEVNULL, stderr=stderr)
+
+def ingest_stream(stream, pcm_path: str, filename: str, ffmpeg: str = 'ffmpeg',
+                  block_size: int = BLOCK_SIZE) -> str:
+    """Decode an upload stream to PCM while it arrives, returning the SHA-256 of the original bytes.
+
+    The request body is piped straight into ffmpeg, so the media container is
+    never written to disk. The one exception is an MP4-family file whose
+    index (moov) sits after the media data, which ffmpeg cannot decode without
+    seeking. Its first top-level boxes tell the layouts apart: until they do,
+    the bytes are also spooled to a temporary file. Faststart and fragmented
+    files then drop the spool and carry on through the pipe. Files with the
+    index at the end stop the pipe, are spooled in full, and are decoded from
+    the spool once the upload ends. The spool is removed as soon as decoding
+    ends.
+    """
+    digest = hashlib.sha256()
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    spool = layout = None
+    if extension in SEEKABLE_CONTAINERS:
+        layout = _Mp4Layout()
+        spool = tempfile.NamedTemporaryFile(dir=os.path.dirname(pcm_path), suffix=f'.{extension}', delete=False)
+
+    errors = tempfile.TemporaryFile()
+    process = _ffmpeg_to_pcm(ffmpeg, 'pipe:0', pcm_path, stdin=subprocess.PIPE, stderr=errors)
+    try:
+        pipe_open = True
+        for block in iter(lambda: stream.read(block_size), b''):
+            digest.update(block)
+            if spool:
+                spool.write(block)
+                layout.feed(block)
+                if layout.streamable:
+                    spool.close()
+                    os.remove(spool.name)
+                    spool = None
+                elif layout.streamable is False and pipe_open:
+                    logger.info(f"{filename} keeps its index after the media data, decoding it once spooled")
+                    pipe_open = False
+                    process.kill()
+            if pipe_open:
+                try:
+                    process.stdin.write(block)
+                except BrokenPipeError:
+                    # ffmpeg gave up (e.g. needs to seek); keep hashing and spooling
+                    pipe_open = False
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = process.wait()
+
+        if returncode != 0 and spool:
+            spool.close()
+            if layout.streamable is None:
+                logger.info(f"Pipe decode of {filename} failed, retrying from spooled file")
+            errors.seek(0)
+            errors.truncate()
+            returncode = _ffmpeg_to_pcm(ffmpeg, spool.name, pcm_path, stderr=errors).wait()
+
+        if returncode != 0:
+            errors.seek(0)
+            message = errors.read().decode(errors='replace').strip()
+            raise IngestError(f"Failed to decode audio: {message or f'ffmpeg exited with {returncode}'}")
+    except Exception:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        if os.path.exists(pcm_path):
+            os.remove(pcm_path)
+        raise
+    finally:
+        errors.close()
+        if spool:
+            spool.close()
+            os.remove(spool.name)
+    return digest.hexdigest()
+
+class ResumableUploads:
+    """Init / write chunk at offset / finalize protocol for large uploads.
+
+    The target file is preallocated at init and chunks are written with
+    positional writes, so they can arrive in any order and in parallel, and a
+    failed chunk is simply sent again. Session and chunk bookkeeping lives in
+    persistent storage, so uploads can resume after a server restart.
+    Finalization is claimed in storage first, so of several concurrent
+    finalize calls exactly one hashes, moves and queues the file. The session
+    is kept until the TTL, so later calls learn the queue ID it was given.
+    """
+
+    def __init__(self, storage, max_size: int, chunk_size: int, ttl: float = 24 * 3600):
+        self.storage = storage
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.ttl = ttl
+
+    def create(self, path: str, filename: str, size: int, options: Dict[str, Any]) -> Dict[str, Any]:
+        """Start an upload session and preallocate its file"""
+        if size <= 0 or size > self.max_size:
+            raise UploadError(f"File size must be between 1 and {self.max_size} bytes")
+
+        self.cleanup_stale()
+        upload = {
+            'upload_id': uuid.uuid4().hex,
+            'path': path + '.part',
+            'final_path': path,
+            'filename': filename,
+            'size': size,
+            'chunk_size': self.chunk_size,
+            'options': options
+        }
+        with open(upload['path'], 'wb') as f:
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(f.fileno(), 0, size)
+            else:
+                f.truncate(size)
+        self.storage.create_upload(upload['upload_id'], upload)
+        return upload
+
+    def get(self, upload_id: str) -> Dict[str, Any]:
+        upload = self.storage.get_upload(upload_id)
+        if upload is None:
+            raise UploadNotFound(f"Unknown upload: {upload_id}")
+        return upload
+
+    def status(self, upload_id: str) -> Dict[str, Any]:
+        """Which chunks have been received and which are still missing"""
+        upload = self.get(upload_id)
+        received = self.storage.get_upload_chunks(upload_id)
+        missing = [offset for offset in range(0, upload['size'], upload['chunk_size']) if offset not in received]
+        return {
+            'upload_id': upload_id,
+            'status': upload['status'],
+            'size': upload['size'],
+            'chunk_size': upload['chunk_size'],
+            'received_bytes': sum(received.values()),
+            'missing_offsets': missing
+        }
+
+    def write_chunk(self, upload_id: str, offset: int, data: bytes, checksum: str = None):
+        """Verify a chunk and write it in place"""
+        upload = self.get(upload_id)
+        chunk_size, size = upload['chunk_size'], upload['size']
+        if offset < 0 or offset % chunk_size or offset >= size:
+            raise UploadError(f"Invalid chunk offset: {offset}")
+        if len(data) != min(chunk_size, size - offset):
+            raise UploadError(f"Chunk at offset {offset} must be {min(chunk_size, size - offset)} bytes")
+        if checksum and hashlib.sha256(data).hexdigest() != checksum.lower():
+            raise ChunkIntegrityError(f"Checksum mismatch for chunk at offset {offset}")
+        if upload['status'] != 'open':
+            raise UploadAlreadyFinalized(upload)
+
+        fd = os.open(upload['path'], os.O_WRONLY)
+        try:
+            view = memoryview(data)
+            written = 0
+            while written < len(view):
+                written += os.pwrite(fd, view[written:], offset + written)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self.storage.record_upload_chunk(upload_id, offset, len(data))
+
+    def finalize(self, upload_id: str):
+        """Check the upload is complete and move it into place, returning (upload, content hash).
+
+        Raises UploadAlreadyFinalized for every caller but the one that claimed it.
+        """
+        upload = self.get(upload_id)
+        if upload['status'] != 'open':
+            raise UploadAlreadyFinalized(upload)
+        missing = self.status(upload_id)['missing_offsets']
+        if missing:
+            raise UploadError(f"Upload incomplete, {len(missing)} chunks missing")
+
+        previous = self.storage.claim_upload(upload_id)
+        if previous is None:
+            raise UploadNotFound(f"Unknown upload: {upload_id}")
+        if previous != 'open':
+            raise UploadAlreadyFinalized(self.get(upload_id))
+        try:
+            content_hash = hash_file(upload['path'])
+            os.replace(upload['path'], upload['final_path'])
+        except Exception:
+            self.storage.set_upload_status(upload_id, 'open')
+            raise
+        self.storage.set_upload_status(upload_id, 'finalized')
+        upload['status'] = 'finalized'
+        return upload, content_hash
+
+    def cleanup_stale(self):
+        """Drop sessions older than the TTL along with their partial files"""
+        for upload in self.storage.get_stale_uploads(time.time() - self.ttl):
+            logger.info(f"Removing stale upload {upload['upload_id']}")
+            if os.path.exists(upload['path']):
+                os.remove(upload['path'])
+            self.storage.delete_upload(upload['upload_id'])
+
+# Create a global instance
+resumable_uploads = ResumableUploads(
+    persistent_storage,
+    Config.MAX_UPLOAD_SIZE,
+    Config.UPLOAD_CHUNK_SIZE,
+    Config.UPLOAD_SESSION_TTL
+)
@@ -0,0 +1,56 @@
+"""Standalone transcription worker: ``python -m app.worker``.
+
+Runs the queue workers and Whisper models in their own process, pulling from
+the shared QUEUE_BROKER, so inference does not compete with web request
+threads and loaded models survive web process restarts. Progress and results
+reach clients through SOCKETIO_MESSAGE_QUEUE when it is set, and otherwise
+through the job database, relayed by the web processes (sqlite broker only).
+"""
+import os
+import signal
+import sys
+import threading
+from flask import Flask
+from app import socketio, setup_logging
+from app.core.config import Config
+
+def create_worker_app(config_class=Config) -> Flask:
+    app = Flask('app')
+    app.config.from_object(config_class)
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    setup_logging(app, config_class)
+
+    if config_class.QUEUE_BROKER == 'local':
+        raise RuntimeError("A standalone worker needs a shared QUEUE_BROKER (sqlite or redis)")
+    if config_class.SOCKETIO_MESSAGE_QUEUE:
+        # Write-only: emits are published for the web processes to deliver
+        socketio.init_app(app, message_queue=config_class.SOCKETIO_MESSAGE_QUEUE)
+    elif config_class.QUEUE_BROKER == 'sqlite':
+        from app.services import events
+        from app.services.persistent_storage import persistent_storage
+        events.use_emitter(events.StorageEmitter(persistent_storage))
+    else:
+        raise RuntimeError("QUEUE_BROKER=redis needs SOCKETIO_MESSAGE_QUEUE to report progress")
+    return app
+
+def main():
+    app = create_worker_app()
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+
+    with app.app_context():
+        from app.services.queue_manager import queue_manager
+        queue_manager.run_workers = True
+        # No web requests to keep cores for in this process
+        queue_manager.reserved_cores = 0
+        queue_manager.start()
+        app.logger.info(f"Worker {queue_manager.worker_id} started with {queue_manager.num_workers} threads")
+        stopping.wait()
+        # Lets in-flight jobs finish before exiting
+        app.logger.info("Worker stopping")
+        queue_manager.stop()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,6 @@
+"""Offline benchmarks for the transcription pipeline and web tier.
+
+Whisper is replaced by the stub package in ``benchmarks/stubs`` and inputs
+are synthetic recordings, so runs need neither model weights, ffmpeg nor a
+network, and results are comparable across machines and revisions.
+"""
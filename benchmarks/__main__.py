@@ -0,0 +1,143 @@
+"""Run the benchmarks: ``python -m benchmarks [suite ...] [--scale full] [--output results.json]``.
+
+Compare two result files with ``python -m benchmarks compare baseline.json
+current.json``; it exits non-zero when a median latency or throughput figure got
+worse by more than ``--threshold``.
+
+``python -m benchmarks engines --fixtures DIR`` compares the real inference
+engines for word error rate and realtime factor on recordings with reference
+transcripts.
+"""
+import argparse
+import importlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from benchmarks.fixtures import prepare_environment
+from benchmarks.harness import compare, environment, write_results
+
+SUITES = ('transcription', 'audio', 'scheduling', 'storage', 'web')
+
+SCALES = {
+    'quick': {
+        'models': ['tiny', 'base'],
+        'durations': [30, 300],
+        'repeat': 3,
+        'queue_sizes': [100, 1000],
+        'queue_manager_max': 500,
+        'history_sizes': [0, 1000, 5000],
+        'storage_queue_depth': 100,
+        'storage_repeat': 200,
+        'concurrency': [1, 8],
+        'uploads_per_client': 10,
+        'upload_seconds': 5,
+        'fan_out': [1, 10, 50],
+        'emits': 100,
+    },
+    'full': {
+        'models': ['tiny', 'base', 'small', 'medium'],
+        'durations': [30, 300, 1200],
+        'repeat': 5,
+        'queue_sizes': [100, 1000, 10000, 50000],
+        'queue_manager_max': 2000,
+        'history_sizes': [0, 1000, 10000, 50000],
+        'storage_queue_depth': 1000,
+        'storage_repeat': 1000,
+        'concurrency': [1, 8, 32],
+        'uploads_per_client': 20,
+        'upload_seconds': 30,
+        'fan_out': [1, 10, 100, 500],
+        'emits': 200,
+    },
+}
+
+def _run(args) -> int:
+    # prepare_environment changes into the scratch directory
+    output = os.path.abspath(args.output)
+    workdir = tempfile.mkdtemp(prefix='transcription-bench-')
+    prepare_environment(workdir, args.stub_rtf)
+    params = SCALES[args.scale]
+    results = {
+        'environment': environment(),
+        'scale': args.scale,
+        'params': params,
+        'stub_rtf': args.stub_rtf,
+        'suites': {},
+    }
+    try:
+        for name in args.suites or SUITES:
+            print(f"Running {name} benchmarks...", file=sys.stderr)
+            start = time.perf_counter()
+            results['suites'][name] = importlib.import_module(f"benchmarks.{name}").run(params, workdir)
+            print(f"  done in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    write_results(output, results)
+    print(f"Results written to {output}", file=sys.stderr)
+    return 0
+
+def _compare(args) -> int:
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    regressions = compare(baseline, current, args.threshold)
+    for item in regressions:
+        print(f"{item['metric']}: {item['baseline']:.4g} -> {item['current']:.4g} ({item['change']:+.0%})")
+    print(f"{len(regressions)} regressions beyond {args.threshold:.0%}", file=sys.stderr)
+    return 1 if regressions else 0
+
+def _engines(args) -> int:
+    from benchmarks import engines
+
+    output = os.path.abspath(args.output)
+    results = {
+        'environment': environment(),
+        'params': {'models': args.models, 'engines': args.engines, 'language': args.language, 'repeat': args.repeat},
+        'suites': {'engines': engines.run(args.fixtures, args.models, args.engines, args.language, args.repeat)},
+    }
+    write_results(output, results)
+    print(f"Results written to {output}", file=sys.stderr)
+    return 0
+
+def _names(value: str):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['compare']:
+        parser = argparse.ArgumentParser(prog='python -m benchmarks compare')
+        parser.add_argument('baseline')
+        parser.add_argument('current')
+        parser.add_argument('--threshold', type=float, default=0.1, help='allowed slowdown as a fraction')
+        return _compare(parser.parse_args(argv[1:]))
+    if argv[:1] == ['engines']:
+        parser = argparse.ArgumentParser(prog='python -m benchmarks engines')
+        parser.add_argument('--fixtures', required=True, help='directory of audio files with same-named .txt transcripts')
+        parser.add_argument('--models', type=_names, default=['base'], help='comma-separated model names')
+        parser.add_argument('--engines', type=_names, default=['whisper', 'whisper-int8', 'faster-whisper'],
+                            help='comma-separated engine names')
+        parser.add_argument('--language', default='en')
+        parser.add_argument('--repeat', type=int, default=1)
+        parser.add_argument('--output', default='engine-results.json')
+        return _engines(parser.parse_args(argv[1:]))
+
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('suites', nargs='*', metavar='suite', help=f"any of {', '.join(SUITES)} (default: all)")
+    parser.add_argument('--scale', choices=sorted(SCALES), default='quick')
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--stub-rtf', type=float, default=0.0,
+                        help='simulated inference seconds per audio second for the tiny model')
+    parser.add_argument('--keep', action='store_true', help='keep the scratch directory')
+    args = parser.parse_args(argv)
+    unknown = set(args.suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suite: {', '.join(sorted(unknown))}")
+    return _run(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
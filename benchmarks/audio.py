@@ -0,0 +1,59 @@
+"""Audio loading latency and peak memory, with and without the audio cache and silence compression"""
+import os
+import shutil
+import time
+import tracemalloc
+from typing import Any, Callable, Dict
+from benchmarks.fixtures import pcm_fixture
+from benchmarks.harness import summarize
+
+def _peak_mb(func: Callable[[], Any]) -> float:
+    """Peak memory allocated by one call, numpy arrays included; mapped files are not counted"""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+def _case(load: Callable[[], Any], compress: Callable[[Any], Any], repeat: int,
+          reset: Callable[[], None] = None) -> Dict[str, Any]:
+    samples = []
+    for _ in range(repeat):
+        if reset:
+            reset()
+        start = time.perf_counter()
+        compress(load())
+        samples.append(time.perf_counter() - start)
+    if reset:
+        reset()
+    return {'latency': summarize(samples), 'peak_mb': _peak_mb(lambda: compress(load()))}
+
+def run(params: Dict[str, Any], workdir: str) -> Dict[str, Any]:
+    from app.core.config import Config
+    from app.services.audio import AudioCache, compress_silence, load_audio
+
+    def vad(audio):
+        return compress_silence(audio, Config.VAD_MIN_SILENCE, Config.VAD_KEEP_SILENCE, Config.VAD_THRESHOLD_DB)
+
+    steps = {'plain': lambda audio: audio, 'vad': vad}
+    results = {}
+    for seconds in params['durations']:
+        pcm = pcm_fixture(workdir, seconds)
+        # The stub whisper.load_audio reads .s16le as raw PCM, standing in for an ffmpeg decode
+        media = os.path.join(workdir, f"audio_{seconds}s.s16le")
+        shutil.copyfile(pcm, media)
+        duration = {}
+        for step, compress in steps.items():
+            cases = {'pcm': _case(lambda: load_audio(pcm), compress, params['repeat'])}
+            for dtype in ('float32', 'float16'):
+                cache_dir = os.path.join(workdir, f"audio-cache-{dtype}")
+                cache = AudioCache(cache_dir, 10 * 2 ** 30, dtype)
+                load = lambda: cache.load(media, 'bench')
+                cases[f"cache_miss_{dtype}"] = _case(load, compress, params['repeat'], reset=lambda: cache.discard('bench'))
+                load()
+                cases[f"cache_hit_{dtype}"] = _case(load, compress, params['repeat'])
+                shutil.rmtree(cache_dir, ignore_errors=True)
+            duration[step] = cases
+        results[f"{seconds}s"] = duration
+    return results
@@ -0,0 +1,106 @@
+"""Accuracy and speed of the inference engines on local recordings.
+
+Unlike the other suites this runs the real models, so it needs the engines'
+packages and model weights. Every audio file in the fixture directory with a
+reference transcript next to it (``name.wav`` and ``name.txt``) is transcribed
+by each engine and model. The results give word error rate against the
+reference and realtime factor, so a deployment can pick its tradeoff.
+"""
+import os
+import re
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+import numpy as np
+
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.m4a', '.flac', '.ogg', '.mp4', '.mkv', '.mov', '.avi', '.pcm')
+
+def normalize(text: str) -> List[str]:
+    """Lowercase words without punctuation, so WER counts recognition errors rather than formatting"""
+    return re.sub(r"[^\w\s']", ' ', text.lower()).split()
+
+def word_error_rate(reference: List[str], hypothesis: List[str]) -> Tuple[int, int]:
+    """(substitutions + deletions + insertions, reference words) by word-level edit distance"""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, 1):
+        current = [i] + [0] * len(hypothesis)
+        for j, hyp_word in enumerate(hypothesis, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word))
+        previous = current
+    return previous[-1], len(reference)
+
+def load_fixtures(directory: str) -> List[Dict[str, Any]]:
+    """Audio files in directory that have a reference transcript, decoded to 16 kHz mono"""
+    import whisper
+
+    fixtures = []
+    for name in sorted(os.listdir(directory)):
+        stem, extension = os.path.splitext(name)
+        reference_path = os.path.join(directory, stem + '.txt')
+        if extension.lower() not in AUDIO_EXTENSIONS or not os.path.exists(reference_path):
+            continue
+        path = os.path.join(directory, name)
+        if extension.lower() == '.pcm':
+            audio = np.fromfile(path, dtype='<i2').astype(np.float32) / 32768.0
+        else:
+            audio = whisper.load_audio(path)
+        with open(reference_path) as f:
+            reference = f.read()
+        fixtures.append({'name': name, 'audio': audio, 'seconds': len(audio) / whisper.audio.SAMPLE_RATE,
+                         'reference': normalize(reference)})
+    return fixtures
+
+def _measure(engine, model_name: str, fixtures: List[Dict[str, Any]], language: str, repeat: int) -> Dict[str, Any]:
+    start = time.perf_counter()
+    model = engine.load(model_name)
+    results = {'load_seconds': time.perf_counter() - start, 'fixtures': {}}
+    errors = words = 0
+    elapsed_total = audio_total = 0.0
+    for fixture in fixtures:
+        elapsed = 0.0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = model.transcribe(fixture['audio'], verbose=None, language=language, task='transcribe')
+            elapsed += time.perf_counter() - start
+        fixture_errors, fixture_words = word_error_rate(fixture['reference'], normalize(result['text']))
+        errors += fixture_errors
+        words += fixture_words
+        elapsed_total += elapsed
+        audio_total += fixture['seconds'] * repeat
+        results['fixtures'][fixture['name']] = {
+            'wer': fixture_errors / fixture_words if fixture_words else 0.0,
+            'realtime_factor': elapsed / (fixture['seconds'] * repeat) if fixture['seconds'] else 0.0,
+        }
+    results.update({
+        'audio_seconds': audio_total,
+        # Pooled over all fixtures, so long recordings weigh more than short ones
+        'wer': errors / words if words else 0.0,
+        'realtime_factor': elapsed_total / audio_total if audio_total else 0.0,
+    })
+    return results
+
+def run(fixtures_dir: str, models: List[str], engines: List[str], language: str = 'en',
+        repeat: int = 1) -> Dict[str, Any]:
+    from app.services.engines import get_engine
+
+    fixtures = load_fixtures(fixtures_dir)
+    if not fixtures:
+        raise ValueError(f"No audio files with a matching .txt transcript in {fixtures_dir}")
+    print(f"{len(fixtures)} fixtures, {sum(f['seconds'] for f in fixtures):.0f}s of audio", file=sys.stderr)
+
+    results = {}
+    for engine_name in engines:
+        engine = get_engine(engine_name)
+        results[engine_name] = {}
+        for model_name in models:
+            try:
+                measured = _measure(engine, model_name, fixtures, language, repeat)
+            except Exception as e:
+                # A missing optional package should not lose the other engines' results
+                print(f"  {engine_name} {model_name}: failed: {e}", file=sys.stderr)
+                results[engine_name][model_name] = {'error': str(e)}
+                continue
+            print(f"  {engine_name} {model_name}: WER {measured['wer']:.1%}, "
+                  f"RTF {measured['realtime_factor']:.3f}, load {measured['load_seconds']:.1f}s", file=sys.stderr)
+            results[engine_name][model_name] = measured
+    return results
@@ -0,0 +1,98 @@
+import os
+import sys
+import numpy as np
+
+SAMPLE_RATE = 16000
+STUBS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stubs')
+
+def prepare_environment(workdir: str, stub_rtf: float = 0.0):
+    """Point the service at a scratch directory and the stub Whisper package.
+
+    Must run before anything under ``app`` is imported: Config reads the
+    environment, and the storage and queue singletons are created, at import.
+    """
+    for name in ('storage', 'logs', 'uploads'):
+        os.makedirs(os.path.join(workdir, name), exist_ok=True)
+    os.chdir(workdir)
+    os.environ.update({
+        'STORAGE_DIR': os.path.join(workdir, 'storage'),
+        'LOG_DIR': os.path.join(workdir, 'logs'),
+        # Keeps per-request log lines out of the timings and the console
+        'LOG_LEVEL': 'WARNING',
+        'STORAGE_COMPACTION_INTERVAL': '0',
+        'MODEL_WARMUP': '',
+        'QUEUE_BROKER': 'local',
+        'SOCKETIO_MESSAGE_QUEUE': '',
+        # Benchmarks drive the services directly; workers would race them for tasks
+        'RUN_WORKERS': 'False',
+        'DELETE_UPLOADS_AFTER_PROCESSING': 'False',
+        # Every update is emitted, so progress handling is part of what is measured
+        'PROGRESS_INTERVAL': '0',
+    })
+    sys.path.insert(0, STUBS_DIR)
+    import whisper
+    whisper.STUB_RTF = stub_rtf
+
+def synthetic_speech(seconds: float, silence_ratio: float = 0.3, seed: int = 0) -> np.ndarray:
+    """Float32 audio alternating voiced bursts and pauses.
+
+    Bursts are amplitude-modulated harmonic tones with a little noise, so
+    frame energy looks like speech to the silence detection used for
+    chunking; roughly ``silence_ratio`` of the duration is near-silent.
+    """
+    rng = np.random.default_rng(seed)
+    total = int(seconds * SAMPLE_RATE)
+    audio = np.zeros(total, dtype=np.float32)
+    position = 0
+    while position < total:
+        burst = int(rng.uniform(1.0, 6.0) * SAMPLE_RATE)
+        pause = int(burst * silence_ratio / max(1e-6, 1 - silence_ratio) * rng.uniform(0.5, 1.5))
+        end = min(total, position + burst)
+        t = np.arange(end - position) / SAMPLE_RATE
+        pitch = rng.uniform(90, 220)
+        voiced = sum(np.sin(2 * np.pi * pitch * k * t) / k for k in (1, 2, 3))
+        envelope = 0.5 * (1 - np.cos(2 * np.pi * np.minimum(t * 4, 1) / 2)) * (0.6 + 0.4 * np.sin(2 * np.pi * 3 * t))
+        audio[position:end] = 0.2 * voiced * envelope + rng.normal(0, 0.01, end - position)
+        position = end
+        pause_end = min(total, position + pause)
+        audio[position:pause_end] = rng.normal(0, 0.001, pause_end - position)
+        position = pause_end
+    return audio
+
+def write_pcm(path: str, audio: np.ndarray) -> str:
+    """Store audio the way streaming uploads are stored: raw 16 kHz mono s16le"""
+    np.clip(audio * 32768.0, -32768, 32767).astype('<i2').tofile(path)
+    return path
+
+def pcm_fixture(directory: str, seconds: float, silence_ratio: float = 0.3, seed: int = 0) -> str:
+    """Path of a cached synthetic recording, created on first use"""
+    path = os.path.join(directory, f"speech_{int(seconds)}s_{int(silence_ratio * 100)}_{seed}.pcm")
+    if not os.path.exists(path):
+        write_pcm(path, synthetic_speech(seconds, silence_ratio, seed))
+    return path
+
+def pcm_bytes(seconds: float, seed: int = 0) -> bytes:
+    """Small synthetic recording as bytes, for upload benchmarks"""
+    return np.clip(synthetic_speech(seconds, seed=seed) * 32768.0, -32768, 32767).astype('<i2').tobytes()
+
+class CountingEmitter:
+    """Event transport that only counts, so benchmarks need no Socket.IO clients"""
+
+    def __init__(self):
+        self.counts = {}
+
+    def emit(self, event: str, data, to: str = None):
+        self.counts[event] = self.counts.get(event, 0) + 1
+
+    def reset(self):
+        self.counts = {}
+
+_app = None
+
+def get_app():
+    """The Flask app, created once per benchmark run after prepare_environment"""
+    global _app
+    if _app is None:
+        from app import create_app
+        _app = create_app()
+    return _app
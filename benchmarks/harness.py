@@ -0,0 +1,89 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Latency statistics in milliseconds for a list of durations in seconds"""
+    ordered = sorted(samples)
+    if not ordered:
+        return {'count': 0}
+
+    def percentile(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {
+        'count': len(ordered),
+        'mean_ms': statistics.fmean(ordered) * 1000,
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'max_ms': ordered[-1] * 1000,
+    }
+
+def measure(func: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """Call func repeat times and summarize the latency of each call"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+def throughput(count: int, elapsed: float) -> Dict[str, float]:
+    return {'count': count, 'seconds': elapsed, 'per_second': count / elapsed if elapsed > 0 else float('inf')}
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            capture_output=True, text=True, timeout=5, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return 'unknown'
+
+def environment() -> Dict[str, Any]:
+    """Where and on what the results were produced, to tell real regressions from machine changes"""
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+def write_results(path: str, results: Dict[str, Any]):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+def _flatten(value: Any, prefix: str = '') -> Dict[str, float]:
+    if isinstance(value, dict):
+        flat = {}
+        for key, item in value.items():
+            flat.update(_flatten(item, f"{prefix}.{key}" if prefix else str(key)))
+        return flat
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: value}
+    return {}
+
+# Tail percentiles of microsecond operations are too noisy to gate on
+LOWER_IS_BETTER = ('p50_ms', 'mean_ms', 'realtime_factor', 'wer')
+HIGHER_IS_BETTER = ('per_second',)
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.1) -> List[Dict[str, Any]]:
+    """Median latency, throughput and error rate figures that got worse by more than threshold (a fraction)"""
+    old, new = _flatten(baseline.get('suites', {})), _flatten(current.get('suites', {}))
+    regressions = []
+    for key in sorted(old.keys() & new.keys()):
+        lower_is_better = key.endswith(LOWER_IS_BETTER)
+        if not (lower_is_better or key.endswith(HIGHER_IS_BETTER)) or not old[key]:
+            continue
+        change = (new[key] - old[key]) / old[key]
+        if (change if lower_is_better else -change) > threshold:
+            regressions.append({'metric': key, 'baseline': old[key], 'current': new[key], 'change': change})
+    return regressions
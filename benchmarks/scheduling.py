@@ -0,0 +1,94 @@
+"""Scheduler and QueueManager overhead as the number of queued tasks grows"""
+import random
+import time
+import uuid
+from typing import Any, Dict, List
+from benchmarks.fixtures import CountingEmitter, get_app, pcm_fixture
+from benchmarks.harness import measure, summarize, throughput
+
+MODELS = ('tiny', 'base', 'small')
+
+def _tasks(count: int, sessions: int, rng: random.Random) -> List[Dict[str, Any]]:
+    return [{
+        'queue_id': f"task-{i}",
+        'session_id': f"session-{rng.randrange(sessions)}",
+        'model_name': rng.choice(MODELS),
+        'duration': rng.choice((30, 90, 600, 2400)),
+        'enqueued_at': time.time(),
+    } for i in range(count)]
+
+def _scheduler(mode: str, size: int, sessions: int, seed: int) -> Dict[str, Any]:
+    from app.services.scheduler import TaskScheduler
+
+    rng = random.Random(seed)
+    tasks = _tasks(size, sessions, rng)
+    scheduler = TaskScheduler(mode=mode)
+
+    start = time.perf_counter()
+    for task in tasks:
+        scheduler.put(task)
+    put = throughput(size, time.perf_counter() - start)
+
+    probes = [rng.choice(tasks)['queue_id'] for _ in range(1000)]
+    position = measure(lambda: scheduler.position(probes.pop()), len(probes))
+    one_session = measure(lambda: scheduler.positions([f"session-{rng.randrange(sessions)}"]), 200)
+    all_sessions = measure(lambda: scheduler.positions(), 5)
+
+    # Cancel a tenth of the queue, then drain it as workers would
+    cancelled = rng.sample(tasks, size // 10)
+    start = time.perf_counter()
+    for task in cancelled:
+        scheduler.remove(task['queue_id'])
+    remove = throughput(len(cancelled), time.perf_counter() - start)
+
+    warm = {'base'}
+    start = time.perf_counter()
+    while not scheduler.empty():
+        scheduler.get_nowait() if mode != 'affinity' else scheduler.get(timeout=0, warm_models=warm)
+    get = throughput(size - len(cancelled), time.perf_counter() - start)
+
+    return {
+        'put': put,
+        'get': get,
+        'remove': remove,
+        'position': position,
+        'positions_one_session': one_session,
+        'positions_all_sessions': all_sessions,
+    }
+
+def _queue_manager(size: int, sessions: int, workdir: str, seed: int) -> Dict[str, Any]:
+    from app.services import events
+    from app.services.queue_manager import queue_manager
+
+    rng = random.Random(seed)
+    emitter = CountingEmitter()
+    events.use_emitter(emitter)
+    path = pcm_fixture(workdir, 60)
+    samples = []
+    with get_app().app_context():
+        queue_manager.clear_queue()
+        for _ in range(size):
+            start = time.perf_counter()
+            queue_manager.add_task(path, f"session-{rng.randrange(sessions)}", rng.choice(MODELS), str(uuid.uuid4()))
+            samples.append(time.perf_counter() - start)
+        stats = measure(queue_manager.get_stats, 20)
+        start = time.perf_counter()
+        queue_manager.clear_queue()
+        clear = time.perf_counter() - start
+    # Latency of the last tenth shows the cost at full depth
+    return {
+        'add_task': summarize(samples),
+        'add_task_at_depth': summarize(samples[-max(1, size // 10):]),
+        'get_stats': stats,
+        'clear_queue_seconds': clear,
+    }
+
+def run(params: Dict[str, Any], workdir: str) -> Dict[str, Any]:
+    results = {}
+    for size in params['queue_sizes']:
+        sessions = max(1, size // 10)
+        results[str(size)] = {
+            'scheduler': {mode: _scheduler(mode, size, sessions, seed=size) for mode in ('fifo', 'affinity', 'fair')},
+            'queue_manager': _queue_manager(min(size, params['queue_manager_max']), sessions, workdir, seed=size),
+        }
+    return results
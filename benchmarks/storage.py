@@ -0,0 +1,47 @@
+"""PersistentStorage operation latency as the stored history grows"""
+import os
+import random
+import time
+from typing import Any, Dict
+from benchmarks.harness import measure, throughput
+
+def run(params: Dict[str, Any], workdir: str) -> Dict[str, Any]:
+    from app.services.persistent_storage import PersistentStorage
+
+    storage = PersistentStorage(os.path.join(workdir, 'storage-bench'), compaction_interval=0)
+    rng = random.Random(0)
+    transcript = ' '.join(['lorem ipsum dolor sit amet'] * 200)  # about 5 KB, a few minutes of speech
+    queue_depth = params['storage_queue_depth']
+    for i in range(queue_depth):
+        storage.add_to_queue({'queue_id': f"queued-{i}", 'session_id': f"session-{i % 10}", 'model_name': 'base'})
+
+    results = {}
+    stored = 0
+    counter = iter(range(10 ** 9))
+    for history in params['history_sizes']:
+        added = max(0, history - stored)
+        start = time.perf_counter()
+        while stored < history:
+            storage.save_result(f"history-{stored}", transcript)
+            storage.cache_result(f"key-{stored}", transcript)
+            stored += 1
+        fill = throughput(added, time.perf_counter() - start)
+
+        def queue_round_trip():
+            queue_id = f"bench-{next(counter)}"
+            storage.add_to_queue({'queue_id': queue_id, 'session_id': 'bench', 'model_name': 'base'})
+            storage.remove_from_queue(queue_id)
+
+        repeat = params['storage_repeat']
+        results[str(history)] = {
+            'fill': fill,
+            'save_result': measure(lambda: storage.save_result(f"bench-result-{next(counter)}", transcript), repeat),
+            'get_result': measure(lambda: storage.get_result(f"history-{rng.randrange(max(1, stored))}"), repeat),
+            'get_cached_result': measure(lambda: storage.get_cached_result(f"key-{rng.randrange(max(1, stored))}"), repeat),
+            'queue_round_trip': measure(queue_round_trip, repeat),
+            'get_queue_position': measure(
+                lambda: storage.get_queue_position(f"queued-{rng.randrange(queue_depth)}"), repeat),
+            'get_queue_size': measure(storage.get_queue_size, repeat),
+            'database_bytes': os.path.getsize(storage.db_file),
+        }
+    return results
@@ -0,0 +1,44 @@
+"""Offline stand-in for the openai-whisper package, used by the benchmarks.
+
+Exposes the parts of the whisper API the service touches. Models decode in
+30 second windows like the real ones, driving ``whisper.transcribe.tqdm`` and
+an ``all_segments`` list so progress reporting is exercised too. Inference
+cost is simulated by sleeping ``STUB_RTF * MODEL_COST[name]`` seconds per
+second of audio; the default of 0 measures pipeline overhead only.
+"""
+import numpy as np
+from whisper import audio, tokenizer
+from whisper.transcribe import transcribe as _transcribe
+
+STUB_RTF = 0.0
+
+# Relative decoding cost, roughly following the real model sizes
+MODEL_COST = {
+    'tiny': 1, 'tiny.en': 1, 'base': 1.5, 'base.en': 1.5, 'small': 3, 'small.en': 3,
+    'medium': 6, 'medium.en': 6, 'turbo': 4,
+}
+
+class StubModel:
+    def __init__(self, name: str):
+        self.name = name
+
+    @property
+    def seconds_per_audio_second(self) -> float:
+        return STUB_RTF * MODEL_COST.get(self.name, 12)
+
+    def transcribe(self, audio_array, **kwargs):
+        return _transcribe(self, audio_array, **kwargs)
+
+def load_model(name: str, **kwargs) -> StubModel:
+    return StubModel(name)
+
+def load_audio(path: str, sr: int = audio.SAMPLE_RATE) -> np.ndarray:
+    """Benchmarks mostly feed raw PCM, which never reaches ffmpeg.
+
+    ``.s16le`` files stand in for media ffmpeg would decode and are read as
+    raw PCM, converted the way whisper converts ffmpeg's output. Other files
+    read as 30s of silence.
+    """
+    if path.endswith('.s16le'):
+        return np.fromfile(path, dtype=np.int16).flatten().astype(np.float32) / 32768.0
+    return np.zeros(30 * sr, dtype=np.float32)
@@ -0,0 +1,4 @@
+SAMPLE_RATE = 16000
+HOP_LENGTH = 160
+N_FRAMES = 3000  # mel frames in one 30 second window
+N_SAMPLES = 480000  # samples in one 30 second window
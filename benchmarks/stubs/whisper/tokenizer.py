@@ -0,0 +1,4 @@
+LANGUAGES = {
+    'en': 'english', 'de': 'german', 'es': 'spanish', 'fr': 'french', 'it': 'italian',
+    'ja': 'japanese', 'nl': 'dutch', 'pt': 'portuguese', 'ru': 'russian', 'zh': 'chinese',
+}
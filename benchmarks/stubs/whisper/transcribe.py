@@ -0,0 +1,46 @@
+import time
+from whisper.audio import HOP_LENGTH, N_FRAMES, SAMPLE_RATE
+
+class _NullBar:
+    def __init__(self, total: int = None, **kwargs):
+        self.total = total
+        self.n = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def update(self, n: int = 1):
+        self.n += n
+
+class tqdm:
+    """Same shape as the ``tqdm`` module reference the real transcribe() uses"""
+    tqdm = _NullBar
+
+def transcribe(model, audio, verbose=None, language=None, task='transcribe', **kwargs):
+    frames = len(audio) // HOP_LENGTH
+    frames_per_second = SAMPLE_RATE / HOP_LENGTH
+    all_segments = []
+    with tqdm.tqdm(total=frames, unit='frames', disable=verbose is not False) as pbar:
+        seek = 0
+        while seek < frames:
+            step = min(N_FRAMES, frames - seek)
+            cost = step / frames_per_second * model.seconds_per_audio_second
+            if cost:
+                time.sleep(cost)
+            all_segments.append({
+                'id': len(all_segments),
+                'seek': seek,
+                'start': seek / frames_per_second,
+                'end': (seek + step) / frames_per_second,
+                'text': f" Segment {len(all_segments)}.",
+            })
+            seek += step
+            pbar.update(step)
+    return {
+        'text': ''.join(segment['text'] for segment in all_segments),
+        'segments': all_segments,
+        'language': language or 'en',
+    }
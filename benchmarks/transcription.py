@@ -0,0 +1,39 @@
+"""TranscriptionService.transcribe throughput per model and audio length"""
+import time
+from typing import Any, Dict
+from benchmarks.fixtures import CountingEmitter, get_app, pcm_fixture
+from benchmarks.harness import summarize
+
+def run(params: Dict[str, Any], workdir: str) -> Dict[str, Any]:
+    app = get_app()
+    from app.core.config import Config
+    from app.services import events
+    from app.services.transcription import TranscriptionService
+
+    emitter = CountingEmitter()
+    events.use_emitter(emitter)
+    results = {}
+    with app.app_context():
+        for model_name in params['models']:
+            service = TranscriptionService()
+            start = time.perf_counter()
+            service.model_cache.warm_up([model_name])
+            model_results = {'model_load_seconds': time.perf_counter() - start}
+            for seconds in params['durations']:
+                path = pcm_fixture(workdir, seconds)
+                samples = []
+                emitter.reset()
+                for i in range(params['repeat']):
+                    start = time.perf_counter()
+                    service.transcribe(path, 'bench-session', model_name, f"bench-{model_name}-{seconds}-{i}")
+                    samples.append(time.perf_counter() - start)
+                elapsed = sum(samples)
+                model_results[f"{seconds}s"] = {
+                    'chunked': Config.CHUNKED_TRANSCRIPTION and seconds >= Config.CHUNK_MIN_DURATION,
+                    'latency': summarize(samples),
+                    'audio_seconds_per_second': seconds * len(samples) / elapsed,
+                    'realtime_factor': elapsed / (seconds * len(samples)),
+                    'events_per_job': {event: count / len(samples) for event, count in emitter.counts.items()},
+                }
+            results[model_name] = model_results
+    return results
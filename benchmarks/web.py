@@ -0,0 +1,86 @@
+"""/upload latency and Socket.IO fan-out under concurrent clients.
+
+Requests go through the WSGI stack in-process and Socket.IO clients are
+Flask-SocketIO test clients, so these numbers are the server's own cost
+without network or proxy time.
+"""
+import io
+import threading
+import time
+import uuid
+from typing import Any, Dict
+from benchmarks.fixtures import get_app, pcm_bytes
+from benchmarks.harness import summarize, throughput
+
+def _uploads(app, clients: int, per_client: int, payload: bytes) -> Dict[str, Any]:
+    samples = []
+    failures = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(clients)
+
+    def client(index: int):
+        http = app.test_client()
+        barrier.wait()
+        for _ in range(per_client):
+            # Unique content per request, so no upload is answered from the result cache
+            body = payload + uuid.uuid4().bytes
+            start = time.perf_counter()
+            response = http.post('/upload', data={
+                'file': (io.BytesIO(body), 'bench.wav'),
+                'session_id': f"bench-{index}",
+                'queue_id': str(uuid.uuid4()),
+                'model': 'tiny',
+            })
+            elapsed = time.perf_counter() - start
+            with lock:
+                samples.append(elapsed)
+                if response.status_code != 200:
+                    failures.append(response.status_code)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        'latency': summarize(samples),
+        'requests': throughput(len(samples), time.perf_counter() - start),
+        'failures': len(failures),
+    }
+
+def _fan_out(app, clients: int, repeat: int) -> Dict[str, Any]:
+    from app import socketio
+    from app.services import events
+
+    room = 'bench-room'
+    sockets = [socketio.test_client(app) for _ in range(clients)]
+    for socket in sockets:
+        socket.emit('register_client', {'clientId': room})
+        socket.get_received()
+
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        events.emit('queue_update', {'position': i, 'status': 'queued', 'queue_id': 'bench'}, to=room)
+        samples.append(time.perf_counter() - start)
+    delivered = sum(len(socket.get_received()) for socket in sockets)
+    for socket in sockets:
+        socket.disconnect()
+    return {'emit': summarize(samples), 'delivered': delivered, 'expected': clients * repeat}
+
+def run(params: Dict[str, Any], workdir: str) -> Dict[str, Any]:
+    from app.services import events
+    from app.services.queue_manager import queue_manager
+
+    app = get_app()
+    events.use_emitter(events.SocketIOEmitter())
+    payload = pcm_bytes(params['upload_seconds'])
+    results = {'upload_bytes': len(payload), 'upload': {}, 'fan_out': {}}
+    for clients in params['concurrency']:
+        results['upload'][str(clients)] = _uploads(app, clients, params['uploads_per_client'], payload)
+        with app.app_context():
+            queue_manager.clear_queue()
+    for clients in params['fan_out']:
+        results['fan_out'][str(clients)] = _fan_out(app, clients, params['emits'])
+    return results
@@ -11,7 +11,10 @@ backlog = 2048
 
 # Worker processes
 worker_class = 'gthread'  # Using threaded worker instead of eventlet
-workers = 1  # Single worker for WebSocket support
+# Socket.IO needs sticky sessions, which gunicorn does not provide across workers.
+# Scale out with more instances behind a sticky load balancer plus a shared
+# QUEUE_BROKER and SOCKETIO_MESSAGE_QUEUE instead (see README "Scaling Out").
+workers = 1
 threads = 100  # Number of threads per worker
 max_requests = 1000
 max_requests_jitter = 50